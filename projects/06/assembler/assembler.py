@@ -1,124 +1,415 @@
 __author__ = "Yun-L"
 
-import sys
+import argparse
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 from parser import Parser
-from code import Code
-
-OPCODE_LENGTH = 16
-
-
-def to_binary(num):
-    num = int(num)
-    binary = ""
-
-    while num > 0:
-        binary = str(num % 2) + binary
-        num = num // 2
-
-    return binary
+from code import Encoder
+from optimizer import Optimizer
+import rom
+import sourcemap
+
+# Largest value an A_COMMAND can load, the top bit selects a C_COMMAND
+MAX_A_VALUE = 0x7FFF
+
+VARIABLE_BASE_ADDR = 16
+
+# Smallest number of source lines handed to a worker by assemble_parallel
+MIN_CHUNK_LINES = 4096
+
+# Predefined symbol values
+PREDEFINED_SYMBOLS = {
+    "SP": 0,
+    "LCL": 1,
+    "ARG": 2,
+    "THIS": 3,
+    "THAT": 4,
+    "R0": 0,
+    "R1": 1,
+    "R2": 2,
+    "R3": 3,
+    "R4": 4,
+    "R5": 5,
+    "R6": 6,
+    "R7": 7,
+    "R8": 8,
+    "R9": 9,
+    "R10": 10,
+    "R11": 11,
+    "R12": 12,
+    "R13": 13,
+    "R14": 14,
+    "R15": 15,
+    "SCREEN": 16384,
+    "KBD": 24576
+}
 
 
 def a_cmd_code(num):
-    binary_a = to_binary(num)
+    num = int(num)
 
-    if len(binary_a) >= OPCODE_LENGTH:
+    if num > MAX_A_VALUE:
         raise Exception(
             "[{}] is too large to load to A".format(num))
 
-    return "0"*(OPCODE_LENGTH-len(binary_a)) + binary_a
+    return num
 
 
-if __name__ == "__main__":
+def assemble_two_pass(file_location, encoder=None):
+    """
+    Returns the words for the program at file_location as array('H'). The
+    first pass collects all L_COMMAND labels, the second pass encodes.
+    """
+    if encoder is None:
+        encoder = Encoder()
 
-    file_location = sys.argv[1]
-    dest_file = sys.argv[2]
-
-    # Initialize symbol table and predefined symbol values
-    symbol_table = {
-        "SP": 0,
-        "LCL": 1,
-        "ARG": 2,
-        "THIS": 3,
-        "THAT": 4,
-        "R0": 0,
-        "R1": 1,
-        "R2": 2,
-        "R3": 3,
-        "R4": 4,
-        "R5": 5,
-        "R6": 6,
-        "R7": 7,
-        "R8": 8,
-        "R9": 9,
-        "R10": 10,
-        "R11": 11,
-        "R12": 12,
-        "R13": 13,
-        "R14": 14,
-        "R15": 15,
-        "SCREEN": 16384,
-        "KBD": 24576
-    }
+    symbol_table = dict(PREDEFINED_SYMBOLS)
 
     # Find all L_commands and add to symbol table
 
-    parse1 = Parser(file_location)
+    address_counter = 0
+
+    for command in Parser(file_location).commands():
 
-    address_counter = -1
+        if command.command_type == "L_COMMAND":
 
-    while parse1.has_more_commands:
-        parse1.advance()
+            if command.symbol in symbol_table:
 
-        if parse1.command_type == "A_COMMAND" \
-           or parse1.command_type == "C_COMMAND":
+                raise Exception("({}) symbol occurs more than once".format(
+                    command.symbol))
 
+            symbol_table[command.symbol] = address_counter
+        else:
             address_counter += 1
 
-        if parse1.command_type == "L_COMMAND":
+    # Translate all assembly to opcode
+
+    variable_addr_counter = VARIABLE_BASE_ADDR
+
+    words = array("H")
+
+    for command in Parser(file_location).commands():
+
+        if command.command_type == "A_COMMAND":
+            a_value = command.symbol
+
+            if len(a_value) < 1:
+                raise Exception("No value found for A_COMMAND")
+
+            if a_value.isnumeric():
+
+                words.append(a_cmd_code(a_value))
+            else:
 
-            if parse1.symbol in symbol_table:
+                if a_value not in symbol_table:
+                    symbol_table[a_value] = variable_addr_counter
 
+                    variable_addr_counter += 1
+
+                words.append(a_cmd_code(symbol_table[a_value]))
+
+        elif command.command_type == "C_COMMAND":
+            words.append(encoder.encode(command.text))
+
+    return words
+
+
+def assemble_one_pass(file_location, encoder=None, debug=None):
+    """
+    Returns the same words as assemble_two_pass while reading the source only
+    once. A_COMMANDs referring to a symbol that is not yet known are left
+    empty and backpatched when the label is defined. Symbols still unresolved
+    at the end of the file are variables, allocated in order of first use.
+    If debug (a sourcemap.DebugInfo) is given, the source line of every word
+    and the final labels and variables are recorded in it.
+    """
+    if encoder is None:
+        encoder = Encoder()
+
+    symbol_table = dict(PREDEFINED_SYMBOLS)
+
+    # symbol -> indices of the words waiting on it, in order of first use
+    fixups = {}
+
+    words = array("H")
+
+    for command in Parser(file_location).commands():
+
+        command_type = command.command_type
+
+        if command_type == "A_COMMAND":
+            a_value = command.symbol
+
+            if len(a_value) < 1:
+                raise Exception("No value found for A_COMMAND")
+
+            if a_value.isnumeric():
+                words.append(a_cmd_code(a_value))
+            elif a_value in symbol_table:
+                words.append(a_cmd_code(symbol_table[a_value]))
+            else:
+                fixups.setdefault(a_value, []).append(len(words))
+                words.append(0)
+
+        elif command_type == "C_COMMAND":
+            words.append(encoder.encode(command.text))
+
+        elif command_type == "L_COMMAND":
+            label = command.symbol
+
+            if label in symbol_table:
                 raise Exception("({}) symbol occurs more than once".format(
-                    parse1.symbol))
+                    label))
 
-            symbol_table[parse1.symbol] = address_counter + 1
+            symbol_table[label] = len(words)
 
-    # Translate all assembly to opcode
+            if debug is not None:
+                debug.labels[label] = len(words)
+
+            if label in fixups:
+                label_code = a_cmd_code(len(words))
 
-    parse2 = Parser(file_location)
+                for ind in fixups.pop(label):
+                    words[ind] = label_code
 
-    variable_addr_counter = 16
+            continue
 
-    with open(dest_file, "w") as outfile:
+        if debug is not None:
+            debug.word_lines.append(command.line_number)
 
-        while parse2.has_more_commands:
-            parse2.advance()
+    # Everything left over is a variable
+    variable_addr_counter = VARIABLE_BASE_ADDR
 
-            if parse2.command_type == "A_COMMAND":
-                a_value = parse2.symbol
+    for variable, indices in fixups.items():
+        variable_code = a_cmd_code(variable_addr_counter)
 
-                if len(a_value) < 1:
-                    raise Exception("No value found for A_COMMAND")
+        for ind in indices:
+            words[ind] = variable_code
 
-                if a_value.isnumeric():
+        symbol_table[variable] = variable_addr_counter
+        variable_addr_counter += 1
 
-                    outfile.write(a_cmd_code(a_value) + "\n")
-                else:
+    if debug is not None:
+        debug.variables.update(
+            (variable, symbol_table[variable]) for variable in fixups)
 
-                    if a_value not in symbol_table:
-                        symbol_table[a_value] = variable_addr_counter
+    return words
 
-                        variable_addr_counter += 1
 
-                    outfile.write(a_cmd_code(symbol_table[a_value]) + "\n")
+def assemble_chunk(lines, encoder=None):
+    """
+    Assembles a chunk of source lines without knowledge of the rest of the
+    program. Returns (words, labels, references): labels is a list of
+    (label, local address) and references a list of (local address, symbol)
+    for every A_COMMAND whose symbol could not be resolved locally, in order
+    of occurrence. Those words are left as 0.
+    """
+    if encoder is None:
+        encoder = Encoder()
 
-            elif parse2.command_type == "C_COMMAND":
-                dest = parse2.dest
-                comp = parse2.comp
-                jump = parse2.jump
+    words = array("H")
+    labels = []
+    references = []
 
-                c_code = Code(parse2.dest, parse2.jump, parse2.comp)
+    for command in Parser(lines).commands():
+
+        command_type = command.command_type
+
+        if command_type == "A_COMMAND":
+            a_value = command.symbol
+
+            if len(a_value) < 1:
+                raise Exception("No value found for A_COMMAND")
+
+            if a_value.isnumeric():
+                words.append(a_cmd_code(a_value))
+            elif a_value in PREDEFINED_SYMBOLS:
+                words.append(PREDEFINED_SYMBOLS[a_value])
+            else:
+                references.append((len(words), a_value))
+                words.append(0)
+
+        elif command_type == "C_COMMAND":
+            words.append(encoder.encode(command.text))
+
+        elif command_type == "L_COMMAND":
+            labels.append((command.symbol, len(words)))
+
+    return words, labels, references
+
+
+def assemble_parallel(source, jobs=None, chunk_lines=None):
+    """
+    Splits source into chunks of lines, assembles them in a process pool and
+    merges the results. Labels are resolved once every chunk's base address
+    is known, then variables are allocated walking the references in program
+    order, so the output is identical to the serial assemblers. jobs defaults
+    to the number of cores.
+    """
+    if isinstance(source, str):
+        if "\n" in source:
+            lines = source.splitlines()
+        else:
+            with open(source, "r") as infile:
+                lines = infile.readlines()
+    else:
+        lines = list(source)
+
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    elif jobs < 0:
+        raise Exception("[{}] jobs can't be negative".format(jobs))
+
+    if chunk_lines is None:
+        chunk_lines = max(MIN_CHUNK_LINES, -(-len(lines) // jobs))
+
+    chunks = [lines[i:i + chunk_lines]
+              for i in range(0, len(lines), chunk_lines)]
+
+    if jobs == 1 or len(chunks) <= 1:
+        results = [assemble_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+            results = list(pool.map(assemble_chunk, chunks))
+
+    # Concatenate the chunks and place their labels
+
+    symbol_table = dict(PREDEFINED_SYMBOLS)
+
+    words = array("H")
+    bases = []
+
+    for chunk_words, labels, _ in results:
+        base = len(words)
+
+        for label, address in labels:
+            if label in symbol_table:
+                raise Exception("({}) symbol occurs more than once".format(
+                    label))
+
+            symbol_table[label] = base + address
+
+        bases.append(base)
+        words.extend(chunk_words)
+
+    # Resolve references, allocating variables in order of first use
+
+    variable_addr_counter = VARIABLE_BASE_ADDR
+
+    for base, (_, _, references) in zip(bases, results):
+        for address, symbol in references:
+            if symbol not in symbol_table:
+                symbol_table[symbol] = variable_addr_counter
+
+                variable_addr_counter += 1
+
+            words[base + address] = a_cmd_code(symbol_table[symbol])
+
+    return words
+
+
+def assemble(source, one_pass=True, encoder=None, debug=None):
+    """
+    Assembles source and returns its words as array('H'). source is the path
+    of an .asm file, a string of assembly containing at least one newline,
+    or any iterable of source lines. debug is only supported in one_pass.
+    """
+    if isinstance(source, str):
+        if "\n" in source:
+            source = source.splitlines()
+    elif not one_pass:
+        # the two-pass assembler reads its input twice
+        source = list(source)
+
+    if one_pass:
+        return assemble_one_pass(source, encoder, debug)
+
+    if debug is not None:
+        raise Exception("Debug info is only collected by the one pass "
+                        "assembler")
+
+    return assemble_two_pass(source, encoder)
+
+
+if __name__ == "__main__":
 
-                outfile.write("111" + c_code.comp +
-                              c_code.dest + c_code.jump + "\n")
+    arg_parser = argparse.ArgumentParser(
+        description="Translates Hack assembly into Hack machine code")
+    arg_parser.add_argument("file_location", help="input .asm file")
+    arg_parser.add_argument("dest_file",
+                            help="output .hack file, or packed ROM image "
+                            "if it ends in '{}'".format(rom.BINARY_EXTENSION))
+    arg_parser.add_argument("--one-pass", action="store_true",
+                            help="read the source once and backpatch "
+                            "forward label references")
+    arg_parser.add_argument("-O", "--optimize", action="store_true",
+                            help="run the peephole optimizer first and "
+                            "report what it removed")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="assemble in chunks across JOBS processes, "
+                            "0 uses every core")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="reuse encodings cached next to dest_file "
+                            "by the previous run")
+    arg_parser.add_argument("--binary", action="store_true",
+                            help="always write a packed ROM image")
+    arg_parser.add_argument("-g", "--source-map", action="store_true",
+                            help="also write a debug sidecar mapping ROM "
+                            "addresses to source lines to dest_file + '{}'"
+                            .format(sourcemap.SOURCE_MAP_EXTENSION))
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="print C_COMMAND encoder cache statistics")
+    args = arg_parser.parse_args()
+
+    if args.jobs < 0:
+        arg_parser.error("--jobs can't be negative")
+    # the chunks are assembled with their own encoders, in two passes
+    if args.jobs != 1 and (args.one_pass or args.stats):
+        arg_parser.error("--jobs can't be combined with --one-pass or "
+                         "--stats")
+    # the optimizer drops the VM annotations and shifts the source lines
+    if args.source_map and (args.optimize or args.incremental or
+                            args.jobs != 1):
+        arg_parser.error("--source-map can't be combined with --optimize, "
+                         "--incremental or --jobs")
+
+    encoder = Encoder()
+
+    source = args.file_location
+
+    if args.optimize:
+        optimizer = Optimizer()
+        source = optimizer.optimize(source)
+        print(optimizer.report())
+
+    if args.incremental:
+        from incremental import CACHE_EXTENSION, assemble_incremental
+
+        words, stats = assemble_incremental(
+            source, args.dest_file + CACHE_EXTENSION, encoder)
+        print(stats)
+    elif args.jobs != 1:
+        words = assemble_parallel(source, args.jobs)
+    elif args.source_map:
+        if isinstance(source, str):
+            with open(source, "r") as infile:
+                source = infile.readlines()
+
+        debug = sourcemap.DebugInfo()
+        words = assemble_one_pass(source, encoder, debug)
+
+        sourcemap.write_source_map(
+            args.dest_file + sourcemap.SOURCE_MAP_EXTENSION,
+            debug, source, PREDEFINED_SYMBOLS)
+    else:
+        words = assemble(source, args.one_pass, encoder)
+
+    if args.binary:
+        rom.write_binary(words, args.dest_file)
+    else:
+        rom.save(words, args.dest_file)
+
+    if args.stats:
+        print("C_COMMAND cache: " + encoder.stats())
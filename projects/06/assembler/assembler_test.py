@@ -0,0 +1,86 @@
+__author__ = "Yun-L"
+
+import os
+import tempfile
+import unittest
+
+from assembler import assemble, assemble_one_pass, assemble_two_pass, \
+    assemble_parallel
+import rom
+
+PROGRAMS = ["../add/Add",
+            "../max/Max",
+            "../max/MaxL",
+            "../rect/Rect",
+            "../rect/RectL",
+            "../pong/Pong",
+            "../pong/PongL"]
+
+
+class TestAssembler(unittest.TestCase):
+
+    def test_two_pass(self):
+        for program in PROGRAMS:
+            self.assertEqual(assemble_two_pass(program + ".asm"),
+                             rom.read_hack(program + "_comp.hack"))
+
+    def test_one_pass(self):
+        for program in PROGRAMS:
+            self.assertEqual(assemble_one_pass(program + ".asm"),
+                             rom.read_hack(program + "_comp.hack"))
+
+    def test_one_pass_forward_reference(self):
+        # Variables must be allocated in order of first use, skipping any
+        # symbol that later turns out to be a label.
+        self.assertEqual(assemble_one_pass("test_forward_refs.asm"),
+                         assemble_two_pass("test_forward_refs.asm"))
+
+    def test_parallel(self):
+        for program in ["../max/MaxL", "../pong/Pong"]:
+            self.assertEqual(assemble_parallel(program + ".asm", jobs=3,
+                                               chunk_lines=1000),
+                             rom.read_hack(program + "_comp.hack"))
+
+        # Splitting anywhere, including between a forward reference and its
+        # label, must not change the variable allocation order.
+        for chunk_lines in range(1, 8):
+            self.assertEqual(assemble_parallel("test_forward_refs.asm",
+                                               jobs=1,
+                                               chunk_lines=chunk_lines),
+                             assemble_two_pass("test_forward_refs.asm"))
+
+        with self.assertRaises(Exception):
+            assemble_parallel("test_forward_refs.asm", jobs=-2)
+
+    def test_assemble_sources(self):
+        with open("test_forward_refs.asm", "r") as infile:
+            text = infile.read()
+
+        expected = assemble("test_forward_refs.asm")
+
+        self.assertEqual(assemble(text), expected)
+        self.assertEqual(assemble(text.splitlines()), expected)
+        self.assertEqual(assemble(iter(text.splitlines()), one_pass=False),
+                         expected)
+
+    def test_output_formats(self):
+        words = assemble("../max/Max.asm")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hack_file = os.path.join(tmp_dir, "Max.hack")
+            rom_file = os.path.join(tmp_dir, "Max" + rom.BINARY_EXTENSION)
+
+            rom.save(words, hack_file)
+            rom.save(words, rom_file)
+
+            with open(hack_file, "r") as hack, \
+                    open("../max/Max_comp.hack", "r") as expected:
+                self.assertEqual(hack.read(), expected.read())
+
+            self.assertEqual(os.path.getsize(rom_file), 2 * len(words))
+            self.assertEqual(rom.load(rom_file), words)
+            self.assertEqual(rom.load(hack_file), words)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+__author__ = "Yun-L"
+
+import argparse
+import re
+import sys
+import time
+
+from emulator import Emulator, JMP, JUMP_CONDITIONS, alu, comp_expression
+import rom
+
+# Longest straight-line run compiled into one block
+MAX_BLOCK_LENGTH = 256
+
+A_NAME = re.compile(r"\ba\b")
+
+
+def block_source(words, start, stops, name):
+    """
+    Returns (source, length) for a function executing the basic block
+    starting at ROM address start:
+        name(a, d, ram) -> (a, d, pc)
+    The block ends after the first instruction with a jump, before any
+    address in stops, or after MAX_BLOCK_LENGTH instructions. While A holds a
+    value loaded by an A_COMMAND in the block it is inlined as a constant.
+    """
+    lines = []
+
+    # Python expression for A: a literal while known, else the local 'a'
+    a = "a"
+    pc = start
+    length = 0
+    next_pc = None
+
+    while next_pc is None:
+        word = words[pc] if pc < len(words) else 0
+        length += 1
+        pc += 1
+
+        if word < 0x8000:
+            a = str(word)
+        else:
+            expression = A_NAME.sub(a, comp_expression(word))
+            dest = (word >> 3) & 0b111
+            jump = word & 0b111
+
+            if jump:
+                lines.append("x = " + expression)
+                target = a
+
+                if dest & 0b100 and a == "a":
+                    lines.append("j = a")
+                    target = "j"
+
+                expression = "x"
+
+            if dest == 0b001:
+                lines.append("ram[{}] = {}".format(a, expression))
+            elif dest == 0b010:
+                lines.append("d = " + expression)
+            elif dest == 0b100:
+                lines.append("a = " + expression)
+            elif dest:
+                if expression != "x":
+                    lines.append("x = " + expression)
+                # M is written through A as it was before this instruction
+                if dest & 0b001:
+                    lines.append("ram[{}] = x".format(a))
+                if dest & 0b100:
+                    lines.append("a = x")
+                if dest & 0b010:
+                    lines.append("d = x")
+
+            if dest & 0b100:
+                a = "a"
+
+            if jump == JMP:
+                next_pc = target
+            elif jump:
+                next_pc = "{} if {} else {}".format(
+                    target, JUMP_CONDITIONS[jump], pc)
+
+        if next_pc is None and (pc in stops or length >= MAX_BLOCK_LENGTH
+                                or pc >= rom.ROM_SIZE):
+            next_pc = str(pc)
+
+    lines.append("return {}, d, {}".format(a, next_pc))
+
+    source = "def {}(a, d, ram):\n".format(name)
+    source += "".join("    " + line + "\n" for line in lines)
+
+    return source, length
+
+
+class BlockEmulator(Emulator):
+    """
+    Emulator backend that translates the ROM into Python functions one basic
+    block at a time, as blocks are first entered. Blocks are cached by start
+    address and chained by the PC they return, so straight-line code runs
+    without per-instruction dispatch. RAM, registers and cycle counts always
+    match the instruction-at-a-time Emulator.
+    """
+
+    def __init__(self, program=None):
+        self.__blocks = {}
+        self.__stops = set()
+        self.blocks_compiled = 0
+        super().__init__(program)
+
+    def load(self, program):
+        super().load(program)
+        self.__stops = set(self.halt_addresses)
+        self.__stops.add(len(self.rom))
+        self.__blocks = {}
+
+    def __block(self, pc):
+        if pc >= rom.ROM_SIZE:
+            raise IndexError(pc)
+
+        source, length = block_source(self.rom, pc, self.__stops, "block")
+
+        namespace = {"alu": alu}
+        exec(source, namespace)
+
+        block = (namespace["block"], length)
+        self.__blocks[pc] = block
+        self.blocks_compiled += 1
+
+        return block
+
+    def __add_stop(self, pc):
+        """Makes sure no block runs past pc"""
+        if pc not in self.__stops:
+            self.__stops.add(pc)
+            self.__blocks = {}
+
+    def __run_blocks(self, cycles, halts=frozenset(), target=None,
+                     end=rom.ROM_SIZE):
+        """
+        Runs whole blocks while they fit in cycles, stopping early at any PC
+        in halts, at target or at end. Returns the number of instructions
+        executed.
+        """
+        blocks = self.__blocks
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        remaining = cycles
+
+        try:
+            while pc < end and pc not in halts and pc != target:
+                block = blocks.get(pc)
+                if block is None:
+                    block = self.__block(pc)
+
+                if block[1] > remaining:
+                    break
+
+                a, d, pc = block[0](a, d, ram)
+                remaining -= block[1]
+        except IndexError:
+            self.a, self.d, self.pc = a, d, pc
+            raise Exception("Illegal address (A={}, PC={})".format(a, pc))
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles - remaining
+
+        return cycles - remaining
+
+    def run(self, cycles):
+        executed = self.__run_blocks(cycles)
+
+        # finish with single instructions what no longer fits in a block
+        if executed < cycles:
+            super().run(cycles - executed)
+
+    def run_until_pc(self, target, max_cycles=None):
+        self.__add_stop(target)
+
+        limit = max_cycles if max_cycles is not None else sys.maxsize
+        executed = self.__run_blocks(limit, target=target)
+
+        if self.pc == target:
+            return True
+
+        return super().run_until_pc(target, limit - executed)
+
+    def run_until_halt(self, max_cycles=None):
+        halts = self.halt_addresses
+
+        limit = max_cycles if max_cycles is not None else sys.maxsize
+        executed = self.__run_blocks(limit, halts=halts, end=len(self.rom))
+
+        if self.halted:
+            return True
+
+        return super().run_until_halt(limit - executed)
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Runs a Hack program with the basic block backend")
+    arg_parser.add_argument("program", help=".hack, .rom or .asm file")
+    arg_parser.add_argument("-n", "--cycles", type=int, default=1000000,
+                            help="instructions to execute (at most, with "
+                            "--until-halt)")
+    arg_parser.add_argument("--until-halt", action="store_true",
+                            help="stop once the program halts")
+    arg_parser.add_argument("--ram", type=int, nargs="*", default=[0],
+                            help="RAM addresses to print")
+    arg_parser.add_argument("--restore", metavar="SNAPSHOT",
+                            help="start from a snapshot of this program")
+    arg_parser.add_argument("--save", metavar="SNAPSHOT",
+                            help="write a snapshot when done")
+    args = arg_parser.parse_args()
+
+    emulator = BlockEmulator(args.program)
+
+    if args.restore:
+        import snapshot
+        snapshot.restore(emulator, args.restore)
+
+    start = time.perf_counter()
+    if args.until_halt:
+        emulator.run_until_halt(args.cycles)
+    else:
+        emulator.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    print("PC={} A={} D={} cycles={} blocks={} ({:.2f}M instructions/s)"
+          .format(emulator.pc, emulator.a, emulator.d, emulator.cycles,
+                  emulator.blocks_compiled,
+                  emulator.cycles / elapsed / 1e6 if elapsed else 0))
+
+    for address in args.ram:
+        print("RAM[{}]={}".format(address, emulator.ram[address]))
+
+    if args.save:
+        import snapshot
+        snapshot.save(emulator, args.save)
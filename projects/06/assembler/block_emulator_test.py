@@ -0,0 +1,72 @@
+__author__ = "Yun-L"
+
+import unittest
+
+from block_emulator import BlockEmulator
+from emulator import Emulator
+
+FIBONACCI = "../../08/FunctionCalls/FibonacciElement/FibonacciElement.asm"
+
+
+def state(emulator):
+    return (emulator.pc, emulator.a, emulator.d, emulator.cycles,
+            emulator.ram.tobytes())
+
+
+class TestBlockEmulator(unittest.TestCase):
+
+    def assertSameRun(self, program, steps):
+        reference = Emulator(program)
+        blocks = BlockEmulator(program)
+
+        for cycles in steps:
+            reference.run(cycles)
+            blocks.run(cycles)
+            self.assertEqual(state(blocks), state(reference))
+
+    def test_run(self):
+        self.assertSameRun(FIBONACCI, [1, 7, 100, 333, 5000])
+        self.assertSameRun("../pong/Pong.asm", [13, 1000, 54321, 200000])
+        self.assertSameRun("../rect/Rect.asm", [3, 500])
+
+    def test_run_until_halt(self):
+        reference = Emulator(FIBONACCI)
+        blocks = BlockEmulator(FIBONACCI)
+
+        self.assertTrue(reference.run_until_halt())
+        self.assertTrue(blocks.run_until_halt())
+        self.assertEqual(state(blocks), state(reference))
+
+        # running off the end of the program
+        reference = Emulator("../max/Max.asm")
+        blocks = BlockEmulator("../max/Max.asm")
+        reference.ram[0], reference.ram[1] = 4, 8
+        blocks.ram[0], blocks.ram[1] = 4, 8
+
+        self.assertTrue(reference.run_until_halt())
+        self.assertTrue(blocks.run_until_halt())
+        self.assertEqual(state(blocks), state(reference))
+
+    def test_run_until_pc(self):
+        reference = Emulator("../pong/Pong.asm")
+        blocks = BlockEmulator("../pong/Pong.asm")
+
+        blocks.run(10000)
+        reference.run(10000)
+
+        # an address in the middle of an already compiled block
+        for target, limit in [(blocks.pc + 3, 100000), (12345, 10)]:
+            self.assertEqual(blocks.run_until_pc(target, limit),
+                             reference.run_until_pc(target, limit))
+            self.assertEqual(state(blocks), state(reference))
+
+    def test_illegal_address(self):
+        # A=-1, then M=0 writes outside of RAM
+        emulator = BlockEmulator([0xEEA0, 0xEA88])
+
+        with self.assertRaises(Exception):
+            emulator.run(2)
+
+
+if __name__ == "__main__":
+    unittest.main()
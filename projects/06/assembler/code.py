@@ -1,5 +1,60 @@
 __author__ = "Yun-L"
 
+from collections import OrderedDict
+
+JUMP_BITS = {
+    "": "000",
+    "JGT": "001",
+    "JEQ": "010",
+    "JGE": "011",
+    "JLT": "100",
+    "JNE": "101",
+    "JLE": "110",
+    "JMP": "111"}
+
+COMP_BITS = {
+    "0": "0101010",
+    "1": "0111111",
+    "D": "0001100",
+    "A": "0110000",
+    "M": "1110000",
+    "-1": "0111010",
+    "!D": "0001101",
+    "!A": "0110001",
+    "!M": "1110001",
+    "-D": "0001111",
+    "-A": "0110011",
+    "-M": "1110011",
+    "D+1": "0011111",
+    "A+1": "0110111",
+    "M+1": "1110111",
+    "D-1": "0001110",
+    "A-1": "0110010",
+    "M-1": "1110010",
+    "D+A": "0000010",
+    "D-A": "0010011",
+    "D+M": "1000010",
+    "D-M": "1010011",
+    "A-D": "0000111",
+    "M-D": "1000111",
+    "D&A": "0000000",
+    "D&M": "1000000",
+    "D|A": "0010101",
+    "D|M": "1010101"}
+
+# Integer forms of the tables above, for building whole words
+JUMP_CODES = {k: int(v, 2) for k, v in JUMP_BITS.items()}
+COMP_CODES = {k: int(v, 2) for k, v in COMP_BITS.items()}
+
+C_PREFIX = 0b111 << 13
+
+
+def dest_code(dest):
+    """Returns the 3 dest bits as an int. Unknown characters are ignored."""
+    return ((4 if "A" in dest else 0) |
+            (2 if "D" in dest else 0) |
+            (1 if "M" in dest else 0))
+
 
 class Code(object):
     """Translates assembly language mnemonics into binary codes"""
@@ -23,103 +78,96 @@ class Code(object):
 
     @dest.setter
     def dest(self, dest):
-
-        dest_bits = ["0", "0", "0"]
-
-        if "A" in dest:
-            dest_bits[0] = "1"
-
-        if "D" in dest:
-            dest_bits[1] = "1"
-
-        if "M" in dest:
-            dest_bits[2] = "1"
-
-        self.__dest = "".join(dest_bits)
+        self.__dest = format(dest_code(dest), "03b")
 
     @jump.setter
     def jump(self, jump):
-
-        jump_bits = {
-            "": "000",
-            "JGT": "001",
-            "JEQ": "010",
-            "JGE": "011",
-            "JLT": "100",
-            "JNE": "101",
-            "JLE": "110",
-            "JMP": "111"}
-        if jump in jump_bits:
-            self.__jump = jump_bits[jump]
+        if jump in JUMP_BITS:
+            self.__jump = JUMP_BITS[jump]
         else:
             raise Exception("[{}] is not a valid 'jump' token.".format(jump))
 
     @comp.setter
     def comp(self, comp):
-        try:
-            if len(comp) == 1:
-                self.__comp = self.__comp1(comp)
-            elif len(comp) == 2:
-                self.__comp = self.__comp2(comp)
-            elif len(comp) == 3:
-                self.__comp = self.__comp3(comp)
-            else:
-                raise Exception(
-                    "[{}] is not a valid 'comp' token".format(comp))
-        except:
-            raise Exception("[{}] is not a valid 'comp' token".format(comp))
-
-    def __comp1(self, comp):
-        """ Returns bits for comp tokens of length 1 """
-        bits = {
-            "0": "0101010",
-            "1": "0111111",
-            "D": "0001100",
-            "A": "0110000",
-            "M": "1110000"}
-
-        if comp in bits:
-            return bits[comp]
+        if comp in COMP_BITS:
+            self.__comp = COMP_BITS[comp]
         else:
             raise Exception("[{}] is not a valid 'comp' token".format(comp))
 
-    def __comp2(self, comp):
-        """ Returns bits for comp tokens of length 2 """
-        bits = {
-            "-1": "0111010",
-            "!D": "0001101",
-            "!A": "0110001",
-            "!M": "1110001",
-            "-D": "0001111",
-            "-A": "0110011",
-            "-M": "1110011"}
-
-        if comp in bits:
-            return bits[comp]
-        else:
-            raise Exception("[{}] is not a valid 'comp' token".format(comp))
 
-    def __comp3(self, comp):
-        """ Returns bits for comp tokens of length 3 """
-        bits = {
-            "D+1": "0011111",
-            "A+1": "0110111",
-            "M+1": "1110111",
-            "D-1": "0001110",
-            "A-1": "0110010",
-            "M-1": "1110010",
-            "D+A": "0000010",
-            "D-A": "0010011",
-            "D+M": "1000010",
-            "D-M": "1010011",
-            "A-D": "0000111",
-            "M-D": "1000111",
-            "D&A": "0000000",
-            "D&M": "1000000",
-            "D|A": "0010101",
-            "D|M": "1010101"}
-
-        if comp in bits:
-            return bits[comp]
+class Encoder(object):
+    """
+    Encodes the full text of a C_COMMAND (e.g. 'M=M+1', 'D;JGT') into its
+    16-bit word. Results are memoized, so repeated instructions cost a single
+    dict lookup. maxsize=None keeps every entry, otherwise the least recently
+    used entry is evicted once the cache holds maxsize entries.
+    """
+
+    def __init__(self, maxsize=None):
+        self.__maxsize = maxsize
+        self.__cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def encode(self, text):
+        """Returns the C_COMMAND text as an int word"""
+        cache = self.__cache
+
+        if text in cache:
+            self.hits += 1
+            if self.__maxsize is not None:
+                cache.move_to_end(text)
+            return cache[text]
+
+        self.misses += 1
+        word = self.__encode(text)
+
+        cache[text] = word
+        if self.__maxsize is not None and len(cache) > self.__maxsize:
+            cache.popitem(last=False)
+
+        return word
+
+    def encode_fields(self, dest, comp, jump):
+        """Same as encode() for an already split C_COMMAND"""
+        if dest:
+            text = dest + "=" + comp
         else:
+            text = comp
+
+        if jump:
+            text += ";" + jump
+
+        return self.encode(text)
+
+    @staticmethod
+    def __encode(text):
+        delim_ind1 = text.find("=")
+        delim_ind2 = text.find(";")
+
+        dest = text[:delim_ind1] if delim_ind1 > 0 else ""
+        comp_end = delim_ind2 if delim_ind2 >= 0 else len(text)
+        comp = text[delim_ind1 + 1:comp_end]
+        jump = text[delim_ind2 + 1:] if delim_ind2 >= 0 else ""
+
+        if comp not in COMP_CODES:
             raise Exception("[{}] is not a valid 'comp' token".format(comp))
+
+        if jump not in JUMP_CODES:
+            raise Exception("[{}] is not a valid 'jump' token.".format(jump))
+
+        return (C_PREFIX |
+                COMP_CODES[comp] << 6 |
+                dest_code(dest) << 3 |
+                JUMP_CODES[jump])
+
+    def stats(self):
+        """Returns a short summary of the cache's hit/miss counters"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+
+        return "{} distinct, {} hits, {} misses ({:.1f}% hit rate)".format(
+            len(self.__cache), self.hits, self.misses, rate)
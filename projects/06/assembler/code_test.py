@@ -2,7 +2,7 @@ __author__ = "Yun-L"
 
 import unittest
 
-from code import Code
+from code import Code, Encoder
 
 class TestCode(unittest.TestCase):
 
@@ -170,5 +170,65 @@ class TestCode(unittest.TestCase):
         with self.assertRaises(Exception):
             self.code.comp = None
 
+
+class TestEncoder(unittest.TestCase):
+
+    def test_encode(self):
+        encoder = Encoder()
+
+        self.assertEqual(encoder.encode("M=M+1"), 0b1111110111001000)
+        self.assertEqual(encoder.encode("D;JGT"), 0b1110001100000001)
+        self.assertEqual(encoder.encode("0;JMP"), 0b1110101010000111)
+        self.assertEqual(encoder.encode("AMD=D|M"), 0b1111010101111000)
+        self.assertEqual(encoder.encode_fields("D", "A", ""),
+                         0b1110110000010000)
+
+    def test_matches_code(self):
+        encoder = Encoder()
+
+        for dest in ["", "M", "D", "MD", "A", "AM", "AD", "AMD"]:
+            for comp in ["0", "-1", "D+A", "M-D", "!M"]:
+                for jump in ["", "JEQ", "JLE"]:
+                    code = Code(dest, jump, comp)
+                    self.assertEqual(
+                        encoder.encode_fields(dest, comp, jump),
+                        int("111" + code.comp + code.dest + code.jump, 2))
+
+    def test_cache_counters(self):
+        encoder = Encoder()
+
+        encoder.encode("A=M")
+        encoder.encode("A=M")
+        encoder.encode("D=M")
+        encoder.encode("A=M")
+
+        self.assertEqual(encoder.hits, 2)
+        self.assertEqual(encoder.misses, 2)
+        self.assertEqual(len(encoder), 2)
+
+    def test_lru(self):
+        encoder = Encoder(maxsize=2)
+
+        encoder.encode("A=M")
+        encoder.encode("D=M")
+        encoder.encode("A=M")
+        encoder.encode("M=D")  # evicts D=M
+
+        self.assertEqual(len(encoder), 2)
+        encoder.encode("A=M")
+        self.assertEqual(encoder.hits, 2)
+        encoder.encode("D=M")
+        self.assertEqual(encoder.misses, 4)
+
+    def test_invalid(self):
+        encoder = Encoder()
+
+        with self.assertRaises(Exception):
+            encoder.encode("M=HHH")
+
+        with self.assertRaises(Exception):
+            encoder.encode("0;AOEU")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,350 @@
+__author__ = "Yun-L"
+
+import argparse
+import time
+from array import array
+from itertools import repeat
+from operator import length_hint
+
+from code import COMP_CODES, JUMP_CODES
+import rom
+
+RAM_SIZE = 32768
+
+SCREEN_BASE = 16384
+KBD_ADDR = 24576
+
+# Python expression computing each comp mnemonic from a, d and ram
+COMP_EXPRESSIONS = {
+    "0": "0",
+    "1": "1",
+    "-1": "0xFFFF",
+    "D": "d",
+    "A": "a",
+    "M": "ram[a]",
+    "!D": "d ^ 0xFFFF",
+    "!A": "a ^ 0xFFFF",
+    "!M": "ram[a] ^ 0xFFFF",
+    "-D": "-d & 0xFFFF",
+    "-A": "-a & 0xFFFF",
+    "-M": "-ram[a] & 0xFFFF",
+    "D+1": "(d + 1) & 0xFFFF",
+    "A+1": "(a + 1) & 0xFFFF",
+    "M+1": "(ram[a] + 1) & 0xFFFF",
+    "D-1": "(d - 1) & 0xFFFF",
+    "A-1": "(a - 1) & 0xFFFF",
+    "M-1": "(ram[a] - 1) & 0xFFFF",
+    "D+A": "(d + a) & 0xFFFF",
+    "D-A": "(d - a) & 0xFFFF",
+    "A-D": "(a - d) & 0xFFFF",
+    "D+M": "(d + ram[a]) & 0xFFFF",
+    "D-M": "(d - ram[a]) & 0xFFFF",
+    "M-D": "(ram[a] - d) & 0xFFFF",
+    "D&A": "d & a",
+    "D&M": "d & ram[a]",
+    "D|A": "d | a",
+    "D|M": "d | ram[a]"}
+
+COMP_BY_CODE = {code: COMP_EXPRESSIONS[comp]
+                for comp, code in COMP_CODES.items()}
+
+# Condition on the (unsigned 16-bit) ALU output x for each jump
+JUMP_CONDITIONS = {
+    JUMP_CODES["JGT"]: "0 < x < 0x8000",
+    JUMP_CODES["JEQ"]: "x == 0",
+    JUMP_CODES["JGE"]: "x < 0x8000",
+    JUMP_CODES["JLT"]: "x >= 0x8000",
+    JUMP_CODES["JNE"]: "x != 0",
+    JUMP_CODES["JLE"]: "x == 0 or x >= 0x8000"}
+
+JMP = JUMP_CODES["JMP"]
+
+
+def alu(x, y, control):
+    """
+    The Hack ALU for the 6 control bits zx nx zy ny f no, used for comp
+    codes outside the documented table
+    """
+    if control & 0b100000:
+        x = 0
+    if control & 0b010000:
+        x ^= 0xFFFF
+    if control & 0b001000:
+        y = 0
+    if control & 0b000100:
+        y ^= 0xFFFF
+    if control & 0b000010:
+        out = (x + y) & 0xFFFF
+    else:
+        out = x & y
+    if control & 0b000001:
+        out ^= 0xFFFF
+    return out
+
+
+def comp_expression(word):
+    comp = (word >> 6) & 0x7F
+
+    if comp in COMP_BY_CODE:
+        return COMP_BY_CODE[comp]
+
+    y = "ram[a]" if comp & 0x40 else "a"
+    return "alu(d, {}, {})".format(y, comp & 0x3F)
+
+
+def c_source(word, name):
+    """
+    Returns Python source for a function executing the C_COMMAND word:
+        name(a, d, pc, ram) -> (a, d, pc)
+    """
+    dest = (word >> 3) & 0b111
+    jump = word & 0b111
+
+    lines = ["def {}(a, d, pc, ram):".format(name),
+             "    x = " + comp_expression(word)]
+
+    if dest & 0b001:
+        lines.append("    ram[a] = x")
+
+    new_a = "x" if dest & 0b100 else "a"
+    new_d = "x" if dest & 0b010 else "d"
+
+    # The jump goes to A as it was before this instruction
+    if jump == JMP:
+        new_pc = "a"
+    elif jump:
+        new_pc = "a if {} else pc + 1".format(JUMP_CONDITIONS[jump])
+    else:
+        new_pc = "pc + 1"
+
+    lines.append("    return {}, {}, {}".format(new_a, new_d, new_pc))
+
+    return "\n".join(lines) + "\n"
+
+
+decoded_instructions = {}
+
+
+def decode(word):
+    """
+    Returns the function executing word. Functions are shared between
+    every occurrence of the same word.
+    """
+    if word in decoded_instructions:
+        return decoded_instructions[word]
+
+    if word < 0x8000:
+        def instruction(a, d, pc, ram, value=word):
+            return value, d, pc + 1
+    else:
+        namespace = {"alu": alu}
+        exec(c_source(word, "instruction"), namespace)
+        instruction = namespace["instruction"]
+
+    decoded_instructions[word] = instruction
+    return instruction
+
+
+def load_program(program):
+    """
+    Returns the words of program: a path to a .hack, packed .rom or .asm
+    file, or an iterable of words
+    """
+    if isinstance(program, str):
+        if program.endswith(".asm"):
+            from assembler import assemble
+            return assemble(program)
+
+        return rom.load(program)
+
+    return array("H", program)
+
+
+class Emulator(object):
+    """
+    Executes Hack machine code. The ROM is decoded once into a table of
+    functions, one per instruction, so running a program is a loop of table
+    lookups and calls.
+    """
+
+    def __init__(self, program=None):
+        self.ram = array("H", bytes(2 * RAM_SIZE))
+        self.__rom = array("H")
+        self.__code = []
+        self.__halts = frozenset()
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+        if program is not None:
+            self.load(program)
+
+    @property
+    def rom(self):
+        return self.__rom
+
+    @property
+    def halt_addresses(self):
+        return self.__halts
+
+    def load(self, program):
+        """Loads program into ROM (see load_program) and resets"""
+        self.__rom = load_program(program)
+
+        if len(self.__rom) > rom.ROM_SIZE:
+            raise Exception("Program of {} words doesn't fit in ROM".format(
+                len(self.__rom)))
+
+        # Unused ROM holds 0, i.e. '@0'
+        self.__code = [decode(word) for word in self.__rom]
+        self.__code.extend([decode(0)] * (rom.ROM_SIZE - len(self.__rom)))
+
+        self.__halts = frozenset(self.__find_halts())
+
+        self.reset()
+
+    def __find_halts(self):
+        """
+        Yields the addresses of every '(X) @X 0;JMP' style infinite loop, the
+        usual way a Hack program ends
+        """
+        words = self.__rom
+
+        for address in range(len(words) - 1):
+            jump = words[address + 1]
+
+            if words[address] == address and jump & 0xE000 == 0xE000 \
+               and jump & 0b111 == JMP and not jump & 0b111000:
+                yield address
+                yield address + 1
+
+    def reset(self):
+        """Resets the CPU, RAM is left as is"""
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    @property
+    def halted(self):
+        """True once the program ran off its end or sits in a halt loop"""
+        return self.pc >= len(self.__rom) or self.pc in self.__halts
+
+    def step(self):
+        """Executes a single instruction"""
+        self.a, self.d, self.pc = self.__code[self.pc](
+            self.a, self.d, self.pc, self.ram)
+        self.cycles += 1
+
+    def run(self, cycles):
+        """
+        Executes the given number of instructions. On an illegal address the
+        state and cycle count are those ahead of the failing instruction.
+        """
+        code = self.__code
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        remaining = repeat(None, cycles)
+
+        try:
+            for _ in remaining:
+                a, d, pc = code[pc](a, d, pc, ram)
+        except IndexError:
+            self.a, self.d, self.pc = a, d, pc
+            # the failing instruction took the last item from remaining
+            self.cycles += cycles - length_hint(remaining) - 1
+            raise Exception("Illegal address (A={}, PC={})".format(a, pc))
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+
+    def run_until_cycles(self, cycles):
+        """Runs until the cycle counter reaches cycles"""
+        if cycles > self.cycles:
+            self.run(cycles - self.cycles)
+
+    def run_until_pc(self, target, max_cycles=None):
+        """
+        Runs until PC is target, or max_cycles instructions were executed.
+        Returns True if target was reached.
+        """
+        code = self.__code
+        ram = self.ram
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        limit = max_cycles if max_cycles is not None else float("inf")
+
+        while pc != target and executed < limit:
+            a, d, pc = code[pc](a, d, pc, ram)
+            executed += 1
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+
+        return pc == target
+
+    def run_until_halt(self, max_cycles=None):
+        """
+        Runs until halted (see halted), or max_cycles instructions were
+        executed. Returns True if the program halted.
+        """
+        code = self.__code
+        ram = self.ram
+        halts = self.__halts
+        end = len(self.__rom)
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        limit = max_cycles if max_cycles is not None else float("inf")
+
+        while pc < end and pc not in halts and executed < limit:
+            a, d, pc = code[pc](a, d, pc, ram)
+            executed += 1
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+
+        return self.halted
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Runs a Hack program")
+    arg_parser.add_argument("program", help=".hack, .rom or .asm file")
+    arg_parser.add_argument("-n", "--cycles", type=int, default=1000000,
+                            help="instructions to execute (at most, with "
+                            "--until-halt)")
+    arg_parser.add_argument("--until-halt", action="store_true",
+                            help="stop once the program halts")
+    arg_parser.add_argument("--ram", type=int, nargs="*", default=[0],
+                            help="RAM addresses to print")
+    arg_parser.add_argument("--restore", metavar="SNAPSHOT",
+                            help="start from a snapshot of this program")
+    arg_parser.add_argument("--save", metavar="SNAPSHOT",
+                            help="write a snapshot when done")
+    args = arg_parser.parse_args()
+
+    emulator = Emulator(args.program)
+
+    if args.restore:
+        import snapshot
+        snapshot.restore(emulator, args.restore)
+
+    start = time.perf_counter()
+    if args.until_halt:
+        emulator.run_until_halt(args.cycles)
+    else:
+        emulator.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    print("PC={} A={} D={} cycles={} ({:.2f}M instructions/s)".format(
+        emulator.pc, emulator.a, emulator.d, emulator.cycles,
+        emulator.cycles / elapsed / 1e6 if elapsed else 0))
+
+    for address in args.ram:
+        print("RAM[{}]={}".format(address, emulator.ram[address]))
+
+    if args.save:
+        import snapshot
+        snapshot.save(emulator, args.save)
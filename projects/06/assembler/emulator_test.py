@@ -0,0 +1,113 @@
+__author__ = "Yun-L"
+
+import unittest
+
+from assembler import assemble
+from code import COMP_CODES, Encoder
+from emulator import Emulator, alu, decode
+
+
+def run_asm(lines, max_cycles=1000):
+    emulator = Emulator(assemble(lines))
+    emulator.run_until_halt(max_cycles)
+    return emulator
+
+
+class TestEmulator(unittest.TestCase):
+
+    def test_max(self):
+        emulator = Emulator("../max/Max.asm")
+        emulator.ram[0] = 3
+        emulator.ram[1] = 9
+        self.assertTrue(emulator.run_until_halt(100))
+        self.assertEqual(emulator.ram[2], 9)
+
+        emulator.reset()
+        emulator.ram[0] = 0xFFFE  # -2
+        emulator.ram[1] = 0xFFFD  # -3
+        emulator.run_until_halt(100)
+        self.assertEqual(emulator.ram[2], 0xFFFE)
+
+    def test_fibonacci_element(self):
+        emulator = Emulator(
+            "../../08/FunctionCalls/FibonacciElement/FibonacciElement.asm")
+        emulator.run(6000)
+        self.assertEqual(emulator.ram[0], 262)
+        self.assertEqual(emulator.ram[261], 3)
+
+    def test_arithmetic(self):
+        emulator = run_asm(["@5", "D=A", "@7", "D=D-A",  # -2
+                            "@100", "M=D",
+                            "M=M-1",                     # -3
+                            "@101", "M=-1",
+                            "D=!D",                      # 1
+                            "@102", "M=D+1",
+                            "@103", "M=D|A"])
+        self.assertEqual(emulator.ram[100], 0xFFFD)
+        self.assertEqual(emulator.ram[101], 0xFFFF)
+        self.assertEqual(emulator.ram[102], 2)
+        self.assertEqual(emulator.ram[103], 103)
+
+    def test_jumps(self):
+        for jump, taken in [("JGT", [False, False, True]),
+                            ("JEQ", [False, True, False]),
+                            ("JGE", [False, True, True]),
+                            ("JLT", [True, False, False]),
+                            ("JNE", [True, False, True]),
+                            ("JLE", [True, True, False]),
+                            ("JMP", [True, True, True])]:
+            for value, expected in zip(["-1", "0", "1"], taken):
+                emulator = run_asm(["@TAKEN", "{};{}".format(value, jump),
+                                    "@END", "0;JMP",
+                                    "(TAKEN)", "@100", "M=1",
+                                    "(END)", "@END", "0;JMP"])
+                self.assertEqual(emulator.ram[100], int(expected),
+                                 "{};{}".format(value, jump))
+
+    def test_jump_uses_old_a(self):
+        # the Parser doesn't accept dest=comp;jump, encode it directly
+        emulator = Emulator([4, Encoder().encode("A=A+1;JMP")])
+        emulator.step()
+        emulator.step()
+        self.assertEqual(emulator.pc, 4)
+        self.assertEqual(emulator.a, 5)
+
+    def test_run_until(self):
+        emulator = Emulator("../max/Max.asm")
+        self.assertTrue(emulator.run_until_pc(4))
+        self.assertEqual(emulator.cycles, 4)
+
+        emulator.run_until_cycles(10)
+        self.assertEqual(emulator.cycles, 10)
+
+        self.assertFalse(emulator.run_until_pc(1000, max_cycles=50))
+        self.assertEqual(emulator.cycles, 60)
+
+    def test_illegal_address(self):
+        # the fifth instruction writes past the end of RAM
+        emulator = Emulator(assemble(["@7", "D=A", "D=-1", "A=D", "M=1"]))
+        emulator.run(2)
+
+        with self.assertRaises(Exception):
+            emulator.run(10)
+        self.assertEqual(emulator.cycles, 4)
+        self.assertEqual((emulator.a, emulator.d, emulator.pc),
+                         (0xFFFF, 0xFFFF, 4))
+
+    def test_alu(self):
+        for comp, code in COMP_CODES.items():
+            if code & 0x40:
+                continue
+
+            for d, a in [(0, 0), (5, 3), (3, 5), (0xFFFF, 0x1234)]:
+                emulator = Emulator([0xE000 | code << 6 | 0b010000])
+                emulator.a, emulator.d = a, d
+                emulator.step()
+                self.assertEqual(emulator.d, alu(d, a, code), comp)
+
+    def test_shared_decode(self):
+        self.assertIs(decode(0xFC88), decode(0xFC88))
+
+
+if __name__ == "__main__":
+    unittest.main()
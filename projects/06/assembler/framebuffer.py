@@ -0,0 +1,170 @@
+"""
+Screen memory export. The 8K words from SCREEN_BASE map to a 512x256
+monochrome display, 32 words per row, and bit 0 of a word is the leftmost of
+its 16 pixels.
+
+A 1-bit bitmap wants the leftmost pixel in the top bit of each byte, so the
+whole screen converts in one pass: the little-endian bytes of the words
+already come in display order, and a 256-entry table reverses the bits of
+every byte at once with bytes.translate. No per-pixel Python code runs.
+"""
+
+__author__ = "Yun-L"
+
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+
+from emulator import SCREEN_BASE
+
+SCREEN_WIDTH = 512
+SCREEN_HEIGHT = 256
+SCREEN_WORDS = SCREEN_WIDTH * SCREEN_HEIGHT // 16
+
+ROW_BYTES = SCREEN_WIDTH // 8
+
+FORMATS = ["pbm", "png", "npy"]
+
+# byte -> the same byte with its bits reversed, and also inverted
+REVERSE_BITS = bytes(int(format(byte, "08b")[::-1], 2) for byte in range(256))
+REVERSE_INVERT_BITS = bytes(byte ^ 0xFF for byte in REVERSE_BITS)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def screen_bytes(ram, table=REVERSE_BITS):
+    """
+    Returns the screen as SCREEN_HEIGHT rows of ROW_BYTES bytes, leftmost
+    pixel in the top bit, 1 for black (the PBM raster)
+    """
+    words = ram[SCREEN_BASE:SCREEN_BASE + SCREEN_WORDS]
+
+    if sys.byteorder == "big":
+        words.byteswap()
+
+    return words.tobytes().translate(table)
+
+
+def pbm(ram):
+    """Returns the screen as a binary PBM image"""
+    header = "P4\n{} {}\n".format(SCREEN_WIDTH, SCREEN_HEIGHT).encode()
+    return header + screen_bytes(ram)
+
+
+def png_chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def png(ram, level=1):
+    """Returns the screen as a 1-bit grayscale PNG image"""
+    # grayscale is 0 for black, so the bits are inverted
+    raster = screen_bytes(ram, REVERSE_INVERT_BITS)
+
+    # every row starts with filter type 0
+    scanlines = b"".join(b"\0" + raster[start:start + ROW_BYTES]
+                         for start in range(0, len(raster), ROW_BYTES))
+
+    return (PNG_SIGNATURE +
+            png_chunk(b"IHDR", struct.pack(">IIBBBBB", SCREEN_WIDTH,
+                                           SCREEN_HEIGHT, 1, 0, 0, 0, 0)) +
+            png_chunk(b"IDAT", zlib.compress(scanlines, level)) +
+            png_chunk(b"IEND", b""))
+
+
+def to_array(ram):
+    """
+    Returns the screen as a SCREEN_HEIGHT x SCREEN_WIDTH numpy uint8 array,
+    1 for black. Needs numpy.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise Exception("numpy is needed for array export")
+
+    packed = numpy.frombuffer(screen_bytes(ram), dtype=numpy.uint8)
+    return numpy.unpackbits(packed).reshape(SCREEN_HEIGHT, SCREEN_WIDTH)
+
+
+def frames(emulator, cycles, every):
+    """
+    Runs emulator for cycles instructions, yielding (cycle, screen_bytes)
+    after every `every` instructions
+    """
+    if every < 1:
+        raise Exception("[{}] frames must be at least one instruction "
+                        "apart".format(every))
+
+    end = emulator.cycles + cycles
+
+    while emulator.cycles < end:
+        emulator.run(min(every, end - emulator.cycles))
+        yield emulator.cycles, screen_bytes(emulator.ram)
+
+
+def write_frame(dest_file, ram, fmt):
+    if fmt == "npy":
+        import numpy
+        numpy.save(dest_file, to_array(ram))
+        return
+
+    with open(dest_file, "wb") as outfile:
+        outfile.write(pbm(ram) if fmt == "pbm" else png(ram))
+
+
+def export_frames(emulator, cycles, every, dest_dir, fmt="pbm",
+                  skip_unchanged=False):
+    """
+    Runs emulator, writing a frame to dest_dir every `every` instructions,
+    named by cycle. Returns the number of frames written.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+
+    written = 0
+    previous = None
+
+    for cycle, raster in frames(emulator, cycles, every):
+        if skip_unchanged and raster == previous:
+            continue
+        previous = raster
+
+        write_frame(os.path.join(dest_dir, "frame_{:010d}.{}".format(
+            cycle, fmt)), emulator.ram, fmt)
+        written += 1
+
+    return written
+
+
+if __name__ == "__main__":
+
+    from block_emulator import BlockEmulator
+
+    arg_parser = argparse.ArgumentParser(
+        description="Runs a Hack program and dumps its screen periodically")
+    arg_parser.add_argument("program", help=".hack, .rom or .asm file")
+    arg_parser.add_argument("dest_dir", help="directory for the frames")
+    arg_parser.add_argument("-n", "--cycles", type=int, default=1000000,
+                            help="instructions to execute")
+    arg_parser.add_argument("--every", type=int, default=100000,
+                            help="instructions between frames")
+    arg_parser.add_argument("-f", "--format", choices=FORMATS, default="pbm",
+                            help="frame file format")
+    arg_parser.add_argument("--skip-unchanged", action="store_true",
+                            help="don't write frames equal to the last one")
+    args = arg_parser.parse_args()
+
+    if args.every < 1:
+        arg_parser.error("--every must be at least 1")
+
+    emulator = BlockEmulator(args.program)
+
+    start = time.perf_counter()
+    written = export_frames(emulator, args.cycles, args.every, args.dest_dir,
+                            args.format, args.skip_unchanged)
+    elapsed = time.perf_counter() - start
+
+    print("{} frames in {:.2f}s ({} cycles)".format(
+        written, elapsed, emulator.cycles))
@@ -0,0 +1,98 @@
+__author__ = "Yun-L"
+
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import framebuffer
+from emulator import Emulator, SCREEN_BASE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestFramebuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.emulator = Emulator("../rect/Rect.asm")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_screen_bytes(self):
+        ram = self.emulator.ram
+        # leftmost pixel of the first row, rightmost pixel of the last
+        ram[SCREEN_BASE] = 0x0001
+        ram[SCREEN_BASE + framebuffer.SCREEN_WORDS - 1] = 0x8000
+        ram[SCREEN_BASE + 33] = 0x0300
+
+        raster = framebuffer.screen_bytes(ram)
+
+        self.assertEqual(len(raster), 256 * 64)
+        self.assertEqual(raster[0], 0x80)
+        self.assertEqual(raster[-1], 0x01)
+        # second row, pixels 16 + 8 and 16 + 9
+        self.assertEqual(raster[64 + 3], 0xC0)
+        self.assertEqual(raster.count(0), len(raster) - 3)
+
+    def test_pbm(self):
+        self.emulator.ram[0] = 4
+        self.emulator.run(200)
+
+        image = framebuffer.pbm(self.emulator.ram)
+        header = b"P4\n512 256\n"
+
+        self.assertTrue(image.startswith(header))
+        rows = image[len(header):]
+        for row in range(4):
+            self.assertEqual(rows[row * 64:row * 64 + 3], b"\xff\xff\x00")
+        self.assertEqual(rows[4 * 64:].count(0), len(rows) - 4 * 64)
+
+    def test_png(self):
+        self.emulator.ram[SCREEN_BASE] = 0x0001
+        image = framebuffer.png(self.emulator.ram)
+
+        self.assertTrue(image.startswith(framebuffer.PNG_SIGNATURE))
+
+        width, height, depth = struct.unpack(">IIB", image[16:25])
+        self.assertEqual((width, height, depth), (512, 256, 1))
+
+        idat_length = struct.unpack(">I", image[33:37])[0]
+        scanlines = zlib.decompress(image[41:41 + idat_length])
+        self.assertEqual(len(scanlines), 256 * 65)
+        self.assertEqual(scanlines[:3], b"\x00\x7f\xff")
+
+    def test_export_frames(self):
+        self.emulator.ram[0] = 10
+        dest_dir = self.tmp_dir.name
+
+        written = framebuffer.export_frames(self.emulator, 1000, 100,
+                                            dest_dir, skip_unchanged=True)
+
+        self.assertEqual(self.emulator.cycles, 1000)
+        self.assertEqual(written, len(os.listdir(dest_dir)))
+        self.assertLess(written, 10)
+
+        for every in [0, -100]:
+            with self.assertRaises(Exception):
+                framebuffer.export_frames(self.emulator, 1000, every,
+                                          dest_dir)
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_to_array(self):
+        self.emulator.ram[SCREEN_BASE + 32] = 0x0002
+
+        pixels = framebuffer.to_array(self.emulator.ram)
+
+        self.assertEqual(pixels.shape, (256, 512))
+        self.assertEqual(pixels[1, 1], 1)
+        self.assertEqual(pixels.sum(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
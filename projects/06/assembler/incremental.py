@@ -0,0 +1,176 @@
+__author__ = "Yun-L"
+
+import hashlib
+import json
+import os
+from array import array
+
+from parser import Parser
+from code import Encoder
+from assembler import PREDEFINED_SYMBOLS, VARIABLE_BASE_ADDR, a_cmd_code
+
+CACHE_VERSION = 1
+
+CACHE_EXTENSION = ".cache"
+
+
+def line_hash(line):
+    return hashlib.blake2b(line.encode(), digest_size=8).hexdigest()
+
+
+def encode_lines(lines, encoder):
+    """
+    Returns one entry per source line:
+      None              blank line or comment
+      ["W", word]       fully encoded instruction
+      ["S", symbol]     A_COMMAND waiting on a label or variable
+      ["L", label]      L_COMMAND
+    """
+    entries = [None] * len(lines)
+
+    for command in Parser(lines).commands():
+        ind = command.line_number - 1
+
+        if command.command_type == "A_COMMAND":
+            a_value = command.symbol
+
+            if len(a_value) < 1:
+                raise Exception("No value found for A_COMMAND")
+
+            if a_value.isnumeric():
+                entries[ind] = ["W", a_cmd_code(a_value)]
+            elif a_value in PREDEFINED_SYMBOLS:
+                entries[ind] = ["W", PREDEFINED_SYMBOLS[a_value]]
+            else:
+                entries[ind] = ["S", a_value]
+
+        elif command.command_type == "C_COMMAND":
+            entries[ind] = ["W", encoder.encode(command.text)]
+
+        elif command.command_type == "L_COMMAND":
+            entries[ind] = ["L", command.symbol]
+
+    return entries
+
+
+def resolve(entries):
+    """Returns (words, symbol_table) for a full list of line entries"""
+    symbol_table = dict(PREDEFINED_SYMBOLS)
+
+    address_counter = 0
+
+    for entry in entries:
+        if entry is None:
+            continue
+
+        if entry[0] == "L":
+            if entry[1] in symbol_table:
+                raise Exception("({}) symbol occurs more than once".format(
+                    entry[1]))
+
+            symbol_table[entry[1]] = address_counter
+        else:
+            address_counter += 1
+
+    variable_addr_counter = VARIABLE_BASE_ADDR
+
+    words = array("H")
+
+    for entry in entries:
+        if entry is None or entry[0] == "L":
+            continue
+
+        if entry[0] == "W":
+            words.append(entry[1])
+        else:
+            if entry[1] not in symbol_table:
+                symbol_table[entry[1]] = variable_addr_counter
+
+                variable_addr_counter += 1
+
+            words.append(a_cmd_code(symbol_table[entry[1]]))
+
+    return words, symbol_table
+
+
+def load_cache(cache_file):
+    if not os.path.isfile(cache_file):
+        return None
+
+    try:
+        with open(cache_file, "r") as infile:
+            cache = json.load(infile)
+    except ValueError:
+        return None
+
+    if cache.get("version") != CACHE_VERSION:
+        return None
+
+    return cache
+
+
+def save_cache(cache_file, hashes, entries, symbol_table):
+    with open(cache_file, "w") as outfile:
+        json.dump({"version": CACHE_VERSION,
+                   "lines": dict(zip(hashes, entries)),
+                   "symbols": symbol_table},
+                  outfile, separators=(",", ":"))
+
+
+def assemble_incremental(file_location, cache_file, encoder=None):
+    """
+    Assembles file_location (a path or a list of lines) reusing the
+    per-line encodings stored in cache_file by a previous run. A line's
+    entry only depends on its text, so entries are looked up by line hash
+    and only lines not seen last time are parsed and encoded. Labels and
+    variables are then re-resolved over the entries and the cache is
+    updated. Returns (words, stats) where stats is a one line summary.
+    """
+    if encoder is None:
+        encoder = Encoder()
+
+    if isinstance(file_location, str):
+        with open(file_location, "r") as infile:
+            lines = infile.readlines()
+    else:
+        lines = list(file_location)
+
+    hashes = [line_hash(line) for line in lines]
+
+    cache = load_cache(cache_file)
+
+    if cache is None:
+        cached_lines = {}
+        old_symbols = {}
+    else:
+        cached_lines = cache["lines"]
+        old_symbols = cache["symbols"]
+
+    entries = []
+    missing = []
+
+    for ind, digest in enumerate(hashes):
+        if digest in cached_lines:
+            entries.append(cached_lines[digest])
+        else:
+            entries.append(None)
+            missing.append(ind)
+
+    for ind, entry in zip(missing,
+                          encode_lines([lines[i] for i in missing], encoder)):
+        entries[ind] = entry
+
+    words, symbol_table = resolve(entries)
+
+    moved = sum(1 for symbol, address in symbol_table.items()
+                if old_symbols.get(symbol, address) != address)
+
+    save_cache(cache_file, hashes, entries, symbol_table)
+
+    reused = len(lines) - len(missing)
+    rate = reused / len(lines) * 100 if lines else 100.0
+    stats = ("incremental: reused {}/{} lines ({:.1f}%), re-encoded {}, "
+             "{} symbols moved".format(reused, len(lines), rate,
+                                       len(missing), moved))
+
+    return words, stats
@@ -0,0 +1,71 @@
+__author__ = "Yun-L"
+
+import os
+import tempfile
+import unittest
+
+from assembler import assemble_two_pass
+from incremental import assemble_incremental
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.asm_file = os.path.join(self.tmp_dir.name, "Pong.asm")
+        self.cache_file = os.path.join(self.tmp_dir.name, "Pong.hack.cache")
+
+        with open("../pong/Pong.asm", "r") as infile:
+            self.lines = infile.readlines()
+
+        self.write_asm(self.lines)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_asm(self, lines):
+        with open(self.asm_file, "w") as outfile:
+            outfile.writelines(lines)
+
+    def test_clean_build(self):
+        words, stats = assemble_incremental(self.asm_file, self.cache_file)
+
+        self.assertEqual(words, assemble_two_pass(self.asm_file))
+        self.assertIn("reused 0/", stats)
+        self.assertTrue(os.path.isfile(self.cache_file))
+
+    def test_unchanged(self):
+        assemble_incremental(self.asm_file, self.cache_file)
+        words, stats = assemble_incremental(self.asm_file, self.cache_file)
+
+        self.assertEqual(words, assemble_two_pass(self.asm_file))
+        self.assertIn("re-encoded 0,", stats)
+
+    def test_changed(self):
+        assemble_incremental(self.asm_file, self.cache_file)
+
+        # A new label shifts every label after it, a new variable shifts
+        # every variable allocated after it
+        self.lines[5000:5000] = ["(INCREMENTAL_TEST)\n",
+                                 "@INCREMENTAL_TEST\n",
+                                 "@incremental_test_var\n",
+                                 "M=-1\n"]
+        del self.lines[20000:20010]
+        self.write_asm(self.lines)
+
+        words, stats = assemble_incremental(self.asm_file, self.cache_file)
+
+        self.assertEqual(words, assemble_two_pass(self.asm_file))
+        self.assertIn("re-encoded 3,", stats)
+
+    def test_corrupt_cache(self):
+        with open(self.cache_file, "w") as outfile:
+            outfile.write("{not json")
+
+        words, _ = assemble_incremental(self.asm_file, self.cache_file)
+
+        self.assertEqual(words, assemble_two_pass(self.asm_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+__author__ = "Yun-L"
+
+import argparse
+from collections import OrderedDict
+
+from parser import Parser
+
+# Rule names, in the order they are reported
+RULES = ["inc-dec",
+         "store-load",
+         "redundant-load",
+         "jump-to-next",
+         "unreachable"]
+
+OPPOSITES = {"M=M+1": "M=M-1",
+             "M=M-1": "M=M+1"}
+
+
+class Optimizer(object):
+    """
+    Peephole optimizer over Hack assembly. Rules never look across a label,
+    since any label may be a jump target, and removed instructions are
+    accounted for by the assembler when it resolves labels.
+
+    Code addresses are assumed to only ever come from labels (as in the
+    VM translator's output). A program loading a numeric address right
+    before a jump is rejected, as removing instructions would break it.
+    """
+
+    def __init__(self):
+        self.removed = OrderedDict((rule, 0) for rule in RULES)
+
+    def optimize(self, source):
+        """
+        Returns the optimized program as a list of commands (without
+        comments). source is anything Parser accepts.
+        """
+        commands = [command.text for command in Parser(source).commands()]
+
+        self.__check_addresses(commands)
+
+        while True:
+            optimized = self.__sweep(commands)
+
+            if len(optimized) == len(commands):
+                return optimized
+
+            commands = optimized
+
+    def report(self):
+        """Returns one line per rule with the instructions it removed"""
+        lines = ["{:<16}{:>8}".format(rule, count)
+                 for rule, count in self.removed.items()]
+        lines.append("{:<16}{:>8}".format("total", sum(self.removed.values())))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def __check_addresses(commands):
+        for prev, curr in zip(commands, commands[1:]):
+            if prev[0] == "@" and prev[1:].isnumeric() and ";" in curr:
+                raise Exception("Numeric jump target [{}] [{}], can't "
+                                "optimize".format(prev, curr))
+
+    def __sweep(self, commands):
+        out = []
+
+        # Value known to be held in A, or None
+        a_known = None
+        unreachable = False
+
+        for command in commands:
+
+            if command[0] == "(":
+                label = command[1:-1]
+
+                if len(out) >= 2 and out[-2] == "@" + label \
+                   and Optimizer.__is_goto(out[-1]):
+                    del out[-2:]
+                    self.removed["jump-to-next"] += 2
+
+                a_known = None
+                unreachable = False
+                out.append(command)
+                continue
+
+            if unreachable:
+                self.removed["unreachable"] += 1
+                continue
+
+            if command[0] == "@":
+                if command[1:] == a_known:
+                    self.removed["redundant-load"] += 1
+                    continue
+
+                a_known = command[1:]
+                out.append(command)
+                continue
+
+            prev = out[-1] if out else None
+
+            # A is unchanged between two adjacent C_COMMANDs, so these
+            # pairs act on the same memory location
+            if prev is not None and OPPOSITES.get(prev) == command:
+                out.pop()
+                self.removed["inc-dec"] += 2
+                continue
+
+            if (prev == "M=D" and command == "D=M") or \
+               (prev == "D=M" and command == "M=D"):
+                self.removed["store-load"] += 1
+                continue
+
+            out.append(command)
+
+            delim_ind = command.find("=")
+            if delim_ind > 0 and "A" in command[:delim_ind]:
+                a_known = None
+
+            if Optimizer.__is_goto(command):
+                unreachable = True
+
+        return out
+
+    @staticmethod
+    def __is_goto(command):
+        return command.endswith(";JMP")
+
+
+def optimize(source):
+    """Returns (commands, report) for source"""
+    optimizer = Optimizer()
+    commands = optimizer.optimize(source)
+
+    return commands, optimizer.report()
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Peephole optimizes Hack assembly")
+    arg_parser.add_argument("file_location", help="input .asm file")
+    arg_parser.add_argument("dest_file", help="output .asm file")
+    args = arg_parser.parse_args()
+
+    commands, report = optimize(args.file_location)
+
+    with open(args.dest_file, "w") as outfile:
+        outfile.write("\n".join(commands) + "\n")
+
+    print(report)
@@ -0,0 +1,79 @@
+__author__ = "Yun-L"
+
+import unittest
+
+from assembler import assemble
+from optimizer import Optimizer
+
+
+def optimize(commands):
+    optimizer = Optimizer()
+    return optimizer.optimize(commands), optimizer.removed
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_push_then_pop(self):
+        # push D, then pop into D
+        commands, removed = optimize(["@SP", "A=M", "M=D",
+                                      "@SP", "M=M+1",
+                                      "@SP", "M=M-1",
+                                      "A=M", "D=M"])
+
+        self.assertEqual(commands, ["@SP", "A=M", "M=D",
+                                    "@SP",
+                                    "A=M", "D=M"])
+        self.assertEqual(removed["redundant-load"], 1)
+        self.assertEqual(removed["inc-dec"], 2)
+
+    def test_store_load(self):
+        commands, removed = optimize(["@R13", "M=D", "@R13", "D=M"])
+
+        self.assertEqual(commands, ["@R13", "M=D"])
+        self.assertEqual(removed["store-load"], 1)
+
+    def test_labels(self):
+        # A is unknown after a label, and nothing is merged across it
+        original = ["@SP", "M=M+1", "(LOOP)", "@SP", "M=M-1",
+                    "@LOOP", "D;JNE"]
+        commands, removed = optimize(original)
+
+        self.assertEqual(commands, original)
+        self.assertEqual(sum(removed.values()), 0)
+
+    def test_a_overwritten(self):
+        original = ["@SP", "A=M", "@SP", "AM=M+1", "@SP", "D=M"]
+        commands, _ = optimize(original)
+
+        self.assertEqual(commands, original)
+
+    def test_jumps(self):
+        commands, removed = optimize(["@END", "0;JMP",
+                                      "D=M", "@X", "M=D",
+                                      "(END)",
+                                      "@NEXT", "0;JMP",
+                                      "(NEXT)",
+                                      "@NEXT", "D;JGT"])
+
+        # once the dead code is gone, the first jump also targets the
+        # next instruction
+        self.assertEqual(commands, ["(END)",
+                                    "(NEXT)",
+                                    "@NEXT", "D;JGT"])
+        self.assertEqual(removed["unreachable"], 3)
+        self.assertEqual(removed["jump-to-next"], 4)
+
+    def test_numeric_jump(self):
+        with self.assertRaises(Exception):
+            optimize(["@4", "0;JMP"])
+
+    def test_labels_still_resolve(self):
+        words = assemble(optimize(["@SP", "M=M+1", "@SP", "M=M-1",
+                                   "(LOOP)", "@LOOP", "0;JMP"])[0])
+
+        # LOOP moves from address 4 to address 1
+        self.assertEqual(list(words), [0, 1, 0b1110101010000111])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -176,6 +176,37 @@ class TestParser(unittest.TestCase):
 
         self.assertEqual(self.parse.has_more_commands, False)
 
+    def test_commands(self):
+        commands = list(Parser("test_parser_gen.asm").commands())
+
+        self.assertEqual([c.command_type for c in commands],
+                         ["A_COMMAND", "C_COMMAND", "A_COMMAND", "C_COMMAND",
+                          "L_COMMAND", "A_COMMAND", "C_COMMAND"])
+
+        # @123456
+        self.assertEqual(commands[0].symbol, "123456")
+        self.assertEqual(commands[0].line_number, 4)
+
+        # D=A
+        self.assertEqual(commands[1].dest, "D")
+        self.assertEqual(commands[1].comp, "A")
+        self.assertEqual(commands[1].jump, "")
+        self.assertEqual(commands[1].symbol, None)
+
+        # M=D, after the comments in between
+        self.assertEqual(commands[3].line_number, 9)
+
+        # (END)
+        self.assertEqual(commands[4].symbol, "END")
+
+        # 0;JMP
+        self.assertEqual(commands[6].dest, "")
+        self.assertEqual(commands[6].comp, "0")
+        self.assertEqual(commands[6].jump, "JMP")
+
+    def test_commands_empty(self):
+        self.assertEqual(list(Parser("test_comments.asm").commands()), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,93 +1,138 @@
 __author__ = "Yun-L"
 
+from collections import namedtuple
+
+Command = namedtuple("Command", ["command_type",
+                                 "symbol",
+                                 "dest",
+                                 "comp",
+                                 "jump",
+                                 "line_number",
+                                 "text"])
+Command.__doc__ = """
+A pre-classified assembly command. symbol is None for C_COMMANDs, dest, comp
+and jump are None for A_COMMANDs and L_COMMANDs. line_number is the 1-based
+line of the command in the source file.
+"""
+
 
 class Parser(object):
     """Breaks each assembly command into its underlying fields and symbols"""
 
     def __init__(self, filename):
+        """
+        filename is the path of an .asm file, or any iterable of source lines
+        (an open file, a list of strings, ...)
+        """
+        self.__owns_stream = isinstance(filename, str)
+
+        if self.__owns_stream:
+            self.command_stream = open(filename, "r")
+        else:
+            self.command_stream = filename
 
-        self.command_stream = open(filename, "r")
         self.current_command = None
+        self.__current_record = None
+        self.__records = self.commands()
+        self.__lookahead = None
 
     def __del__(self):
-        self.command_stream.close()
+        if self.__owns_stream and hasattr(self, "command_stream"):
+            self.command_stream.close()
+
+    def commands(self):
+        """
+        Generator yielding a Command for every command left in the file. The
+        file is read once, line by line, and each command is classified and
+        split into its fields as it is read.
+        """
+        for line_number, line in enumerate(self.command_stream, 1):
+            comment_ind = line.find("//")
+            if comment_ind >= 0:
+                line = line[:comment_ind]
+
+            text = line.strip("\t\n ")
+            if not text or text.isspace():
+                continue
+
+            if text[0] == "@":
+                yield Command("A_COMMAND", text.strip("()@"), None, None, None,
+                              line_number, text)
+            elif text[0] == "(":
+                yield Command("L_COMMAND", text.strip("()@"), None, None, None,
+                              line_number, text)
+            else:
+                delim_ind1 = text.find("=")
+                delim_ind2 = text.find(";")
+
+                # Exception of both jump and dest exist
+                if delim_ind1 == -1 and delim_ind2 >= 0:
+                    dest = ""
+                    comp = text[:delim_ind2]
+                    jump = text[delim_ind2 + 1:]
+                elif delim_ind1 >= 0 and delim_ind2 == -1:
+                    dest = text[:delim_ind1]
+                    comp = text[delim_ind1 + 1:]
+                    jump = ""
+                else:
+                    raise Exception("Line {}: Invalid Command [{}]".format(
+                        line_number, text))
+
+                yield Command("C_COMMAND", None, dest, comp, jump,
+                              line_number, text)
+
+    # The properties and methods below keep the original advance() /
+    # has_more_commands interface working on top of commands().
 
     @property
     def command_type(self):
         """Returns string 'A_COMMAND' | 'C_COMMAND' | 'L_COMMAND'"""
-        if self.current_command[0] == "@":
-            return "A_COMMAND"
-        elif self.current_command[0] == "(":
-            return "L_COMMAND"
-        else:
-            return "C_COMMAND"
+        if self.__current_record is None:
+            raise Exception("No current command")
+
+        return self.__current_record.command_type
 
     @property
     def symbol(self):
         if self.command_type == "C_COMMAND":
             raise Exception("Incorrect Type")
 
-        return self.current_command.strip("()@")
+        return self.__current_record.symbol
 
     @property
     def dest(self):
         if self.command_type != "C_COMMAND":
             raise Exception("Incorrect Type")
 
-        delim_ind = self.current_command.find("=")
-        if delim_ind <= 0:
-            return ""
-        else:
-            return self.current_command[:delim_ind]
+        return self.__current_record.dest
 
     @property
     def comp(self):
         if self.command_type != "C_COMMAND":
             raise Exception("Incorrect Type")
 
-        delim_ind1 = self.current_command.find("=")
-        delim_ind2 = self.current_command.find(";")
-
-        # Exception of both jump and dest exist
-        if delim_ind1 == -1 and delim_ind2 >= 0:
-            return self.current_command[:delim_ind2]
-        elif delim_ind1 >= 0 and delim_ind2 == -1:
-            return self.current_command[delim_ind1+1:]
-        else:
-            raise Exception("Line {}: Invalid Command [{}]".format(
-                self.command_stream.tell(),
-                self.current_command))
+        return self.__current_record.comp
 
     @property
     def jump(self):
         if self.command_type != "C_COMMAND":
             raise Exception("Incorrect Type")
 
-        delim_ind = self.current_command.find(";")
-        if delim_ind == -1:
-            return ""
-        else:
-            return self.current_command[delim_ind + 1:]
+        return self.__current_record.jump
 
     @property
-    def has_more_commands(self):
-        file_curr_line = self.command_stream.tell()
+    def line_number(self):
+        if self.__current_record is None:
+            return None
 
-        while True:
+        return self.__current_record.line_number
 
-            peek_next = self.command_stream.readline()
-
-            if peek_next == "":
-                self.command_stream.seek(file_curr_line)
-                return False
-
-            peek_next = self.__remove_comments(peek_next)
+    @property
+    def has_more_commands(self):
+        if self.__lookahead is None:
+            self.__lookahead = next(self.__records, None)
 
-            if peek_next.isspace() or peek_next == "":
-                continue
-            else:
-                self.command_stream.seek(file_curr_line)
-                return True
+        return self.__lookahead is not None
 
     def advance(self):
         """
@@ -97,25 +142,11 @@ class Parser(object):
         if not self.has_more_commands:
             return
 
-        while True:
-            temp_cmd = self.command_stream.readline()
-
-            temp_cmd = self.__remove_comments(temp_cmd)
-
-            if not temp_cmd.isspace() and len(temp_cmd) > 0:
-                break
-
-        self.current_command = temp_cmd.strip("\t\n ")
+        self.__current_record = self.__lookahead
+        self.__lookahead = None
+        self.current_command = self.__current_record.text
         return
 
-    def __remove_comments(self, cmd):
-        temp_cmd = cmd
-        for i in range(len(cmd) - 1):
-            if temp_cmd[i] == "/" and temp_cmd[i + 1] == "/":
-                temp_cmd = temp_cmd[:i]
-                break
-        return temp_cmd
-
 
 if __name__ == "__main__":
     parse = Parser("empty.txt")
@@ -0,0 +1,68 @@
+"""
+Reading and writing Hack machine code. Programs are held in memory as
+array('H') of 16-bit words and stored on disk either as the classic text
+.hack format (one 16 character binary string per line) or as a packed ROM
+image: the raw words, little-endian, with no header.
+"""
+
+__author__ = "Yun-L"
+
+import sys
+from array import array
+
+ROM_SIZE = 32768
+
+BINARY_EXTENSION = ".rom"
+
+
+def write_hack(words, dest_file):
+    """Writes words as a text .hack file"""
+    with open(dest_file, "w") as outfile:
+        for word in words:
+            outfile.write(format(word, "016b") + "\n")
+
+
+def write_binary(words, dest_file):
+    """Writes words as a little-endian packed ROM image"""
+    words = array("H", words)
+
+    if sys.byteorder != "little":
+        words.byteswap()
+
+    with open(dest_file, "wb") as outfile:
+        words.tofile(outfile)
+
+
+def read_hack(src_file):
+    """Returns the words of a text .hack file as array('H')"""
+    with open(src_file, "r") as infile:
+        return array("H", (int(line, 2) for line in infile.read().split()))
+
+
+def read_binary(src_file):
+    """Returns the words of a packed ROM image as array('H')"""
+    words = array("H")
+
+    with open(src_file, "rb") as infile:
+        words.frombytes(infile.read())
+
+    if sys.byteorder != "little":
+        words.byteswap()
+
+    return words
+
+
+def load(src_file):
+    """Reads either format, chosen by file extension"""
+    if src_file.endswith(BINARY_EXTENSION):
+        return read_binary(src_file)
+
+    return read_hack(src_file)
+
+
+def save(words, dest_file):
+    """Writes either format, chosen by file extension"""
+    if dest_file.endswith(BINARY_EXTENSION):
+        write_binary(words, dest_file)
+    else:
+        write_hack(words, dest_file)
@@ -0,0 +1,137 @@
+"""
+Machine snapshots for the emulator: registers, cycle count and RAM, so a run
+can restart from a point reached once (e.g. after the OS finished booting)
+instead of replaying everything before it.
+
+The file is little-endian:
+
+  header    magic, version, A, D, PC, cycles, ROM digest, RAM words stored
+  RAM       the stored words, from address 0
+
+RAM past the last non-zero word is not stored and restores as 0. The ROM
+digest identifies the program the snapshot belongs to.
+"""
+
+__author__ = "Yun-L"
+
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+
+from emulator import RAM_SIZE
+
+MAGIC = b"HSNP"
+VERSION = 1
+
+SNAPSHOT_EXTENSION = ".snap"
+
+HEADER = struct.Struct("<4sHHHHQ8sI")
+
+
+def rom_digest(words):
+    return hashlib.blake2b(words.tobytes(), digest_size=8).digest()
+
+
+def used_words(ram):
+    """Returns the length of ram without its trailing zero words"""
+    end = len(ram)
+    raw = ram.tobytes()
+
+    # skip zero pages a whole page at a time
+    page = 1024
+    zero_page = bytes(2 * page)
+    while end >= page and raw[2 * (end - page):2 * end] == zero_page:
+        end -= page
+
+    while end > 0 and ram[end - 1] == 0:
+        end -= 1
+
+    return end
+
+
+def save(emulator, dest_file):
+    """Writes a snapshot of emulator to dest_file"""
+    ram = emulator.ram
+    n_words = used_words(ram)
+
+    stored = ram[:n_words]
+    if sys.byteorder == "big":
+        stored.byteswap()
+
+    with open(dest_file, "wb") as outfile:
+        outfile.write(HEADER.pack(MAGIC, VERSION, emulator.a, emulator.d,
+                                  emulator.pc, emulator.cycles,
+                                  rom_digest(emulator.rom), n_words))
+        outfile.write(stored.tobytes())
+
+
+class Snapshot(object):
+    """Memory-mapped reader for a snapshot file"""
+
+    def __init__(self, filename):
+        with open(filename, "rb") as infile:
+            self.__map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.a, self.d, self.pc, self.cycles, \
+            self.rom_digest, self.__n_words = HEADER.unpack_from(self.__map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise Exception("{} is not a version {} snapshot".format(
+                filename, VERSION))
+
+        if self.__n_words > RAM_SIZE or \
+           len(self.__map) < HEADER.size + 2 * self.__n_words:
+            self.close()
+            raise Exception("{} is truncated".format(filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__map.close()
+
+    def ram(self):
+        """Returns the stored RAM words as an array('H')"""
+        words = array("H")
+        words.frombytes(self.__map[HEADER.size:
+                                   HEADER.size + 2 * self.__n_words])
+        if sys.byteorder == "big":
+            words.byteswap()
+
+        return words
+
+    def peek(self, address):
+        """Returns one RAM word without reading the rest"""
+        if address >= self.__n_words:
+            return 0
+
+        return struct.unpack_from("<H", self.__map,
+                                  HEADER.size + 2 * address)[0]
+
+    def restore(self, emulator, check_rom=True):
+        """
+        Puts emulator in the saved state. Unless check_rom is False, the
+        emulator must have the same program loaded.
+        """
+        if check_rom and rom_digest(emulator.rom) != self.rom_digest:
+            raise Exception("Snapshot was taken with a different program")
+
+        words = self.ram()
+        emulator.ram[:len(words)] = words
+        emulator.ram[len(words):] = array("H", bytes(
+            2 * (RAM_SIZE - len(words))))
+
+        emulator.a, emulator.d, emulator.pc = self.a, self.d, self.pc
+        emulator.cycles = self.cycles
+
+
+def restore(emulator, filename, check_rom=True):
+    """Puts emulator in the state saved in filename"""
+    with Snapshot(filename) as snapshot:
+        snapshot.restore(emulator, check_rom)
@@ -0,0 +1,86 @@
+__author__ = "Yun-L"
+
+import os
+import tempfile
+import unittest
+
+import snapshot
+from block_emulator import BlockEmulator
+from emulator import Emulator, RAM_SIZE
+
+PONG = "../pong/Pong.asm"
+
+
+def state(emulator):
+    return (emulator.pc, emulator.a, emulator.d, emulator.cycles,
+            emulator.ram.tobytes())
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.tmp_dir.name, "pong.snap")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        reference = BlockEmulator(PONG)
+        reference.run(200000)
+
+        snapshot.save(reference, self.snapshot_file)
+
+        # trailing zero RAM is not stored
+        self.assertLess(os.path.getsize(self.snapshot_file), 2 * RAM_SIZE)
+
+        restored = Emulator(PONG)
+        restored.ram[RAM_SIZE - 1] = 1234
+        snapshot.restore(restored, self.snapshot_file)
+        self.assertEqual(state(restored), state(reference))
+
+        reference.run(50000)
+        restored.run(50000)
+        self.assertEqual(state(restored), state(reference))
+
+    def test_peek(self):
+        emulator = Emulator(PONG)
+        emulator.ram[0] = 256
+        emulator.ram[5] = 0xFFFF
+
+        snapshot.save(emulator, self.snapshot_file)
+
+        with snapshot.Snapshot(self.snapshot_file) as saved:
+            self.assertEqual(saved.peek(0), 256)
+            self.assertEqual(saved.peek(5), 0xFFFF)
+            self.assertEqual(saved.peek(20000), 0)
+            self.assertEqual(len(saved.ram()), 6)
+
+    def test_different_program(self):
+        snapshot.save(Emulator(PONG), self.snapshot_file)
+
+        other = Emulator("../rect/Rect.asm")
+        self.assertRaises(Exception, snapshot.restore, other,
+                          self.snapshot_file)
+
+        snapshot.restore(other, self.snapshot_file, check_rom=False)
+
+    def test_not_a_snapshot(self):
+        with open(self.snapshot_file, "wb") as outfile:
+            outfile.write(b"\0" * 64)
+
+        self.assertRaises(Exception, snapshot.Snapshot, self.snapshot_file)
+
+    def test_used_words(self):
+        emulator = Emulator()
+        self.assertEqual(snapshot.used_words(emulator.ram), 0)
+
+        emulator.ram[3000] = 1
+        self.assertEqual(snapshot.used_words(emulator.ram), 3001)
+
+        emulator.ram[RAM_SIZE - 1] = 1
+        self.assertEqual(snapshot.used_words(emulator.ram), RAM_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
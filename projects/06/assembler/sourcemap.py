@@ -0,0 +1,218 @@
+"""
+Debug sidecar for assembled programs. For every ROM address it records the
+.asm line the instruction came from and, when the VM translator annotated
+its output, the VM command and function that produced it. It also holds the
+final label and variable table.
+
+The file is little-endian and laid out so it can be memory-mapped and
+indexed directly:
+
+  header            magic, version, word/string/symbol counts
+  address records   one per ROM address: asm line, VM command, function
+  symbol records    name, value, kind
+  string offsets    n_strings + 1 offsets into the string blob
+  string blob       UTF-8
+
+VM commands, functions and symbol names are indices into the string table,
+NO_STRING when absent.
+"""
+
+__author__ = "Yun-L"
+
+import mmap
+import struct
+from array import array
+
+MAGIC = b"HDBG"
+VERSION = 1
+
+SOURCE_MAP_EXTENSION = ".map"
+
+# Comment written by the VM translator ahead of each VM command's code:
+#   //vm <function> <vm command>
+ANNOTATION_PREFIX = "//vm "
+NO_FUNCTION = "-"
+
+NO_STRING = 0xFFFFFFFF
+
+KIND_PREDEFINED = 0
+KIND_LABEL = 1
+KIND_VARIABLE = 2
+
+HEADER = struct.Struct("<4sHHIII")
+ADDRESS_RECORD = struct.Struct("<III")
+SYMBOL_RECORD = struct.Struct("<IHBx")
+OFFSET = struct.Struct("<I")
+
+
+class DebugInfo(object):
+    """Collects what the assembler knows while it runs"""
+
+    def __init__(self):
+        # source line of each ROM address
+        self.word_lines = array("I")
+        self.labels = {}
+        self.variables = {}
+
+
+def read_annotations(lines):
+    """
+    Returns {line_number: (function, vm_command)} for every VM annotation in
+    lines, line numbers starting at 1
+    """
+    annotations = {}
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+
+        if line.startswith(ANNOTATION_PREFIX):
+            function, _, vm_command = \
+                line[len(ANNOTATION_PREFIX):].partition(" ")
+
+            if function == NO_FUNCTION:
+                function = None
+
+            annotations[line_number] = (function, vm_command.strip())
+
+    return annotations
+
+
+def write_source_map(dest_file, debug, lines, predefined_symbols):
+    """
+    Writes the sidecar for a program assembled with debug. lines are the
+    source lines the assembler read, used to find the VM annotations.
+    """
+    annotations = read_annotations(lines)
+
+    strings = []
+    string_index = {}
+
+    def intern(string):
+        if string is None:
+            return NO_STRING
+
+        if string not in string_index:
+            string_index[string] = len(strings)
+            strings.append(string)
+
+        return string_index[string]
+
+    # Each instruction belongs to the last annotation above it
+    address_records = []
+    annotation_lines = sorted(annotations)
+    next_annotation = 0
+    current = (NO_STRING, NO_STRING)
+
+    for line_number in debug.word_lines:
+        while next_annotation < len(annotation_lines) and \
+                annotation_lines[next_annotation] < line_number:
+            function, vm_command = \
+                annotations[annotation_lines[next_annotation]]
+            current = (intern(vm_command), intern(function))
+            next_annotation += 1
+
+        address_records.append(ADDRESS_RECORD.pack(line_number, *current))
+
+    symbol_records = []
+
+    for kind, symbols in [(KIND_PREDEFINED, predefined_symbols),
+                          (KIND_LABEL, debug.labels),
+                          (KIND_VARIABLE, debug.variables)]:
+        for name, value in symbols.items():
+            symbol_records.append(
+                SYMBOL_RECORD.pack(intern(name), value, kind))
+
+    blob = bytearray()
+    offsets = []
+
+    for string in strings:
+        offsets.append(OFFSET.pack(len(blob)))
+        blob.extend(string.encode("utf-8"))
+    offsets.append(OFFSET.pack(len(blob)))
+
+    with open(dest_file, "wb") as outfile:
+        outfile.write(HEADER.pack(MAGIC, VERSION, 0,
+                                  len(address_records),
+                                  len(strings),
+                                  len(symbol_records)))
+        outfile.write(b"".join(address_records))
+        outfile.write(b"".join(symbol_records))
+        outfile.write(b"".join(offsets))
+        outfile.write(blob)
+
+
+class SourceMap(object):
+    """Memory-mapped reader for a source map sidecar"""
+
+    def __init__(self, filename):
+        with open(filename, "rb") as infile:
+            self.__map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self.__n_words, self.__n_strings, \
+            self.__n_symbols = HEADER.unpack_from(self.__map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise Exception("{} is not a version {} source map".format(
+                filename, VERSION))
+
+        self.__addresses_start = HEADER.size
+        self.__symbols_start = (self.__addresses_start +
+                                self.__n_words * ADDRESS_RECORD.size)
+        self.__offsets_start = (self.__symbols_start +
+                                self.__n_symbols * SYMBOL_RECORD.size)
+        self.__blob_start = (self.__offsets_start +
+                             (self.__n_strings + 1) * OFFSET.size)
+
+    def __len__(self):
+        return self.__n_words
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__map.close()
+
+    def string(self, ind):
+        if ind == NO_STRING:
+            return None
+
+        start, end = struct.unpack_from(
+            "<II", self.__map, self.__offsets_start + ind * OFFSET.size)
+
+        return self.__map[self.__blob_start + start:
+                          self.__blob_start + end].decode("utf-8")
+
+    def lookup(self, address):
+        """Returns (asm line, VM command, function) for a ROM address"""
+        if address < 0 or address >= self.__n_words:
+            raise Exception("No instruction at ROM address {}".format(
+                address))
+
+        line_number, vm_command, function = ADDRESS_RECORD.unpack_from(
+            self.__map, self.__addresses_start + address * ADDRESS_RECORD.size)
+
+        return line_number, self.string(vm_command), self.string(function)
+
+    def function_at(self, address):
+        """Returns the VM function the instruction at address belongs to"""
+        _, _, function = ADDRESS_RECORD.unpack_from(
+            self.__map, self.__addresses_start + address * ADDRESS_RECORD.size)
+
+        return self.string(function)
+
+    def symbols(self, kind=None):
+        """Returns {name: value}, optionally only for one KIND_*"""
+        symbols = {}
+
+        for ind in range(self.__n_symbols):
+            name, value, symbol_kind = SYMBOL_RECORD.unpack_from(
+                self.__map, self.__symbols_start + ind * SYMBOL_RECORD.size)
+
+            if kind is None or kind == symbol_kind:
+                symbols[self.string(name)] = value
+
+        return symbols
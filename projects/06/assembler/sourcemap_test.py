@@ -0,0 +1,80 @@
+__author__ = "Yun-L"
+
+import os
+import tempfile
+import unittest
+
+from assembler import PREDEFINED_SYMBOLS, assemble_one_pass
+import sourcemap
+
+ANNOTATED = """//vm - bootstrap
+@256
+D=A
+@SP
+M=D
+//vm Main.main function Main.main 0
+(Main.main)
+//vm Main.main push constant 7
+@7
+D=A
+@SP
+A=M
+M=D
+@SP
+M=M+1
+//vm Main.main label END
+(Main.main:END)
+//vm Main.main goto END
+@Main.main:END
+0;JMP
+@counter
+""".splitlines()
+
+
+class TestSourceMap(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.map_file = os.path.join(self.tmp_dir.name, "Test.hack.map")
+
+        debug = sourcemap.DebugInfo()
+        self.words = assemble_one_pass(ANNOTATED, debug=debug)
+        sourcemap.write_source_map(self.map_file, debug, ANNOTATED,
+                                   PREDEFINED_SYMBOLS)
+
+        self.source_map = sourcemap.SourceMap(self.map_file)
+
+    def tearDown(self):
+        self.source_map.close()
+        self.tmp_dir.cleanup()
+
+    def test_addresses(self):
+        self.assertEqual(len(self.source_map), len(self.words))
+
+        self.assertEqual(self.source_map.lookup(0), (2, "bootstrap", None))
+        self.assertEqual(self.source_map.lookup(4),
+                         (9, "push constant 7", "Main.main"))
+        self.assertEqual(self.source_map.lookup(11),
+                         (19, "goto END", "Main.main"))
+        self.assertEqual(self.source_map.function_at(9), "Main.main")
+
+        with self.assertRaises(Exception):
+            self.source_map.lookup(len(self.words))
+
+    def test_symbols(self):
+        self.assertEqual(self.source_map.symbols(sourcemap.KIND_LABEL),
+                         {"Main.main": 4, "Main.main:END": 11})
+        self.assertEqual(self.source_map.symbols(sourcemap.KIND_VARIABLE),
+                         {"counter": 16})
+        self.assertEqual(self.source_map.symbols()["SCREEN"], 16384)
+
+    def test_bad_magic(self):
+        with open(self.map_file + ".bad", "wb") as outfile:
+            outfile.write(b"\0" * 64)
+
+        with self.assertRaises(Exception):
+            sourcemap.SourceMap(self.map_file + ".bad")
+
+
+if __name__ == "__main__":
+    unittest.main()
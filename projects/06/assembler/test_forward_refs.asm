@@ -0,0 +1,17 @@
+// forward references mixed with variables
+	@i
+	M=1
+	@LOOP
+	0;JMP
+	@sum
+	M=0
+(LOOP)
+	@END
+	D;JGT
+	@i
+	D=M
+	@sum
+	M=D+M
+(END)
+	@END
+	0;JMP
@@ -0,0 +1,390 @@
+"""
+Headless runner for CPU emulator test scripts (.tst), the ones that load a
+.asm or .hack program. Supported commands:
+
+  load, output-file, compare-to, output-list, set, repeat, ticktock,
+  output, echo, clear-echo
+
+Output lines are compared to the .cmp file as they are produced and a
+script stops at its first mismatch, like the Java CPUEmulator. Scripts for
+the hardware simulator or the VM emulator are skipped. Independent scripts
+run in parallel across a process pool.
+"""
+
+__author__ = "Yun-L"
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from block_emulator import BlockEmulator
+
+STATUS_PASS = "pass"
+STATUS_FAIL = "fail"
+STATUS_ERROR = "error"
+STATUS_SKIP = "skip"
+
+PROGRAM_EXTENSIONS = (".asm", ".hack")
+
+TOKEN = re.compile(r'"[^"]*"|[{},;]|[^\s,;{}]+')
+COMMENT = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+
+# name%FMTleft.len.right
+OUTPUT_ENTRY = re.compile(r"^(.+)%([BXDS])(\d+)\.(\d+)\.(\d+)$")
+RAM_NAME = re.compile(r"^RAM\[(\d+)\]$")
+
+
+class OutputColumn(object):
+    """One output-list entry"""
+
+    def __init__(self, entry):
+        match = OUTPUT_ENTRY.match(entry)
+        if match is None:
+            raise Exception("Invalid output-list entry [{}]".format(entry))
+
+        self.name = match.group(1)
+        self.fmt = match.group(2)
+        self.left, self.length, self.right = \
+            (int(match.group(n)) for n in range(3, 6))
+
+    @property
+    def width(self):
+        return self.left + self.length + self.right
+
+    def header(self):
+        name = self.name[:self.width]
+        extra = self.width - len(name)
+        return " " * (extra // 2) + name + " " * (extra - extra // 2)
+
+    def value(self, word):
+        if self.fmt == "B":
+            text = format(word, "016b")[-self.length:]
+        elif self.fmt == "X":
+            text = format(word, "04X")[-self.length:]
+        else:
+            text = str(word - 0x10000 if word & 0x8000 else word)
+
+        return " " * self.left + text.rjust(self.length) + " " * self.right
+
+
+def tokenize(text):
+    return TOKEN.findall(COMMENT.sub(" ", text))
+
+
+def parse_script(text):
+    """
+    Returns the script as a list of commands, each a list of words. A repeat
+    is ["repeat", count, body].
+    """
+    tokens = tokenize(text)
+    pos = 0
+
+    def block(closing):
+        nonlocal pos
+        commands = []
+        words = []
+
+        while pos < len(tokens):
+            token = tokens[pos]
+            pos += 1
+
+            if token in (",", ";"):
+                if words:
+                    commands.append(words)
+                    words = []
+            elif token == "{":
+                if not words or words[0] not in ("repeat", "while"):
+                    raise Exception("Unexpected {")
+                if words[0] == "while" or len(words) != 2:
+                    raise Exception("Unsupported loop [{}]".format(
+                        " ".join(words)))
+                commands.append(["repeat", int(words[1]), block(True)])
+                words = []
+            elif token == "}":
+                if not closing:
+                    raise Exception("Unexpected }")
+                if words:
+                    commands.append(words)
+                return commands
+            else:
+                words.append(token)
+
+        if closing:
+            raise Exception("Missing }")
+        if words:
+            commands.append(words)
+        return commands
+
+    return block(False)
+
+
+def find_program(directory, name):
+    """
+    Returns the path of the program a script loads. Falls back to a file
+    differing only in case, then to the .asm source of a missing .hack.
+    """
+    path = os.path.join(directory, name)
+    if os.path.isfile(path):
+        return path
+
+    stem, extension = os.path.splitext(name)
+    candidates = [name, stem + ".asm"] if extension == ".hack" else [name]
+    listing = {entry.lower(): entry for entry in os.listdir(directory)}
+
+    for candidate in candidates:
+        if candidate.lower() in listing:
+            return os.path.join(directory, listing[candidate.lower()])
+
+    raise Exception("Can't find program {}".format(name))
+
+
+class ScriptRunner(object):
+    """Runs one test script against a BlockEmulator"""
+
+    def __init__(self, script_file, write_out=False):
+        self.script_file = script_file
+        self.directory = os.path.dirname(os.path.abspath(script_file))
+        self.write_out = write_out
+        self.emulator = BlockEmulator()
+        self.program = None
+        self.columns = []
+        self.expected = None
+        self.output = []
+        self.out_file = None
+        self.halt_cycle = None
+
+        with open(script_file, "r") as infile:
+            self.text = infile.read()
+
+    def skip_reason(self):
+        """Returns why the script can't run headless, or None"""
+        tokens = tokenize(self.text)
+
+        if "load" not in tokens or \
+           not tokens[tokens.index("load") + 1].endswith(PROGRAM_EXTENSIONS):
+            return "not a CPU emulator script"
+        if "compare-to" not in tokens:
+            return "nothing to compare to"
+
+        return None
+
+    def run(self):
+        """Runs the script, raising on the first mismatch"""
+        self.execute(parse_script(self.text))
+
+        if self.expected is not None and \
+           len(self.output) < len(self.expected):
+            raise AssertionError("Expected {} output lines, got {}".format(
+                len(self.expected), len(self.output)))
+
+    def finish(self):
+        if self.write_out and self.out_file is not None:
+            with open(self.out_file, "w") as outfile:
+                outfile.write("".join(line + "\n" for line in self.output))
+
+    def execute(self, commands):
+        for command in commands:
+            name = command[0]
+
+            if name == "repeat":
+                count, body = command[1], command[2]
+
+                if body == [["ticktock"]]:
+                    self.tick(count)
+                else:
+                    for _ in range(count):
+                        self.execute(body)
+            elif name == "ticktock":
+                self.tick(1)
+            elif name == "load":
+                self.program = find_program(self.directory, command[1])
+                self.emulator.load(self.program)
+            elif name == "output-file":
+                self.out_file = os.path.join(self.directory, command[1])
+            elif name == "compare-to":
+                with open(os.path.join(self.directory, command[1])) as infile:
+                    self.expected = [line.rstrip("\r\n") for line in infile]
+            elif name == "output-list":
+                self.columns = [OutputColumn(entry) for entry in command[1:]]
+                self.emit("|" + "|".join(column.header()
+                                          for column in self.columns) + "|")
+            elif name == "output":
+                self.emit("|" + "|".join(
+                    column.value(self.read(column.name))
+                    for column in self.columns) + "|")
+            elif name == "set":
+                self.write(command[1], int(command[2]))
+            elif name in ("echo", "clear-echo"):
+                pass
+            else:
+                raise Exception("Unsupported command [{}]".format(
+                    " ".join(str(word) for word in command)))
+
+    def tick(self, count):
+        emulator = self.emulator
+
+        if self.halt_cycle is None:
+            start = emulator.cycles
+            if emulator.run_until_halt(count):
+                self.halt_cycle = emulator.cycles
+            count -= emulator.cycles - start
+
+        emulator.run(count)
+
+    def read(self, name):
+        match = RAM_NAME.match(name)
+        if match:
+            return self.emulator.ram[int(match.group(1))]
+        if name == "A":
+            return self.emulator.a
+        if name == "D":
+            return self.emulator.d
+        if name == "PC":
+            return self.emulator.pc
+        if name == "time":
+            return self.emulator.cycles & 0xFFFF
+
+        raise Exception("Unknown variable {}".format(name))
+
+    def write(self, name, value):
+        value &= 0xFFFF
+
+        match = RAM_NAME.match(name)
+        if match:
+            self.emulator.ram[int(match.group(1))] = value
+        elif name == "A":
+            self.emulator.a = value
+        elif name == "D":
+            self.emulator.d = value
+        elif name == "PC":
+            self.emulator.pc = value
+            # a restarted program may halt again
+            self.halt_cycle = None
+        else:
+            raise Exception("Unknown variable {}".format(name))
+
+    def emit(self, line):
+        ind = len(self.output)
+        self.output.append(line)
+
+        if self.expected is None:
+            return
+
+        if ind >= len(self.expected):
+            raise AssertionError("Unexpected output line {}: {}".format(
+                ind + 1, line))
+
+        expected = self.expected[ind]
+        if len(line) != len(expected) or \
+           any(e != "*" and e != c for c, e in zip(line, expected)):
+            raise AssertionError("Comparison failure at line {}:\n"
+                                 "  expected {}\n  got      {}".format(
+                                     ind + 1, expected, line))
+
+
+def run_script(script_file, write_out=False):
+    """Runs one script and returns its result as a dict"""
+    result = {"script": script_file, "status": STATUS_PASS, "message": "",
+              "cycles": 0, "halt_cycle": None, "rom": 0}
+
+    try:
+        runner = ScriptRunner(script_file, write_out)
+    except Exception as e:
+        result.update(status=STATUS_ERROR, message=str(e))
+        return result
+
+    reason = runner.skip_reason()
+    if reason is not None:
+        result.update(status=STATUS_SKIP, message=reason)
+        return result
+
+    try:
+        runner.run()
+    except AssertionError as e:
+        result.update(status=STATUS_FAIL, message=str(e))
+    except Exception as e:
+        result.update(status=STATUS_ERROR, message=str(e))
+    finally:
+        runner.finish()
+
+    result.update(cycles=runner.emulator.cycles,
+                  halt_cycle=runner.halt_cycle,
+                  rom=len(runner.emulator.rom))
+
+    return result
+
+
+def find_scripts(paths):
+    """Returns the .tst files in paths, searching directories recursively"""
+    scripts = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                scripts.extend(os.path.join(root, name)
+                               for name in sorted(files)
+                               if name.endswith(".tst"))
+        else:
+            scripts.append(path)
+
+    return scripts
+
+
+def run_scripts(scripts, jobs=None, write_out=False):
+    """Runs scripts across a process pool, results in the order given"""
+    if jobs == 1 or len(scripts) <= 1:
+        return [run_script(script, write_out) for script in scripts]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(run_script, scripts,
+                                 [write_out] * len(scripts)))
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Runs CPU emulator test scripts against their .cmp files")
+    arg_parser.add_argument("paths", nargs="+",
+                            help=".tst files or directories to search")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None,
+                            help="worker processes (default: one per CPU)")
+    arg_parser.add_argument("--write-out", action="store_true",
+                            help="write each script's output-file")
+    arg_parser.add_argument("--json", action="store_true",
+                            help="print the results as JSON")
+    arg_parser.add_argument("-v", "--verbose", action="store_true",
+                            help="also list skipped scripts")
+    args = arg_parser.parse_args()
+
+    results = run_scripts(find_scripts(args.paths), args.jobs, args.write_out)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            if result["status"] == STATUS_SKIP and not args.verbose:
+                continue
+
+            line = "{:<5} {}".format(result["status"].upper(),
+                                     result["script"])
+            if result["status"] in (STATUS_PASS, STATUS_FAIL):
+                line += " ({} cycles)".format(result["cycles"])
+            print(line)
+
+            if result["message"] and result["status"] != STATUS_PASS:
+                print("      " + result["message"].replace("\n", "\n      "))
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+
+    if not args.json:
+        print(", ".join("{} {}".format(counts.get(status, 0), status)
+                        for status in (STATUS_PASS, STATUS_FAIL,
+                                       STATUS_ERROR, STATUS_SKIP)))
+
+    sys.exit(1 if counts.get(STATUS_FAIL) or counts.get(STATUS_ERROR) else 0)
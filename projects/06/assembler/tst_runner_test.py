@@ -0,0 +1,79 @@
+__author__ = "Yun-L"
+
+import os
+import tempfile
+import unittest
+
+from tst_runner import OutputColumn, STATUS_FAIL, STATUS_PASS, STATUS_SKIP, \
+    find_scripts, parse_script, run_script, run_scripts
+
+PROJECTS = "../.."
+
+
+class TestTstRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_script(self):
+        commands = parse_script("load X.asm, // comment\n"
+                                "set RAM[0] -1,\n"
+                                "/* block\n comment */\n"
+                                "repeat 3 { ticktock; }\n"
+                                "output;")
+
+        self.assertEqual(commands, [["load", "X.asm"],
+                                    ["set", "RAM[0]", "-1"],
+                                    ["repeat", 3, [["ticktock"]]],
+                                    ["output"]])
+
+    def test_output_column(self):
+        column = OutputColumn("RAM[3006]%D1.6.1")
+        self.assertEqual(column.header(), "RAM[3006")
+        self.assertEqual(column.value(0xFFFF), "     -1 ")
+
+        column = OutputColumn("RAM[0]%D2.6.2")
+        self.assertEqual(column.header(), "  RAM[0]  ")
+
+        self.assertEqual(OutputColumn("A%X1.4.1").value(0xBEEF), " BEEF ")
+        self.assertEqual(OutputColumn("D%B0.4.0").value(5), "0101")
+
+    def test_vm_scripts(self):
+        scripts = find_scripts([os.path.join(PROJECTS, "07"),
+                                os.path.join(PROJECTS, "08")])
+        results = run_scripts(scripts, jobs=2)
+
+        self.assertEqual([result["script"] for result in results], scripts)
+
+        ran = [result for result in results
+               if result["status"] != STATUS_SKIP]
+        self.assertEqual(len(ran), 11)
+
+        for result in ran:
+            self.assertEqual(result["status"], STATUS_PASS, result["message"])
+
+    def test_mismatch(self):
+        directory = self.tmp_dir.name
+
+        with open(os.path.join(directory, "T.asm"), "w") as outfile:
+            outfile.write("@7\nD=A\n@0\nM=D\n")
+        with open(os.path.join(directory, "T.cmp"), "w") as outfile:
+            outfile.write("|RAM[0] |\n|     8 |\n")
+        with open(os.path.join(directory, "T.tst"), "w") as outfile:
+            outfile.write("load T.asm, compare-to T.cmp,\n"
+                          "output-list RAM[0]%D1.5.1;\n"
+                          "repeat 4 { ticktock; } output;\n")
+
+        result = run_script(os.path.join(directory, "T.tst"))
+
+        self.assertEqual(result["status"], STATUS_FAIL)
+        self.assertIn("line 2", result["message"])
+        self.assertEqual(result["cycles"], 4)
+        self.assertEqual(result["halt_cycle"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
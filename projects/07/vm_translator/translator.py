@@ -25,6 +25,14 @@ segment_map = {"argument": MemorySegType.M_ARGUMENT,
                "pointer": MemorySegType.M_POINTER,
                "temp": MemorySegType.M_TEMP}
 
+# CodeWriter call for each command type translated so far
+COMMAND_WRITERS = {
+    CommandType.C_ARITHMETIC: lambda cw, c: cw.write_arithmetic(c.arg1),
+    CommandType.C_PUSH: lambda cw, c: cw.write_push_pop(
+        CommandType.C_PUSH, segment_map[c.arg1], c.arg2),
+    CommandType.C_POP: lambda cw, c: cw.write_push_pop(
+        CommandType.C_POP, segment_map[c.arg1], c.arg2)}
+
 
 if __name__ == "__main__":
 
@@ -44,14 +52,9 @@ if __name__ == "__main__":
     for f in files:
         p = Parser(f)
         cw.file_name = f
-        while p.advance():
-            if p.command_type == CommandType.C_ARITHMETIC:
-                cw.write_arithmetic(p.arg1())
-            elif p.command_type == CommandType.C_PUSH:
-                cw.write_push_pop(CommandType.C_PUSH,
-                                  segment_map[p.arg1()], p.arg2())
-            elif p.command_type == CommandType.C_POP:
-                cw.write_push_pop(CommandType.C_POP,
-                                  segment_map[p.arg1()], p.arg2())
+        for command in p.commands():
+            write = COMMAND_WRITERS.get(command.command_type)
+            if write is not None:
+                write(cw, command)
 
     print("Success.")
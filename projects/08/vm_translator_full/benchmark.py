@@ -0,0 +1,163 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from translator import translate
+from vm_passes import PASSES
+
+"""
+Translates the 07/08 test programs once per code generation mode, runs their
+.tst scripts with the headless runner from 06/assembler and prints a table
+of ROM size, label count and cycles until the program halts, per mode.
+"""
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..")
+TST_RUNNER = os.path.join(PROJECTS_DIR, "06", "assembler", "tst_runner.py")
+
+TEST_DIRS = sorted(glob.glob(os.path.join(PROJECTS_DIR, "07", "*", "*")) +
+                   glob.glob(os.path.join(PROJECTS_DIR, "08", "*", "*")))
+
+# CodeWriter options for each mode
+MODES = {"inline": {},
+         "shared-calls": {"shared_calls": True},
+         "shared-cmp": {"shared_comparisons": True},
+         "shared-all": {"shared_calls": True, "shared_comparisons": True},
+         "tos-cache": {"cache_tos": True},
+         "ir-passes": {"passes": list(PASSES)},
+         "fused": {"fuse": True},
+         "dead-functions": {"dead_functions": True},
+         "parallel": {"jobs": 2},
+         "inlining": {"inline": True},
+         "tail-calls": {"tail_calls": True},
+         "speed": {"profile": "speed"},
+         "size": {"profile": "size"}}
+
+
+def rom_size(asm_file: str):
+    """Returns (instructions, labels) counted in an .asm file"""
+    size = 0
+    labels = 0
+    with open(asm_file, "r") as infile:
+        for line in infile:
+            line = line.split("//")[0].strip()
+            if line.startswith("("):
+                labels += 1
+            elif line:
+                size += 1
+    return size, labels
+
+
+def build(program_dir: str, dest_dir: str, options: Dict) -> str:
+    """
+    Copies the .vm, .tst and .cmp files of program_dir to dest_dir and
+    translates them there. The bootstrap is only written for programs with a
+    Sys.vm. Returns the .asm file.
+    """
+    name = os.path.basename(os.path.normpath(program_dir))
+    os.makedirs(dest_dir)
+
+    for pattern in ["*.vm", "*.tst", "*.cmp"]:
+        for f in glob.glob(os.path.join(program_dir, pattern)):
+            shutil.copy(f, dest_dir)
+
+    files = sorted(glob.glob(os.path.join(dest_dir, "*.vm")))
+    has_sys = any(os.path.basename(f) == "Sys.vm" for f in files)
+
+    dest = os.path.join(dest_dir, name + ".asm")
+    translate(files, dest, bootstrap=has_sys, **options)
+    return dest
+
+
+def run_tests(build_dir: str) -> Dict[str, Dict]:
+    """Returns the tst_runner results for build_dir by script directory"""
+    output = subprocess.run([sys.executable, TST_RUNNER, "--json", build_dir],
+                            stdout=subprocess.PIPE, check=False).stdout
+    return {os.path.dirname(r["script"]): r for r in json.loads(output)
+            if r["status"] != "skip"}
+
+
+def benchmark(modes: List[str], program_dirs: List[str],
+              size_only_dirs: List[str]) -> List[List[str]]:
+    """Returns the report table rows, the first being the header"""
+    header = ["program"]
+    for mode in modes:
+        header.extend([f"{mode} ROM", "labels", "cycles"])
+    rows = [header]
+
+    build_root = tempfile.mkdtemp()
+    results = {}
+    sizes = {}
+
+    try:
+        for mode in modes:
+            for program_dir in program_dirs + size_only_dirs:
+                name = os.path.basename(os.path.normpath(program_dir))
+                dest_dir = os.path.join(build_root, mode, name)
+                sizes[mode, name] = rom_size(
+                    build(program_dir, dest_dir, MODES[mode]))
+
+            results[mode] = run_tests(os.path.join(build_root, mode))
+
+        for program_dir in program_dirs + size_only_dirs:
+            name = os.path.basename(os.path.normpath(program_dir))
+            row = [name]
+
+            for mode in modes:
+                row.extend(str(n) for n in sizes[mode, name])
+
+                result = results[mode].get(
+                    os.path.join(build_root, mode, name))
+                if result is None:
+                    row.append("-")
+                elif result["status"] != "pass":
+                    row.append(result["status"].upper())
+                elif result["halt_cycle"] is None:
+                    row.append("no halt")
+                else:
+                    row.append(str(result["halt_cycle"]))
+
+            rows.append(row)
+    finally:
+        shutil.rmtree(build_root)
+
+    return rows
+
+
+def format_table(rows: List[List[str]]) -> str:
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for row in rows:
+        lines.append("  ".join(cell.ljust(width) if i == 0
+                               else cell.rjust(width)
+                               for i, (cell, width)
+                               in enumerate(zip(row, widths))))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Compares code generation modes on the 07/08 tests")
+    arg_parser.add_argument("--modes", nargs="+", choices=list(MODES),
+                            default=list(MODES), help="modes to compare")
+    arg_parser.add_argument("--size-only", nargs="*", default=[],
+                            metavar="DIR",
+                            help="extra program directories (e.g. "
+                            "../../11/Pong) only measured for ROM size")
+    args = arg_parser.parse_args()
+
+    program_dirs = [d for d in TEST_DIRS
+                    if glob.glob(os.path.join(d, "*.tst"))]
+
+    rows = benchmark(args.modes, program_dirs, args.size_only)
+    print(format_table(rows))
+
+    failed = any(cell in ("FAIL", "ERROR") for row in rows for cell in row)
+    sys.exit(1 if failed else 0)
@@ -1,27 +1,388 @@
-from typing import List
+from typing import Iterable, List, Optional, TextIO, Union
 from command_types import CommandType
 from memory_segment_types import MemorySegType
+from hack_backend import HackBuilder
+
+# Routines shared by every call site in shared_calls mode, emitted once at
+# the end of the program.
+#
+# $CALL expects the return address in D, the called function's address in
+# R13 and nArgs + 5 in R14.
+# $RETURN uses LCL itself as the frame pointer while restoring.
+SHARED_ROUTINES = {
+    "$CALL": ["($CALL)",
+              "@SP",
+              "A=M",
+              "M=D",  # push return address
+              "@LCL",
+              "D=M",
+              "@SP",
+              "AM=M+1",
+              "M=D",
+              "@ARG",
+              "D=M",
+              "@SP",
+              "AM=M+1",
+              "M=D",
+              "@THIS",
+              "D=M",
+              "@SP",
+              "AM=M+1",
+              "M=D",
+              "@THAT",
+              "D=M",
+              "@SP",
+              "AM=M+1",
+              "M=D",
+              "@SP",
+              "MD=M+1",
+              "@LCL",  # reposition LCL
+              "M=D",
+              "@R14",
+              "D=D-M",
+              "@ARG",  # reposition ARG
+              "M=D",
+              "@R13",
+              "A=M",
+              "0;JMP"],
+    "$RETURN": ["($RETURN)",
+                "@5",
+                "D=A",
+                "@LCL",
+                "A=M-D",
+                "D=M",
+                "@R14",
+                "M=D",  # temp. save ret addr in R14
+                "@SP",
+                "AM=M-1",
+                "D=M",
+                "@ARG",
+                "A=M",
+                "M=D",  # return value to *ARG
+                "@ARG",
+                "D=M+1",
+                "@SP",
+                "M=D",
+                "@LCL",
+                "AM=M-1",
+                "D=M",
+                "@THAT",
+                "M=D",
+                "@LCL",
+                "AM=M-1",
+                "D=M",
+                "@THIS",
+                "M=D",
+                "@LCL",
+                "AM=M-1",
+                "D=M",
+                "@ARG",
+                "M=D",
+                "@LCL",
+                "A=M-1",
+                "D=M",
+                "@LCL",
+                "M=D",
+                "@R14",
+                "A=M",
+                "0;JMP"]}
+
+# In shared_comparisons mode eq, gt and lt jump to these with the return
+# address in D, which they keep in R15
+for name, jump in [("$EQ", "JEQ"), ("$GT", "JGT"), ("$LT", "JLT")]:
+    SHARED_ROUTINES[name] = [f"({name})",
+                             "@R15",
+                             "M=D",
+                             "@SP",
+                             "AM=M-1",
+                             "D=M",
+                             "A=A-1",
+                             "D=M-D",
+                             "M=-1",
+                             f"@{name}.TRUE",
+                             f"D;{jump}",
+                             "@SP",
+                             "A=M-1",
+                             "M=0",
+                             f"({name}.TRUE)",
+                             "@R15",
+                             "A=M",
+                             "0;JMP"]
+
+# In tail_calls mode 'call f n' directly followed by return jumps to $TAIL
+# with f's address in R13 and n in R14 instead. $TAIL moves the n arguments
+# down to ARG and reuses the current frame, so f returns straight to our
+# caller. If they don't fit below the saved frame (n is more than our own
+# number of arguments, LCL - ARG - 5) the frame is moved up to ARG + n,
+# going through the free stack above SP.
+SHARED_ROUTINES["$TAIL"] = (
+    ["($TAIL)",
+     "@LCL",
+     "D=M",
+     "@ARG",
+     "D=D-M",
+     "@5",
+     "D=D-A",
+     "@R14",
+     "D=D-M",
+     "@$TAIL.ARGS",
+     "D;JGE"] +
+    # copy the saved frame, LCL - 5 to LCL - 1, to SP to SP + 4
+    [cmd for k in range(5, 0, -1)
+     for cmd in (["@LCL", "A=M-1"] + ["A=A-1"] * (k - 1) + ["D=M",
+                 "@SP", "A=M"] + ["A=A+1"] * (5 - k) + ["M=D"])] +
+    ["($TAIL.ARGS)",
+     "@ARG",
+     "D=M",
+     "@R15",
+     "M=D",  # R15 = destination of the next argument
+     "@R14",
+     "D=M",
+     "@SP",
+     "M=M-D",  # SP = first argument, back to SP once all are copied
+     "($TAIL.LOOP)",
+     "@R14",
+     "D=M",
+     "@$TAIL.MOVED",
+     "D;JEQ",
+     "@R14",
+     "M=M-1",
+     "@SP",
+     "AM=M+1",
+     "A=A-1",
+     "D=M",
+     "@R15",
+     "M=M+1",
+     "A=M-1",
+     "M=D",
+     "@$TAIL.LOOP",
+     "0;JMP",
+     "($TAIL.MOVED)",
+     "@LCL",
+     "D=M",
+     "@R15",
+     "D=D-M",
+     "@5",
+     "D=D-A",
+     "@$TAIL.JUMP",
+     "D;JGE"] +
+    # the frame goes right after the arguments, at R15 to R15 + 4
+    [cmd for k in range(5)
+     for cmd in (["@SP", "A=M"] + ["A=A+1"] * k + ["D=M",
+                 "@R15", "A=M"] + ["A=A+1"] * k + ["M=D"])] +
+    ["@5",
+     "D=A",
+     "@R15",
+     "D=D+M",
+     "@LCL",
+     "M=D",
+     "($TAIL.JUMP)",
+     "@LCL",
+     "D=M",
+     "@SP",
+     "M=D",
+     "@R13",
+     "A=M",
+     "0;JMP"])
+
+# Used when the top of the stack is cached in D, and by fused idioms
+BINARY_COMPS = {"add": "D=D+M",
+                "sub": "D=M-D",
+                "and": "D=D&M",
+                "or": "D=D|M"}
+UNARY_COMPS = {"neg": "D=-D",
+               "not": "D=!D"}
+COMPARISON_JUMPS = {"eq": "JEQ",
+                    "gt": "JGT",
+                    "lt": "JLT"}
+NEGATED_JUMPS = {"eq": "JNE",
+                 "gt": "JLE",
+                 "lt": "JGE"}
+
+SEGMENT_BASES = {MemorySegType.M_LOCAL: "LCL",
+                 MemorySegType.M_ARGUMENT: "ARG",
+                 MemorySegType.M_THIS: "THIS",
+                 MemorySegType.M_THAT: "THAT"}
+
+# Largest index popped to by stepping A up from the segment base, past it
+# the address is computed through R13/R14
+MAX_STEPPED_INDEX = 7
+
+# Largest index pushed from by stepping A up when specialize_indices is on,
+# past it '@ind D=A @base A=D+M' is as short
+MAX_STEPPED_LOAD = 2
+
+# Code generation options set by CodeWriter's profile. Both keep the top of
+# the stack in D and use the shorter addressing and frame code. speed
+# inlines everything and unrolls the locals' initialization, size jumps to
+# the shared routines and initializes locals in a loop. A routine costs its
+# full length as soon as it is used once, so a program with only a couple
+# of calls or comparisons comes out larger with size than with speed.
+PROFILES = {"speed": {"cache_tos": True,
+                      "specialize_indices": True,
+                      "compact_frames": True,
+                      "local_init": "unrolled"},
+            "size": {"cache_tos": True,
+                     "specialize_indices": True,
+                     "compact_frames": True,
+                     "local_init": "loop",
+                     "shared_calls": True,
+                     "shared_comparisons": True}}
+
+# Fewest locals initialized in a loop with local_init="loop", fewer are
+# unrolled
+MIN_LOOPED_LOCALS = 3
 
 
 class CodeWriter(object):
     """Translates VM commands into Hack assembly code"""
 
-    def __init__(self, outfile: str):
-        self.__outfile = open(outfile, "w")
+    def __init__(self, outfile: Union[str, TextIO, HackBuilder],
+                 annotate: bool = False,
+                 bootstrap: bool = True, shared_calls: bool = False,
+                 shared_comparisons: bool = False, cache_tos: bool = False,
+                 tail_calls: bool = False, specialize_indices: bool = False,
+                 compact_frames: bool = False,
+                 local_init: Optional[str] = None,
+                 profile: Optional[str] = None,
+                 namespace: Optional[str] = None):
+        """
+        outfile is a path or an open stream, which is then left open, or
+        a HackBuilder to generate machine code directly.
+
+        namespace is added to the generated return and comparison labels,
+        so the code for several files can be generated by separate
+        CodeWriters and put together.
+
+        shared_calls makes every call and return jump to one shared
+        routine instead of inlining the frame handling, shared_comparisons
+        does the same for eq, gt and lt (see SHARED_ROUTINES). The routines
+        are written by close().
+
+        cache_tos keeps the top of the stack in D between commands of a
+        basic block, only writing it to the stack before labels, jumps,
+        calls and returns.
+
+        tail_calls turns a call directly followed by return into a jump to
+        the shared $TAIL routine, which reuses the current frame. Calls are
+        held back until the next command is known.
+
+        specialize_indices shortens the code reaching small segment
+        indices and pushes with 'AM=M+1'. compact_frames does the same for
+        the frame pushes of inlined calls and inlines the code of $RETURN,
+        which is shorter than the original return.
+
+        local_init is "unrolled" to zero a function's locals with shorter
+        unrolled code, "loop" to zero them in a loop, or None for the
+        original code.
+
+        profile is "speed" or "size", turning on the options in PROFILES on
+        top of those given. size only pays off once the shared routines are
+        used a few times.
+        """
+        if profile is not None:
+            if profile not in PROFILES:
+                raise Exception(f"Error: no profile named '{profile}'.")
+            settings = PROFILES[profile]
+            shared_calls = shared_calls or settings.get("shared_calls", False)
+            shared_comparisons = shared_comparisons or \
+                settings.get("shared_comparisons", False)
+            cache_tos = cache_tos or settings.get("cache_tos", False)
+            specialize_indices = specialize_indices or \
+                settings.get("specialize_indices", False)
+            compact_frames = compact_frames or \
+                settings.get("compact_frames", False)
+            local_init = local_init or settings.get("local_init")
+
+        if local_init not in (None, "unrolled", "loop"):
+            raise Exception(f"Error: invalid local_init '{local_init}'.")
+
+        self.__owns_outfile = isinstance(outfile, str)
+        self.__outfile = open(outfile, "w") if self.__owns_outfile \
+            else outfile
+        self.__builder = outfile if isinstance(outfile, HackBuilder) \
+            else None
+        self.__closed = False
+        self.__namespace = namespace
         self.__file_name: str = "default"
         self.__EGL_count = 0
         self.__return_count = 0
         self.__curr_fn = None
+        self.__annotate = annotate
+        self.__shared_calls = shared_calls
+        self.__shared_comparisons = shared_comparisons
+        self.__cache_tos = cache_tos
+        # True while the top of the stack is in D and not in RAM, SP then
+        # pointing where it belongs
+        self.__tos_in_d = False
+        self.__tail_calls = tail_calls
+        self.__specialize_indices = specialize_indices
+        self.__compact_frames = compact_frames
+        self.__local_init = local_init
+        # (function, nArgs) of a call held back in tail_calls mode and the
+        # annotations written since
+        self.__pending_call = None
+        self.__pending_annotations = []
+        self.__routines_used = set()
         # Bootstrapping code
-        self.__write_asm(["@256",
-                          "D=A",
-                          "@SP",
-                          "M=D"])
-        self.write_call("Sys.init", 0)
+        if bootstrap:
+            self.write_annotation("bootstrap")
+            self.__write_asm(["@256",
+                              "D=A",
+                              "@SP",
+                              "M=D"])
+            self.write_call("Sys.init", 0)
         return
 
     def __del__(self):
-        self.__outfile.close()
+        self.close()
+        return
+
+    def close(self, routines: bool = True):
+        """
+        Writes the shared routines the program used, unless routines is
+        False, and closes the file
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+
+        self.__flush_call()
+        self.__flush_tos()
+
+        # a program without a bootstrap may run off its end, keep it from
+        # running into the routines
+        if routines and self.__routines_used:
+            self.__write_asm(["($END)",
+                              "@$END",
+                              "0;JMP"])
+
+        for name, routine in SHARED_ROUTINES.items():
+            if routines and name in self.__routines_used:
+                self.write_annotation(name)
+                self.__write_asm(routine)
+
+        if self.__owns_outfile:
+            self.__outfile.close()
+        return
+
+    @property
+    def routines_used(self):
+        return frozenset(self.__routines_used)
+
+    def write_fragment(self, asm: Union[str, HackBuilder],
+                       routines_used: Iterable[str]):
+        """
+        Copies code generated by another CodeWriter (closed without its
+        routines) into the output, as text or in a HackBuilder like ours
+        """
+        self.__flush_call()
+        self.__flush_tos()
+        if self.__builder is not None:
+            self.__builder.append(asm)
+        else:
+            self.__outfile.write(asm)
+        self.__routines_used.update(routines_used)
         return
 
     @property
@@ -39,6 +400,8 @@ class CodeWriter(object):
 
     @curr_fn.setter
     def curr_fn(self, curr_fn: str):
+        # a held back call's return label is in the calling function
+        self.__flush_call()
         self.__curr_fn = curr_fn
         return
 
@@ -48,21 +411,103 @@ class CodeWriter(object):
         where xxx is an integer globally unique in the resulting program
         """
         base_labels = ("$EGL.T.", "$EGL.E.")
-        result = tuple(map(lambda x: x + str(self.__EGL_count), base_labels))
+        result = tuple(map(lambda x: x + self.__label_id(self.__EGL_count),
+                           base_labels))
         self.__EGL_count += 1
         return result
 
+    def __label_id(self, count: int) -> str:
+        if self.__namespace is None:
+            return str(count)
+        return f"{self.__namespace}.{count}"
+
     def __write_asm(self, cmds: List[str]):
+        self.__flush_call()
+        if self.__builder is not None:
+            self.__builder.write_asm(cmds)
+            return
         buf = "\n".join(cmds) + "\n"
         self.__outfile.write(buf)
         return
 
+    def write_annotation(self, command: str):
+        """
+        Writes a '//vm <function> <command>' comment ahead of a VM command's
+        code, for the assembler's source map. Does nothing unless the
+        CodeWriter was created with annotate=True.
+        """
+        if not self.__annotate:
+            return
+
+        annotation = f"//vm {self.__curr_fn or '-'} {command}"
+        if self.__pending_call is not None:
+            self.__pending_annotations.append(annotation)
+        else:
+            self.__write_asm([annotation])
+        return
+
+    def __flush_call(self):
+        """Writes the call held back in tail_calls mode, if any"""
+        if self.__pending_call is None:
+            return
+
+        fn_name, num_args = self.__pending_call
+        self.__pending_call = None
+        self.__write_call(fn_name, num_args)
+        self.__write_pending_annotations()
+        return
+
+    def __write_pending_annotations(self):
+        if self.__pending_annotations:
+            self.__write_asm(self.__pending_annotations)
+            self.__pending_annotations = []
+        return
+
     def __write_push(self, segment: MemorySegType, ind: int):
+        self.__write_load(segment, ind)
+
+        if self.__specialize_indices:
+            self.__write_asm(["@SP",
+                              "AM=M+1",
+                              "A=A-1",
+                              "M=D"])
+            return
+
+        # Push value in D to stack and increment SP
+        self.__write_asm(["@SP",
+                          "A=M",
+                          "M=D",
+                          "@SP",
+                          "M=M+1"])
+        return
+
+    def __write_load(self, segment: MemorySegType, ind: int):
+        """Gets value from memory segment, stores it in D"""
         def push_error(ind: int, segment: MemorySegType):
             raise Exception(f"Error: can't push to index '{ind}' for "
                             f"'{segment}'.")
 
-        # Get value from memory segment, store in D
+        if self.__specialize_indices and segment in SEGMENT_BASES:
+            if ind < 0:
+                push_error(ind, segment)
+            base = SEGMENT_BASES[segment]
+            if ind == 0:
+                self.__write_asm([f"@{base}",
+                                  "A=M",
+                                  "D=M"])
+            elif ind <= MAX_STEPPED_LOAD:
+                self.__write_asm([f"@{base}",
+                                  "A=M+1"] +
+                                 ["A=A+1"] * (ind - 1) +
+                                 ["D=M"])
+            else:
+                self.__write_asm([f"@{ind}",
+                                  "D=A",
+                                  f"@{base}",
+                                  "A=D+M",
+                                  "D=M"])
+            return
+
         if segment == MemorySegType.M_CONSTANT:
             if ind < 0 or ind > 32767:
                 push_error(ind, segment)
@@ -124,13 +569,6 @@ class CodeWriter(object):
         elif segment == MemorySegType.M_STATIC:
             self.__write_asm([f"@{self.file_name}.{ind}",
                               "D=M"])
-
-        # Push value in D to stack and increment SP
-        self.__write_asm(["@SP",
-                          "A=M",
-                          "M=D",
-                          "@SP",
-                          "M=M+1"])
         return
 
     def __write_pop(self, segment: MemorySegType, ind: int):
@@ -138,6 +576,31 @@ class CodeWriter(object):
             raise Exception(f"Error: can't pop to index '{ind}' for "
                             f"'{segment}'.")
 
+        if self.__specialize_indices and \
+           (segment not in SEGMENT_BASES or ind <= MAX_STEPPED_INDEX):
+            self.__check_address(segment, ind)
+            self.__write_asm(["@SP",
+                              "AM=M-1",
+                              "D=M"])
+            self.__write_store(segment, ind)
+            return
+        elif self.__specialize_indices:
+            # address first, the value then fits in D
+            self.__check_address(segment, ind)
+            self.__write_asm([f"@{ind}",
+                              "D=A",
+                              f"@{SEGMENT_BASES[segment]}",
+                              "D=D+M",
+                              "@R13",
+                              "M=D",
+                              "@SP",
+                              "AM=M-1",
+                              "D=M",
+                              "@R13",
+                              "A=M",
+                              "M=D"])
+            return
+
         if segment == MemorySegType.M_CONSTANT:
             # Do nothing, Constant has no actual memory space
             raise Exception(f"Error: can't pop to '{segment}'. "
@@ -204,8 +667,143 @@ class CodeWriter(object):
                           "A=M",
                           "M=D"])
 
+    def __flush_tos(self):
+        """Writes the top of the stack cached in D back to the stack"""
+        if self.__tos_in_d:
+            self.__write_asm(["@SP",
+                              "AM=M+1",
+                              "A=A-1",
+                              "M=D"])
+            self.__tos_in_d = False
+        return
+
+    def __pop_to_d(self):
+        """Makes D hold the top of the stack, popping it from RAM if needed"""
+        if not self.__tos_in_d:
+            self.__write_asm(["@SP",
+                              "AM=M-1",
+                              "D=M"])
+            self.__tos_in_d = True
+        return
+
+    def __write_arithmetic_cached(self, command: str):
+        if command in ("eq", "gt", "lt") and self.__shared_comparisons:
+            self.__flush_tos()
+            self.__write_shared_comparison(command)
+            return
+
+        self.__pop_to_d()
+
+        if command in BINARY_COMPS:
+            self.__write_asm(["@SP",
+                              "AM=M-1",
+                              BINARY_COMPS[command]])
+        elif command in UNARY_COMPS:
+            self.__write_asm([UNARY_COMPS[command]])
+        elif command in COMPARISON_JUMPS:
+            labels = self.__create_EGL_labels()
+            self.__write_asm(["@SP",
+                              "AM=M-1",
+                              "D=M-D",
+                              f"@{labels[0]}",
+                              f"D;{COMPARISON_JUMPS[command]}",
+                              "D=0",
+                              f"@{labels[1]}",
+                              "0;JMP",
+                              f"({labels[0]})",
+                              "D=-1",
+                              f"({labels[1]})"])
+        else:
+            raise Exception(f"Error: invalid arithmetic command '{command}'.")
+        return
+
+    def __check_address(self, segment: MemorySegType, ind: int):
+        def pop_error(ind: int, segment: MemorySegType):
+            raise Exception(f"Error: can't pop to index '{ind}' for "
+                            f"'{segment}'.")
+
+        if segment == MemorySegType.M_CONSTANT:
+            raise Exception(f"Error: can't pop to '{segment}'. "
+                            "Has no actual memory space.")
+        elif segment in SEGMENT_BASES and ind < 0:
+            pop_error(ind, segment)
+        elif segment == MemorySegType.M_POINTER and (ind < 0 or ind > 1):
+            pop_error(ind, segment)
+        elif segment == MemorySegType.M_TEMP and (ind < 0 or ind > 7):
+            pop_error(ind, segment)
+        return
+
+    def __write_address(self, segment: MemorySegType, ind: int):
+        """
+        Points A at a segment location. D is only used for indices past
+        MAX_STEPPED_INDEX of the pointer based segments.
+        """
+        self.__check_address(segment, ind)
+
+        if segment in SEGMENT_BASES and ind <= MAX_STEPPED_INDEX:
+            self.__write_asm([f"@{SEGMENT_BASES[segment]}",
+                              "A=M"] +
+                             ["A=A+1"] * ind)
+        elif segment in SEGMENT_BASES:
+            self.__write_asm([f"@{ind}",
+                              "D=A",
+                              f"@{SEGMENT_BASES[segment]}",
+                              "A=D+M"])
+        elif segment == MemorySegType.M_POINTER:
+            self.__write_asm([f"@R{3+ind}"])
+        elif segment == MemorySegType.M_TEMP:
+            self.__write_asm([f"@R{5+ind}"])
+        elif segment == MemorySegType.M_STATIC:
+            self.__write_asm([f"@{self.file_name}.{ind}"])
+        return
+
+    def __write_store(self, segment: MemorySegType, ind: int):
+        """Stores D at a segment location"""
+        self.__check_address(segment, ind)
+
+        if segment in SEGMENT_BASES and ind > MAX_STEPPED_INDEX:
+            self.__write_asm(["@R13",
+                              "M=D",
+                              f"@{ind}",
+                              "D=A",
+                              f"@{SEGMENT_BASES[segment]}",
+                              "D=D+M",
+                              "@R14",
+                              "M=D",
+                              "@R13",
+                              "D=M",
+                              "@R14",
+                              "A=M",
+                              "M=D"])
+        else:
+            # step A up to the address, D keeps the value
+            self.__write_address(segment, ind)
+            self.__write_asm(["M=D"])
+        return
+
+    def __write_pop_cached(self, segment: MemorySegType, ind: int):
+        self.__check_address(segment, ind)
+        self.__pop_to_d()
+        self.__write_store(segment, ind)
+        self.__tos_in_d = False
+        return
+
+    def __write_shared_comparison(self, command: str):
+        return_label = f"$EGL.R.{self.__label_id(self.__EGL_count)}"
+        self.__EGL_count += 1
+
+        self.__write_asm([f"@{return_label}",
+                          "D=A"])
+        self.__jump_to_routine(f"${command.upper()}")
+        self.__write_asm([f"({return_label})"])
+        return
+
     def write_arithmetic(self, command: str):
-        if command == "add":
+        if self.__cache_tos:
+            self.__write_arithmetic_cached(command)
+        elif self.__shared_comparisons and command in ("eq", "gt", "lt"):
+            self.__write_shared_comparison(command)
+        elif command == "add":
             self.__write_asm(["@SP",
                               "M=M-1",
                               "A=M",
@@ -341,7 +939,13 @@ class CodeWriter(object):
         return
 
     def write_push_pop(self, cmd: CommandType, seg: MemorySegType, ind: int):
-        if cmd == CommandType.C_PUSH:
+        if self.__cache_tos and cmd == CommandType.C_PUSH:
+            self.__flush_tos()
+            self.__write_load(seg, ind)
+            self.__tos_in_d = True
+        elif self.__cache_tos and cmd == CommandType.C_POP:
+            self.__write_pop_cached(seg, ind)
+        elif cmd == CommandType.C_PUSH:
             self.__write_push(seg, ind)
         elif cmd == CommandType.C_POP:
             self.__write_pop(seg, ind)
@@ -350,15 +954,24 @@ class CodeWriter(object):
         return
 
     def write_label(self, label: str):
+        self.__flush_tos()
         self.__write_asm([f"({self.__curr_fn}:{label})"])
         return
 
     def write_goto(self, label: str):
+        self.__flush_tos()
         self.__write_asm([f"@{self.__curr_fn}:{label}",
                           "0;JMP"])
         return
 
     def write_if(self, label: str):
+        if self.__cache_tos:
+            self.__pop_to_d()
+            self.__write_asm([f"@{self.__curr_fn}:{label}",
+                              "D;JNE"])
+            self.__tos_in_d = False
+            return
+
         self.__write_asm(["@SP",
                           "M=M-1",
                           "A=M",
@@ -367,9 +980,118 @@ class CodeWriter(object):
                           "D;JNE"])
         return
 
+    def write_increment(self, segment: MemorySegType, ind: int, delta: int):
+        """Adds delta to a segment location in place"""
+        self.__flush_tos()
+        self.__check_address(segment, ind)
+
+        if delta == 0:
+            return
+        elif delta in (1, -1):
+            self.__write_address(segment, ind)
+            self.__write_asm(["M=M+1" if delta > 0 else "M=M-1"])
+        elif segment in SEGMENT_BASES and ind > MAX_STEPPED_INDEX:
+            # computing the address needs D, park it in R13
+            self.__write_asm([f"@{ind}",
+                              "D=A",
+                              f"@{SEGMENT_BASES[segment]}",
+                              "D=D+M",
+                              "@R13",
+                              "M=D",
+                              f"@{abs(delta)}",
+                              "D=A",
+                              "@R13",
+                              "A=M",
+                              "M=D+M" if delta > 0 else "M=M-D"])
+        else:
+            self.__write_asm([f"@{abs(delta)}",
+                              "D=A"])
+            self.__write_address(segment, ind)
+            self.__write_asm(["M=D+M" if delta > 0 else "M=M-D"])
+        return
+
+    def write_move(self, src_seg: MemorySegType, src_ind: int,
+                   dest_seg: MemorySegType, dest_ind: int):
+        """Copies a segment location (or constant) to another"""
+        self.__flush_tos()
+        self.__check_address(dest_seg, dest_ind)
+        self.__write_load(src_seg, src_ind)
+        self.__write_store(dest_seg, dest_ind)
+        return
+
+    def write_compare_if(self, command: str, negate: bool, label: str):
+        """
+        Pops two values and jumps to label if comparing them with command
+        (eq, gt or lt) is true, or false with negate
+        """
+        jumps = NEGATED_JUMPS if negate else COMPARISON_JUMPS
+        self.__pop_to_d()
+        self.__write_asm(["@SP",
+                          "AM=M-1",
+                          "D=M-D",
+                          f"@{self.__curr_fn}:{label}",
+                          f"D;{jumps[command]}"])
+        self.__tos_in_d = False
+        return
+
+    def write_if_not(self, label: str):
+        """
+        Pops a value and jumps to label if its bitwise not is true, that is
+        unless all its bits are set
+        """
+        self.__pop_to_d()
+        self.__write_asm([f"@{self.__curr_fn}:{label}",
+                          "D+1;JNE"])
+        self.__tos_in_d = False
+        return
+
+    def __jump_to_routine(self, name: str):
+        self.__routines_used.add(name)
+        self.__write_asm([f"@{name}",
+                          "0;JMP"])
+        return
+
     def write_call(self, fn_name: str, num_args: int):
+        self.__flush_tos()
+
+        if self.__tail_calls:
+            self.__flush_call()
+            self.__pending_call = (fn_name, num_args)
+            return
+
+        self.__write_call(fn_name, num_args)
+        return
+
+    def __write_call(self, fn_name: str, num_args: int):
+        if self.__shared_calls:
+            return_label = (f"{self.__curr_fn}:return."
+                            f"{self.__label_id(self.__return_count)}")
+            self.__write_asm([f"@{fn_name}",
+                              "D=A",
+                              "@R13",
+                              "M=D",
+                              f"@{num_args+5}",
+                              "D=A",
+                              "@R14",
+                              "M=D",
+                              f"@{return_label}",
+                              "D=A"])
+            self.__jump_to_routine("$CALL")
+            self.__write_asm([f"({return_label})"])
+
+            self.__return_count += 1
+            return
+
         def push_addr(addr: str, deref: str):
             # deref should be A for address, M for value
+            if self.__compact_frames:
+                self.__write_asm([f"@{addr}",
+                                  f"D={deref}",
+                                  "@SP",
+                                  "AM=M+1",
+                                  "A=A-1",
+                                  "M=D"])
+                return
             self.__write_asm([f"@{addr}",
                               f"D={deref}",
                               "@SP",
@@ -380,7 +1102,9 @@ class CodeWriter(object):
             return
 
         # push previous frame's addresses
-        push_addr(f"{self.__curr_fn}:return.{self.__return_count}", "A")
+        return_label = (f"{self.__curr_fn}:return."
+                        f"{self.__label_id(self.__return_count)}")
+        push_addr(return_label, "A")
         push_addr("LCL", "M")
         push_addr("ARG", "M")
         push_addr("THIS", "M")
@@ -397,12 +1121,38 @@ class CodeWriter(object):
              "M=D",
              f"@{fn_name}",
              "0;JMP",  # jump to called function
-             f"({self.__curr_fn}:return.{self.__return_count})"])
+             f"({return_label})"])
 
         self.__return_count += 1
         return
 
     def write_return(self):
+        if self.__pending_call is not None:
+            fn_name, num_args = self.__pending_call
+            self.__pending_call = None
+            self.__write_pending_annotations()
+            self.__write_asm([f"@{num_args}",
+                              "D=A",
+                              "@R14",
+                              "M=D",
+                              f"@{fn_name}",
+                              "D=A",
+                              "@R13",
+                              "M=D"])
+            self.__jump_to_routine("$TAIL")
+            return
+
+        self.__flush_tos()
+
+        if self.__shared_calls:
+            self.__jump_to_routine("$RETURN")
+            return
+
+        if self.__compact_frames:
+            # the routine's code without its label
+            self.__write_asm(SHARED_ROUTINES["$RETURN"][1:])
+            return
+
         self.__write_asm(["@LCL",
                           "D=M",
                           "@FRAME",
@@ -452,9 +1202,40 @@ class CodeWriter(object):
         return
 
     def write_function(self, fn_name: str, num_locals: int):
+        self.__flush_tos()
 
         self.__write_asm([f"({fn_name})"])
 
+        if self.__local_init == "loop" and num_locals >= MIN_LOOPED_LOCALS:
+            self.__write_asm([f"@{num_locals}",
+                              "D=A",
+                              f"({fn_name}$INIT)",
+                              "@SP",
+                              "AM=M+1",
+                              "A=A-1",
+                              "M=0",
+                              "D=D-1",
+                              f"@{fn_name}$INIT",
+                              "D;JGT"])
+            return
+        elif self.__local_init is not None and num_locals == 1:
+            self.__write_asm(["@SP",
+                              "AM=M+1",
+                              "A=A-1",
+                              "M=0"])
+            return
+        elif self.__local_init is not None and num_locals:
+            # zero them, then move SP past them once
+            self.__write_asm(["@SP",
+                              "A=M",
+                              "M=0"] +
+                             ["A=A+1",
+                              "M=0"] * (num_locals - 1) +
+                             ["D=A+1",
+                              "@SP",
+                              "M=D"])
+            return
+
         for i in range(num_locals):
             # make space for and initialize local variables to 0
             self.__write_asm(["@SP",
@@ -0,0 +1,224 @@
+import unittest
+
+from fixtures import run, translate_text
+from translator import TranslationStats
+
+# Counts argument 1 down to 0 in tail calls, adding 1 to argument 0 each
+# time. The base case saves the result to temp 0 and SP, read through
+# THAT, to temp 1.
+COUNT = ["function Sys.count 0",
+         "push argument 1",
+         "if-goto MORE",
+         "push constant 0",
+         "pop pointer 1",
+         "push that 0",
+         "pop temp 1",
+         "push argument 0",
+         "return",
+         "label MORE",
+         "push argument 0",
+         "push constant 1",
+         "add",
+         "push argument 1",
+         "push constant 1",
+         "sub",
+         "call Sys.count 2",
+         "return"]
+
+# temp 0 and 1
+RESULT = 5
+DEPTH = 6
+
+# Pairs compared by the fused comparison tests, including ones whose
+# difference overflows
+PAIRS = [(3, 5), (5, 3), (5, 5), (-2, 7), (0, 0), (-1, 0), (20000, -20000),
+         (-20000, 20000)]
+
+# Where the fusion tests point THIS and THAT
+THIS_BASE = 3000
+THAT_BASE = 4000
+
+# The RAM the fusion tests compare: the pointers, the temp segment, the
+# first statics, THIS and THAT, and the stack below SP
+FUSION_RAM = list(range(0, 13)) + list(range(16, 48)) + \
+    list(range(THIS_BASE, THIS_BASE + 8)) + \
+    list(range(THAT_BASE, THAT_BASE + 8)) + list(range(256, 300))
+
+
+def count(n):
+    """Sys.init counting n down with COUNT"""
+    return {"Sys.vm": ["function Sys.init 0",
+                       "push constant 0",
+                       f"push constant {n}",
+                       "call Sys.count 2",
+                       "pop temp 0",
+                       "label HALT",
+                       "goto HALT"] + COUNT}
+
+
+def program(lines):
+    """Sys.init running the VM lines with 11 locals, then halting"""
+    return {"Sys.vm": ["function Sys.init 11",
+                       f"push constant {THIS_BASE}",
+                       "pop pointer 0",
+                       f"push constant {THAT_BASE}",
+                       "pop pointer 1"] + lines +
+            ["label HALT",
+             "goto HALT"]}
+
+
+def push_value(value):
+    return [f"push constant {abs(value)}"] + (["neg"] if value < 0 else [])
+
+
+def branches(compare):
+    """
+    Lines testing each of PAIRS with compare, a list of commands leaving a
+    condition on the stack, and recording the branches not taken in statics
+    """
+    lines = []
+    for ind, (x, y) in enumerate(PAIRS):
+        lines.extend(push_value(x) + ["pop local 0"] +
+                     push_value(y) + ["pop local 1"] + compare +
+                     [f"if-goto TAKEN{ind}",
+                      "push constant 1",
+                      f"pop static {ind}",
+                      f"label TAKEN{ind}"])
+    return lines
+
+
+class TestTailCalls(unittest.TestCase):
+
+    def test_flat_stack(self):
+        result, depth = run(count(1), [RESULT, DEPTH], tail_calls=True)
+        self.assertEqual(result, 1)
+
+        for n in [2, 10, 100]:
+            self.assertEqual(run(count(n), [RESULT, DEPTH], tail_calls=True),
+                             [n, depth])
+        for options in [{"shared_calls": True},
+                        {"cache_tos": True},
+                        {"profile": "speed"},
+                        {"profile": "size"}]:
+            self.assertEqual(run(count(50), [RESULT, DEPTH],
+                                 tail_calls=True, **options),
+                             [50, depth])
+
+        # a frame of 5 words and 2 arguments per call without
+        self.assertEqual(run(count(100), [DEPTH])[0] -
+                         run(count(1), [DEPTH])[0], 99 * 7)
+
+    def test_not_tail_call(self):
+        asm = translate_text(count(10), tail_calls=True)
+        self.assertEqual(asm.count("@$TAIL\n"), 1)
+
+        # the result is used, or the call is left through a label
+        for tail in [["pop temp 0", "push temp 0"], ["label END"]]:
+            sources = {"Sys.vm": ["function Sys.init 0",
+                                  "call Sys.f 0"] + tail +
+                       ["return",
+                        "function Sys.f 0",
+                        "push constant 1",
+                        "return"]}
+            self.assertEqual(translate_text(sources, tail_calls=True),
+                             translate_text(sources))
+
+
+class TestFusion(unittest.TestCase):
+
+    def state(self, sources, **options):
+        """The RAM in FUSION_RAM once the sources halt"""
+        values = run(sources, FUSION_RAM, **options)
+        sp = values[0]
+        return [(address, value)
+                for address, value in zip(FUSION_RAM, values)
+                if address < 256 or address < sp]
+
+    def assertFused(self, idiom, lines):
+        """The lines run the same with and without fusing idiom"""
+        sources = program(lines)
+
+        for options in [{}, {"cache_tos": True}, {"profile": "speed"}]:
+            stats = TranslationStats()
+            fused = self.state(sources, fuse=True, stats=stats, **options)
+
+            self.assertGreater(stats.fusions[idiom], 0)
+            self.assertEqual(fused, self.state(sources, **options))
+
+    def test_inc_in_place(self):
+        lines = []
+        for segment, ind in [("local", 2), ("local", 10), ("argument", 0),
+                             ("static", 0), ("temp", 3), ("this", 1),
+                             ("that", 4)]:
+            for operation, delta in [("add", 1), ("sub", 1), ("add", 7),
+                                     ("sub", 300), ("add", 0)]:
+                lines.extend([f"push {segment} {ind}",
+                              f"push constant {delta}",
+                              operation,
+                              f"pop {segment} {ind}",
+                              f"push {segment} {ind}"])
+        self.assertFused("inc-in-place", lines)
+
+    def test_cmp_not_if(self):
+        for command in ["eq", "gt", "lt"]:
+            self.assertFused("cmp-not-if", branches(
+                ["push local 0", "push local 1", command, "not"]))
+
+    def test_cmp_if(self):
+        for command in ["eq", "gt", "lt"]:
+            self.assertFused("cmp-if", branches(
+                ["push local 0", "push local 1", command]))
+
+    def test_not_if(self):
+        self.assertFused("not-if", branches(["push local 0", "not"]))
+
+    def test_move(self):
+        self.assertFused("move", ["push constant 7",
+                                  "pop local 10",
+                                  "push local 10",
+                                  "pop static 2",
+                                  "push static 2",
+                                  "pop this 3",
+                                  "push this 3",
+                                  "pop that 5",
+                                  "push that 5",
+                                  "pop temp 7",
+                                  "push temp 7",
+                                  "pop local 1",
+                                  "push pointer 1",
+                                  "pop static 3",
+                                  "push constant 0",
+                                  "pop pointer 0",
+                                  "push static 3",
+                                  "pop pointer 0",
+                                  "push local 1",
+                                  "neg",
+                                  "pop this 2"])
+
+    def test_split_by_label(self):
+        # a jump to the label would skip the first half
+        lines = ["push local 0",
+                 "label A",
+                 "pop local 1",
+                 "push local 2",
+                 "push constant 1",
+                 "label B",
+                 "add",
+                 "pop local 2",
+                 "push local 0",
+                 "push local 1",
+                 "eq",
+                 "label C",
+                 "not",
+                 "label D",
+                 "if-goto A"]
+        sources = {"Sys.vm": ["function Sys.init 3"] + lines}
+        stats = TranslationStats()
+
+        self.assertEqual(translate_text(sources, fuse=True, stats=stats),
+                         translate_text(sources))
+        self.assertEqual(sum(stats.fusions.values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
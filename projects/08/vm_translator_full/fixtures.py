@@ -0,0 +1,60 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from hack_backend import ASSEMBLER_DIR
+from translator import translate
+
+"""
+Helpers for the tests: they write VM sources given as {file name: lines} to
+a temporary directory, translate them, and run the result with the
+emulator in 06/assembler.
+"""
+
+EMULATOR = os.path.join(ASSEMBLER_DIR, "emulator.py")
+
+MAX_CYCLES = 1000000
+
+
+def write_files(tmp_dir: str, sources: Dict[str, List[str]]) -> List[str]:
+    """Writes the sources to tmp_dir and returns their paths"""
+    files = []
+    for name, lines in sorted(sources.items()):
+        vm_file = os.path.join(tmp_dir, name)
+        with open(vm_file, "w") as outfile:
+            outfile.write("\n".join(lines) + "\n")
+        files.append(vm_file)
+    return files
+
+
+def translate_text(sources: Dict[str, List[str]], **options) -> str:
+    """Returns the Hack assembly the sources translate to"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asm_file = os.path.join(tmp_dir, "Test.asm")
+        translate(write_files(tmp_dir, sources), asm_file, **options)
+        with open(asm_file, "r") as infile:
+            return infile.read()
+
+
+def run(sources: Dict[str, List[str]], addresses: List[int],
+        **options) -> List[int]:
+    """
+    Translates the sources to machine code, runs it with the emulator until
+    it halts and returns the RAM values at addresses
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        hack_file = os.path.join(tmp_dir, "Test.hack")
+        translate(write_files(tmp_dir, sources), hack_file, binary=True,
+                  **options)
+        output = subprocess.run(
+            [sys.executable, EMULATOR, hack_file, "--until-halt",
+             "-n", str(MAX_CYCLES), "--ram"] +
+            [str(address) for address in addresses],
+            stdout=subprocess.PIPE, universal_newlines=True,
+            check=True).stdout
+
+    values = dict(re.findall(r"RAM\[(\d+)\]=(\d+)", output))
+    return [int(values[str(address)]) for address in addresses]
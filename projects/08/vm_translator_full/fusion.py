@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from command_types import CommandType
+from vm_ir import VMCommand
+
+"""
+Multi-command idioms the CodeWriter can translate as one unit, without
+going through the stack in between:
+
+  inc-in-place   push S i, push constant c, add|sub, pop S i
+  cmp-not-if     eq|gt|lt, not, if-goto L
+  cmp-if         eq|gt|lt, if-goto L
+  not-if         not, if-goto L
+  move           push S1 i, pop S2 j
+
+Idioms are tried in this order at each command, so the longest wins.
+"""
+
+COMPARISONS = ("eq", "gt", "lt")
+
+
+def is_arithmetic(command: VMCommand, *operations: str) -> bool:
+    return command.kind == CommandType.C_ARITHMETIC and \
+        command.arg1 in operations
+
+
+def match_inc_in_place(commands: List[VMCommand]) -> bool:
+    return len(commands) >= 4 and \
+        commands[0].kind == CommandType.C_PUSH and \
+        commands[0].arg1 != "constant" and \
+        commands[1].kind == CommandType.C_PUSH and \
+        commands[1].arg1 == "constant" and \
+        is_arithmetic(commands[2], "add", "sub") and \
+        commands[3].kind == CommandType.C_POP and \
+        (commands[3].arg1, commands[3].arg2) == \
+        (commands[0].arg1, commands[0].arg2)
+
+
+def match_cmp_not_if(commands: List[VMCommand]) -> bool:
+    return len(commands) >= 3 and \
+        is_arithmetic(commands[0], *COMPARISONS) and \
+        is_arithmetic(commands[1], "not") and \
+        commands[2].kind == CommandType.C_IF
+
+
+def match_cmp_if(commands: List[VMCommand]) -> bool:
+    return len(commands) >= 2 and \
+        is_arithmetic(commands[0], *COMPARISONS) and \
+        commands[1].kind == CommandType.C_IF
+
+
+def match_not_if(commands: List[VMCommand]) -> bool:
+    return len(commands) >= 2 and \
+        is_arithmetic(commands[0], "not") and \
+        commands[1].kind == CommandType.C_IF
+
+
+def match_move(commands: List[VMCommand]) -> bool:
+    return len(commands) >= 2 and \
+        commands[0].kind == CommandType.C_PUSH and \
+        commands[1].kind == CommandType.C_POP
+
+
+# name: (matcher, number of commands)
+IDIOMS = OrderedDict([("inc-in-place", (match_inc_in_place, 4)),
+                      ("cmp-not-if", (match_cmp_not_if, 3)),
+                      ("cmp-if", (match_cmp_if, 2)),
+                      ("not-if", (match_not_if, 2)),
+                      ("move", (match_move, 2))])
+
+LONGEST_IDIOM = max(length for _, length in IDIOMS.values())
+
+
+def match_idiom(commands: List[VMCommand]) -> Optional[Tuple[str, int]]:
+    """
+    Returns (idiom, length) for the idiom commands start with, None if there
+    is none
+    """
+    for name, (matcher, length) in IDIOMS.items():
+        if matcher(commands):
+            return name, length
+    return None
@@ -0,0 +1,150 @@
+import importlib.util
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+"""
+Builds Hack machine code straight from the instructions CodeWriter
+generates, without writing assembly text and assembling it again. Each
+instruction is encoded as it comes in, A-instructions naming a symbol leave
+a fixup that link() resolves once every label is known. The words are the
+same the assembler in 06/assembler produces for the text.
+"""
+
+ASSEMBLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "06", "assembler")
+
+# As in 06/assembler/assembler.py
+MAX_A_VALUE = 0x7FFF
+VARIABLE_BASE_ADDR = 16
+PREDEFINED_SYMBOLS = {"SP": 0,
+                      "LCL": 1,
+                      "ARG": 2,
+                      "THIS": 3,
+                      "THAT": 4,
+                      "SCREEN": 16384,
+                      "KBD": 24576}
+PREDEFINED_SYMBOLS.update((f"R{i}", i) for i in range(16))
+
+_assembler_modules = {}
+
+
+def assembler_module(name: str):
+    """
+    Returns a module of 06/assembler, loaded by path since its names clash
+    with ours (parser) and the standard library's (code)
+    """
+    if name not in _assembler_modules:
+        spec = importlib.util.spec_from_file_location(
+            f"hack_{name}", os.path.join(ASSEMBLER_DIR, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _assembler_modules[name] = module
+    return _assembler_modules[name]
+
+
+_encoder = None
+
+
+def encoder():
+    """The process' memoizing C-instruction Encoder"""
+    global _encoder
+    if _encoder is None:
+        _encoder = assembler_module("code").Encoder()
+    return _encoder
+
+
+class HackBuilder(object):
+    """
+    Machine code under construction: the words so far, the labels defined
+    and the (address, symbol) fixups left to resolve. keep_text also keeps
+    the instructions as text, for an .asm file.
+    """
+
+    def __init__(self, keep_text: bool = False):
+        self.words = array("H")
+        self.labels: Dict[str, int] = {}
+        self.fixups: List[Tuple[int, str]] = []
+        self.lines: Optional[List[str]] = [] if keep_text else None
+
+    def define(self, label: str, address: int):
+        if label in self.labels:
+            raise Exception(f"({label}) symbol occurs more than once")
+        self.labels[label] = address
+        return
+
+    def write_asm(self, cmds: List[str]):
+        """Adds CodeWriter's instructions, labels and comments"""
+        encode = encoder().encode
+        words = self.words
+
+        for cmd in cmds:
+            first = cmd[:1]
+            if first == "@":
+                value = cmd[1:]
+                if value.isdigit():
+                    value = int(value)
+                    if value > MAX_A_VALUE:
+                        raise Exception(f"[{value}] is too large to load "
+                                        "to A")
+                    words.append(value)
+                elif value in PREDEFINED_SYMBOLS:
+                    words.append(PREDEFINED_SYMBOLS[value])
+                else:
+                    self.fixups.append((len(words), value))
+                    words.append(0)
+            elif first == "(":
+                self.define(cmd[1:-1], len(words))
+            elif first and first != "/":
+                words.append(encode(cmd))
+
+        if self.lines is not None:
+            self.lines.extend(cmds)
+        return
+
+    def append(self, fragment: "HackBuilder"):
+        """Adds the code of another HackBuilder, relocated to follow ours"""
+        offset = len(self.words)
+        for label, address in fragment.labels.items():
+            self.define(label, address + offset)
+        self.words.extend(fragment.words)
+        self.fixups.extend((address + offset, symbol)
+                           for address, symbol in fragment.fixups)
+        if self.lines is not None:
+            self.lines.extend(fragment.lines)
+        return
+
+    def link(self) -> array:
+        """
+        Returns the words with every fixup resolved. Symbols that aren't
+        labels are variables, given addresses from 16 on in order of first
+        use.
+        """
+        words = array("H", self.words)
+        variables = {}
+
+        for address, symbol in self.fixups:
+            if symbol in self.labels:
+                value = self.labels[symbol]
+            else:
+                value = variables.setdefault(
+                    symbol, VARIABLE_BASE_ADDR + len(variables))
+            if value > MAX_A_VALUE:
+                raise Exception(f"[{value}] is too large to load to A")
+            words[address] = value
+
+        return words
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+    def save(self, dest: str, asm_dest: Optional[str] = None):
+        """
+        Writes the linked words to dest, a .hack file or a packed .rom
+        image, and the text to asm_dest if given (needs keep_text)
+        """
+        assembler_module("rom").save(self.link(), dest)
+        if asm_dest is not None:
+            with open(asm_dest, "w") as outfile:
+                outfile.write(self.text())
+        return
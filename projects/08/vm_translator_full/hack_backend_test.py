@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from fixtures import write_files
+from hack_backend import ASSEMBLER_DIR, HackBuilder
+from translator import translate
+
+ASSEMBLER = os.path.join(ASSEMBLER_DIR, "assembler.py")
+
+# Two files defining the same function
+DUPLICATE_FUNCTION = {"Main.vm": ["function Foo.bar 0",
+                                  "push constant 1",
+                                  "return"],
+                      "Foo.vm": ["function Foo.bar 0",
+                                 "push constant 2",
+                                 "return"]}
+
+
+class TestHackBuilder(unittest.TestCase):
+
+    def test_link(self):
+        builder = HackBuilder()
+        builder.write_asm(["@END", "0;JMP", "@x", "M=1", "(END)", "@y",
+                           "// comment", "@x", "D=M", "@SCREEN"])
+
+        self.assertEqual(list(builder.link()),
+                         [4, 0b1110101010000111, 16, 0b1110111111001000,
+                          17, 16, 0b1111110000010000, 16384])
+
+    def test_append(self):
+        builder = HackBuilder()
+        builder.write_asm(["@LOOP", "0;JMP"])
+        fragment = HackBuilder()
+        fragment.write_asm(["(LOOP)", "@LOOP", "0;JMP"])
+        builder.append(fragment)
+
+        self.assertEqual(list(builder.link()),
+                         [2, 0b1110101010000111, 2, 0b1110101010000111])
+
+    def test_duplicate_label(self):
+        builder = HackBuilder()
+        builder.write_asm(["(LOOP)", "@LOOP", "0;JMP"])
+
+        with self.assertRaisesRegex(Exception, "occurs more than once"):
+            builder.write_asm(["(LOOP)", "0;JMP"])
+
+        fragment = HackBuilder()
+        fragment.write_asm(["(LOOP)", "0;JMP"])
+        with self.assertRaisesRegex(Exception, "occurs more than once"):
+            builder.append(fragment)
+
+
+class TestDuplicateFunction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.files = write_files(self.tmp_dir.name, DUPLICATE_FUNCTION)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_text(self):
+        asm_file = os.path.join(self.tmp_dir.name, "Main.asm")
+        translate(self.files, asm_file)
+
+        result = subprocess.run(
+            [sys.executable, ASSEMBLER, asm_file,
+             os.path.join(self.tmp_dir.name, "Main.hack")],
+            stderr=subprocess.PIPE, universal_newlines=True, check=False)
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("(Foo.bar) symbol occurs more than once",
+                      result.stderr)
+
+    def test_hack(self):
+        hack_file = os.path.join(self.tmp_dir.name, "Main.hack")
+
+        for jobs in [None, 2]:
+            with self.assertRaisesRegex(
+                    Exception, r"\(Foo.bar\) symbol occurs more than once"):
+                translate(self.files, hack_file, jobs=jobs, binary=True)
+            self.assertFalse(os.path.exists(hack_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
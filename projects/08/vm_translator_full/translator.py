@@ -1,10 +1,20 @@
-from parser import Parser
-from code_writer import CodeWriter
+from code_writer import PROFILES, CodeWriter
+from hack_backend import HackBuilder
 from command_types import CommandType
 from memory_segment_types import MemorySegType
-import sys
+from vm_ir import Function, Program, VMCommand, build_program, \
+    read_commands
+from vm_passes import INLINE_GROWTH, INLINE_SIZE, PASSES, PassManager, \
+    inline_functions, remove_dead_functions
+from fusion import IDIOMS, LONGEST_IDIOM, match_idiom
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import io
 import os
 import glob
+import textwrap
+from typing import Dict, List, Optional, Tuple
 
 """
 Single Arg. Cmds
@@ -30,49 +40,366 @@ segment_map = {"argument": MemorySegType.M_ARGUMENT,
                "temp": MemorySegType.M_TEMP}
 
 
-if __name__ == "__main__":
-
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} <{sys.argv[1]}>")
-
+def find_files(target: str):
+    """
+    Returns (files, dest) for a .vm file or a directory of .vm files, dest
+    being the .asm file to create
+    """
     files = []
     target_dir = ""
-    if sys.argv[1].endswith('.vm'):
-        files.append(sys.argv[1])
-    elif os.path.isdir(sys.argv[1]):
-        files.extend(glob.glob(f"{sys.argv[1]}*.vm"))
-        target_dir = sys.argv[1]
+    if target.endswith('.vm'):
+        files.append(target)
+    elif os.path.isdir(target):
+        files.extend(sorted(glob.glob(f"{target}*.vm")))
+        target_dir = target
     else:
         raise Exception("Error: target must be a .vm file or a directory")
 
-    cw = CodeWriter(target_dir + sys.argv[1].strip("/.vm") + ".asm")
-
-    print(f"Creating {target_dir + sys.argv[1].strip('/.vm') + '.asm'} ...")
-
-    for f in files:
-        p = Parser(f)
-        cw.file_name = f.split("/")[-1]
-        while p.advance():
-            if p.command_type == CommandType.C_ARITHMETIC:
-                cw.write_arithmetic(p.arg1())
-            elif p.command_type == CommandType.C_PUSH:
-                cw.write_push_pop(CommandType.C_PUSH,
-                                  segment_map[p.arg1()], p.arg2())
-            elif p.command_type == CommandType.C_POP:
-                cw.write_push_pop(CommandType.C_POP,
-                                  segment_map[p.arg1()], p.arg2())
-            elif p.command_type == CommandType.C_LABEL:
-                cw.write_label(p.arg1())
-            elif p.command_type == CommandType.C_GOTO:
-                cw.write_goto(p.arg1())
-            elif p.command_type == CommandType.C_IF:
-                cw.write_if(p.arg1())
-            elif p.command_type == CommandType.C_CALL:
-                cw.write_call(p.arg1(), p.arg2())
-            elif p.command_type == CommandType.C_FUNCTION:
-                cw.curr_fn = p.arg1()
-                cw.write_function(p.arg1(), p.arg2())
-            elif p.command_type == CommandType.C_RETURN:
-                cw.write_return()
+    return files, target_dir + target.strip("/.vm") + ".asm"
+
+
+# CodeWriter call for each command type
+COMMAND_WRITERS = {
+    CommandType.C_ARITHMETIC: lambda cw, c: cw.write_arithmetic(c.arg1),
+    CommandType.C_PUSH: lambda cw, c: cw.write_push_pop(
+        CommandType.C_PUSH, segment_map[c.arg1], c.arg2),
+    CommandType.C_POP: lambda cw, c: cw.write_push_pop(
+        CommandType.C_POP, segment_map[c.arg1], c.arg2),
+    CommandType.C_LABEL: lambda cw, c: cw.write_label(c.arg1),
+    CommandType.C_GOTO: lambda cw, c: cw.write_goto(c.arg1),
+    CommandType.C_IF: lambda cw, c: cw.write_if(c.arg1),
+    CommandType.C_CALL: lambda cw, c: cw.write_call(c.arg1, c.arg2),
+    CommandType.C_FUNCTION: lambda cw, c: cw.write_function(c.arg1, c.arg2),
+    CommandType.C_RETURN: lambda cw, c: cw.write_return()}
+
+
+def write_command(cw: CodeWriter, command: VMCommand):
+    COMMAND_WRITERS[command.kind](cw, command)
+    return
+
+
+class TranslationStats(object):
+    """Collects what translate did, for the report printed by the CLI"""
+
+    def __init__(self):
+        self.passes: Optional[PassManager] = None
+        self.fusions = OrderedDict((name, 0) for name in IDIOMS)
+        self.dead_functions: Optional[List[Function]] = None
+        self.inlined: Optional[Dict[str, int]] = None
+        self.inline_growth = 0
+
+    def report(self) -> str:
+        lines = []
+        if self.inlined is not None:
+            lines.append(f"inlined {sum(self.inlined.values())} calls to "
+                         f"{len(self.inlined)} functions, "
+                         f"+{self.inline_growth} VM commands")
+            lines.extend(textwrap.wrap(
+                ", ".join(f"{name} x{count}"
+                          for name, count in self.inlined.items()),
+                initial_indent="  ", subsequent_indent="  "))
+        if self.dead_functions is not None:
+            lines.append(f"dropped {len(self.dead_functions)} unreachable "
+                         "functions, "
+                         f"{sum(len(f) for f in self.dead_functions)} "
+                         "VM commands")
+            lines.extend(textwrap.wrap(
+                ", ".join(f.name for f in self.dead_functions),
+                initial_indent="  ", subsequent_indent="  "))
+        if self.passes is not None:
+            lines.append(self.passes.report())
+        if any(self.fusions.values()):
+            lines.extend(f"{name:<20}{hits:>8} hits"
+                         for name, hits in self.fusions.items())
+        return "\n".join(lines)
+
+
+def write_fused(cw: CodeWriter, idiom: str, commands: List[VMCommand]):
+    if idiom == "inc-in-place":
+        delta = commands[1].arg2
+        if commands[2].arg1 == "sub":
+            delta = -delta
+        cw.write_increment(segment_map[commands[0].arg1], commands[0].arg2,
+                           delta)
+    elif idiom == "cmp-not-if":
+        cw.write_compare_if(commands[0].arg1, True, commands[2].arg1)
+    elif idiom == "cmp-if":
+        cw.write_compare_if(commands[0].arg1, False, commands[1].arg1)
+    elif idiom == "not-if":
+        cw.write_if_not(commands[1].arg1)
+    elif idiom == "move":
+        cw.write_move(segment_map[commands[0].arg1], commands[0].arg2,
+                      segment_map[commands[1].arg1], commands[1].arg2)
+    return
+
+
+def write_commands(cw: CodeWriter, commands: List[Tuple[str, VMCommand]],
+                   fuse: bool, fusions: Dict[str, int]):
+    """
+    Writes the (file name, command) pairs, counting the idioms fused in
+    fusions
+    """
+    ind = 0
+    while ind < len(commands):
+        file_name, command = commands[ind]
+        cw.file_name = file_name
+        if command.kind == CommandType.C_FUNCTION:
+            cw.curr_fn = command.arg1
+
+        idiom = None
+        if fuse:
+            window = [c for f, c in commands[ind:ind + LONGEST_IDIOM]
+                      if f == file_name]
+            idiom = match_idiom(window)
+
+        if idiom is not None:
+            name, length = idiom
+            fused = window[:length]
+            cw.write_annotation("; ".join(c.text for c in fused))
+            write_fused(cw, name, fused)
+            fusions[name] += 1
+            ind += length
+        else:
+            cw.write_annotation(command.text)
+            write_command(cw, command)
+            ind += 1
+    return
+
+
+def translate_fragment(path: str, commands: Optional[List[VMCommand]],
+                       fuse: bool, options: dict, binary: bool = False,
+                       keep_text: bool = False):
+    """
+    Translates one .vm file on its own, reading it unless its commands are
+    given. Returns (asm, shared routines used, fusion hits) for
+    CodeWriter.write_fragment, asm being a HackBuilder if binary. Runs in
+    the worker processes of translate.
+    """
+    file_name = path.split("/")[-1]
+    if commands is None:
+        commands = read_commands(path)
+
+    fusions = OrderedDict((name, 0) for name in IDIOMS)
+    out = HackBuilder(keep_text) if binary else io.StringIO()
+    cw = CodeWriter(out, bootstrap=False,
+                    namespace=file_name[:-len(".vm")], **options)
+    cw.file_name = file_name
+    write_commands(cw, [(file_name, command) for command in commands],
+                   fuse, fusions)
+    cw.close(routines=False)
+
+    return out if binary else out.getvalue(), cw.routines_used, fusions
+
+
+def write_fragments(cw: CodeWriter, files: List[str],
+                    program: Optional[Program], fuse: bool, jobs: int,
+                    binary: bool, keep_text: bool, stats: TranslationStats,
+                    options: dict):
+    """
+    Translates each file with translate_fragment, in jobs worker processes
+    (one per CPU core for 0), and writes the fragments to cw in file order
+    """
+    by_file = OrderedDict((f.split("/")[-1], None) for f in files)
+    if program is not None:
+        for file_name in by_file:
+            by_file[file_name] = []
+        for file_name, command in program.commands():
+            by_file[file_name].append(command)
+
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    elif jobs < 0:
+        raise Exception(f"Error: can't translate in {jobs} jobs.")
+
+    options = dict(options)
+    options.pop("bootstrap", None)
+    args = ([files, list(by_file.values()), [fuse] * len(files),
+             [options] * len(files), [binary] * len(files),
+             [keep_text] * len(files)])
+
+    if jobs == 1 or len(files) <= 1:
+        fragments = list(map(translate_fragment, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            fragments = list(executor.map(translate_fragment, *args))
+
+    for asm, routines_used, fusions in fragments:
+        cw.write_fragment(asm, routines_used)
+        for name, hits in fusions.items():
+            stats.fusions[name] += hits
+    return
+
+
+def translate(files: List[str], dest: str,
+              passes: Optional[List[str]] = None, fuse: bool = False,
+              dead_functions: bool = False, inline: bool = False,
+              inline_size: int = INLINE_SIZE,
+              inline_growth: int = INLINE_GROWTH,
+              jobs: Optional[int] = None, binary: bool = False,
+              asm_dest: Optional[str] = None,
+              stats: Optional[TranslationStats] = None, **options):
+    """
+    Translates the .vm files into the single .asm file dest. options are
+    passed on to CodeWriter.
+
+    binary generates machine code directly instead (see hack_backend), dest
+    then being a .hack file or a packed .rom image. The text is only written
+    if asm_dest is given.
+
+    Without passes the files are translated command by command. Otherwise
+    the whole program is read into the VM IR first and the named passes
+    (see vm_passes.PASSES) are run over it. dead_functions drops the
+    functions Sys.init never reaches, also through the IR. inline inlines
+    the calls to functions of at most inline_size VM commands, adding at
+    most inline_growth commands (see vm_passes.inline_functions). It runs
+    first, so the functions no longer called can be dropped and the
+    inlined code is optimized with its caller. fuse translates the idioms
+    in fusion.IDIOMS as single units. What was done is recorded in stats.
+
+    With jobs each file is translated in one of jobs worker processes (see
+    translate_fragment), or one per CPU core when jobs is 0, and the
+    fragments are put together in file order. The labels each file
+    generates carry its name, so the output is the same whatever the
+    number of jobs.
+    """
+    if stats is None:
+        stats = TranslationStats()
+
+    builder = HackBuilder(asm_dest is not None) if binary else None
+    cw = CodeWriter(builder or dest, **options)
+
+    if passes is None and not dead_functions and not inline:
+        program = None
+    else:
+        program = build_program(files)
+        if inline:
+            stats.inlined, stats.inline_growth = inline_functions(
+                program, inline_size, inline_growth)
+        if dead_functions:
+            stats.dead_functions = remove_dead_functions(program)
+        if passes is not None:
+            stats.passes = PassManager(passes)
+            stats.passes.run(program)
+
+    if jobs is None:
+        if program is None:
+            commands = [(f.split("/")[-1], command)
+                        for f in files for command in read_commands(f)]
+        else:
+            commands = list(program.commands())
+        write_commands(cw, commands, fuse, stats.fusions)
+    else:
+        write_fragments(cw, files, program, fuse, jobs, binary,
+                        asm_dest is not None, stats, options)
+
+    cw.close()
+    if builder is not None:
+        builder.save(dest, asm_dest)
+    return stats
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(
+        description="Translates VM code into Hack assembly")
+    arg_parser.add_argument("target",
+                            help=".vm file or directory of .vm files")
+    arg_parser.add_argument("--annotate", action="store_true",
+                            help="precede each VM command's code with a "
+                            "'//vm <function> <command>' comment")
+    arg_parser.add_argument("--no-bootstrap", action="store_true",
+                            help="don't emit the SP setup and call to "
+                            "Sys.init")
+    arg_parser.add_argument("--shared-calls", action="store_true",
+                            help="jump to one shared call and return "
+                            "routine instead of inlining them")
+    arg_parser.add_argument("--shared-comparisons", action="store_true",
+                            help="jump to shared eq/gt/lt routines instead "
+                            "of inlining them")
+    arg_parser.add_argument("--cache-tos", action="store_true",
+                            help="keep the top of the stack in D within "
+                            "basic blocks")
+    arg_parser.add_argument("-O", dest="profile", choices=list(PROFILES),
+                            help="code generation profile: -Ospeed or "
+                            "-Osize")
+    arg_parser.add_argument("--tail-calls", action="store_true",
+                            help="reuse the current frame for a call "
+                            "directly followed by return")
+    arg_parser.add_argument("--passes", nargs="*", metavar="PASS",
+                            choices=list(PASSES),
+                            help="optimize the program in the VM IR first, "
+                            "with the given passes (all if none given): "
+                            f"{', '.join(PASSES)}")
+    arg_parser.add_argument("--fuse", action="store_true",
+                            help="translate common command sequences as "
+                            "single units and report their hits")
+    arg_parser.add_argument("--drop-dead-functions", action="store_true",
+                            help="only translate the functions reachable "
+                            "from Sys.init and list the others")
+    arg_parser.add_argument("--inline", action="store_true",
+                            help="inline the calls to small functions that "
+                            "call nothing")
+    arg_parser.add_argument("--inline-size", type=int, default=INLINE_SIZE,
+                            metavar="N",
+                            help="largest function to inline, in VM "
+                            f"commands (default {INLINE_SIZE})")
+    arg_parser.add_argument("--inline-growth", type=int,
+                            default=INLINE_GROWTH, metavar="N",
+                            help="VM commands inlining may add in total "
+                            f"(default {INLINE_GROWTH})")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=None,
+                            help="translate the files in this many worker "
+                            "processes, 0 for one per CPU core")
+    binary_format = arg_parser.add_mutually_exclusive_group()
+    binary_format.add_argument("--hack", dest="binary", action="store_const",
+                               const=".hack",
+                               help="write machine code to a .hack file "
+                               "instead of assembly")
+    binary_format.add_argument("--rom", dest="binary", action="store_const",
+                               const=".rom",
+                               help="write machine code to a packed .rom "
+                               "image instead of assembly")
+    arg_parser.add_argument("--asm", action="store_true",
+                            help="with --hack or --rom, also write the "
+                            "assembly")
+    args = arg_parser.parse_args()
+
+    if args.jobs is not None and args.jobs < 0:
+        arg_parser.error("--jobs can't be negative")
+
+    files, dest = find_files(args.target)
+    asm_dest = None
+    if args.binary:
+        if args.asm:
+            asm_dest = dest
+        dest = dest[:-len(".asm")] + args.binary
+
+    print(f"Creating {dest} ...")
+
+    passes = args.passes
+    if passes == []:
+        passes = list(PASSES)
+
+    stats = translate(files, dest,
+                      passes=passes,
+                      fuse=args.fuse,
+                      dead_functions=args.drop_dead_functions,
+                      inline=args.inline,
+                      inline_size=args.inline_size,
+                      inline_growth=args.inline_growth,
+                      jobs=args.jobs,
+                      binary=args.binary is not None,
+                      asm_dest=asm_dest,
+                      annotate=args.annotate,
+                      bootstrap=not args.no_bootstrap,
+                      shared_calls=args.shared_calls,
+                      shared_comparisons=args.shared_comparisons,
+                      cache_tos=args.cache_tos,
+                      tail_calls=args.tail_calls,
+                      profile=args.profile)
+
+    report = stats.report()
+    if report:
+        print(report)
 
     print("Success.")
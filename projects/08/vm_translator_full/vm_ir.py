@@ -0,0 +1,139 @@
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from parser import Parser
+from command_types import CommandType
+
+"""
+In-memory form of a whole VM program: the commands of every file, grouped
+into functions and each function into basic blocks. A block starts at a
+label (or after a jump) and ends with goto, if-goto or return, or falls
+through into the next block. Passes (see vm_passes) rewrite the blocks
+before code generation.
+"""
+
+KEYWORDS = {CommandType.C_PUSH: "push",
+            CommandType.C_POP: "pop",
+            CommandType.C_LABEL: "label",
+            CommandType.C_GOTO: "goto",
+            CommandType.C_IF: "if-goto",
+            CommandType.C_FUNCTION: "function",
+            CommandType.C_CALL: "call",
+            CommandType.C_RETURN: "return"}
+
+TERMINATORS = (CommandType.C_GOTO, CommandType.C_IF, CommandType.C_RETURN)
+
+
+class VMCommand(NamedTuple):
+    """A parsed VM command. arg1 is the operation for C_ARITHMETIC."""
+    kind: CommandType
+    arg1: Optional[str] = None
+    arg2: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        if self.kind == CommandType.C_ARITHMETIC:
+            return self.arg1
+        return " ".join([KEYWORDS[self.kind]] +
+                        [str(arg) for arg in (self.arg1, self.arg2)
+                         if arg is not None])
+
+
+def read_commands(infile: str) -> List[VMCommand]:
+    """Returns the commands of a .vm file"""
+    return [VMCommand(c.command_type, c.arg1, c.arg2)
+            for c in Parser(infile).commands()]
+
+
+class BasicBlock(object):
+    """Commands between a label (if any) and the next jump or label"""
+
+    def __init__(self, label: Optional[str] = None):
+        self.label = label
+        self.commands: List[VMCommand] = []
+
+    @property
+    def terminator(self) -> Optional[VMCommand]:
+        """The jump or return ending the block, None if it falls through"""
+        if self.commands and self.commands[-1].kind in TERMINATORS:
+            return self.commands[-1]
+        return None
+
+    @property
+    def falls_through(self) -> bool:
+        terminator = self.terminator
+        return terminator is None or terminator.kind == CommandType.C_IF
+
+
+class Function(object):
+    """
+    A VM function's blocks. Commands ahead of the first function of a file
+    form a Function without a header.
+    """
+
+    def __init__(self, file_name: str, header: Optional[VMCommand] = None):
+        self.file_name = file_name
+        self.header = header
+        self.blocks: List[BasicBlock] = [BasicBlock()]
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.header.arg1 if self.header is not None else None
+
+    def __len__(self):
+        return (sum(len(block.commands) + (block.label is not None)
+                    for block in self.blocks) +
+                (self.header is not None))
+
+    def append(self, command: VMCommand):
+        if command.kind == CommandType.C_LABEL:
+            self.blocks.append(BasicBlock(command.arg1))
+            return
+
+        if self.blocks[-1].terminator is not None:
+            self.blocks.append(BasicBlock())
+        self.blocks[-1].commands.append(command)
+
+    def commands(self) -> Iterator[VMCommand]:
+        if self.header is not None:
+            yield self.header
+        for block in self.blocks:
+            if block.label is not None:
+                yield VMCommand(CommandType.C_LABEL, block.label)
+            yield from block.commands
+
+
+class Program(object):
+    """Every function of a VM program, in source order"""
+
+    def __init__(self):
+        self.functions: List[Function] = []
+
+    def __len__(self):
+        return sum(len(function) for function in self.functions)
+
+    def commands(self) -> Iterator[Tuple[str, VMCommand]]:
+        """Yields (file name, command) in source order"""
+        for function in self.functions:
+            for command in function.commands():
+                yield function.file_name, command
+
+
+def build_program(files: List[str]) -> Program:
+    """Reads the .vm files into a Program"""
+    program = Program()
+
+    for f in files:
+        file_name = f.split("/")[-1]
+        function = Function(file_name)
+
+        for command in read_commands(f):
+            if command.kind == CommandType.C_FUNCTION:
+                if len(function):
+                    program.functions.append(function)
+                function = Function(file_name, command)
+            else:
+                function.append(command)
+
+        if len(function):
+            program.functions.append(function)
+
+    return program
@@ -0,0 +1,595 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from command_types import CommandType
+from vm_ir import Function, Program, VMCommand
+
+"""
+Optimization passes over the VM IR. Each pass rewrites one Function in place
+and returns the number of changes it made. remove_dead_functions works on
+the whole Program instead.
+"""
+
+# The VM's arithmetic on 16-bit words, x being the deeper operand. The
+# comparisons test x - y like the generated code does.
+BINARY_OPS = {"add": lambda x, y: (x + y) & 0xFFFF,
+              "sub": lambda x, y: (x - y) & 0xFFFF,
+              "and": lambda x, y: x & y,
+              "or": lambda x, y: x | y,
+              "eq": lambda x, y: 0xFFFF if (x - y) & 0xFFFF == 0 else 0,
+              "gt": lambda x, y: 0xFFFF if 0 < (x - y) & 0xFFFF < 0x8000
+              else 0,
+              "lt": lambda x, y: 0xFFFF if (x - y) & 0x8000 else 0}
+UNARY_OPS = {"neg": lambda x: -x & 0xFFFF,
+             "not": lambda x: x ^ 0xFFFF}
+
+MAX_CONSTANT = 32767
+
+# Rounds of the whole pipeline before giving up on reaching a fixpoint
+MAX_ROUNDS = 8
+
+# Largest function inline_functions inlines and how many VM commands it may
+# add to the program in total. The growth is counted in VM commands rather
+# than ROM words, so it only bounds the ROM growth roughly
+INLINE_SIZE = 16
+INLINE_GROWTH = 400
+
+
+def constant_commands(value: int) -> List[VMCommand]:
+    """Returns the shortest commands pushing the 16-bit value"""
+    if value <= MAX_CONSTANT:
+        return [VMCommand(CommandType.C_PUSH, "constant", value)]
+    return [VMCommand(CommandType.C_PUSH, "constant", value ^ 0xFFFF),
+            VMCommand(CommandType.C_ARITHMETIC, "not")]
+
+
+def constant_at(commands: List[VMCommand],
+                end: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns (value, length) if commands[:end] ends with commands pushing a
+    constant: 'push constant c', optionally followed by neg or not
+    """
+    if end >= 1 and commands[end - 1].kind == CommandType.C_PUSH and \
+       commands[end - 1].arg1 == "constant":
+        return commands[end - 1].arg2, 1
+
+    if end >= 2 and commands[end - 1].kind == CommandType.C_ARITHMETIC and \
+       commands[end - 1].arg1 in UNARY_OPS:
+        inner = constant_at(commands, end - 1)
+        if inner is not None and inner[1] == 1:
+            return UNARY_OPS[commands[end - 1].arg1](inner[0]), 2
+
+    return None
+
+
+def fold_tail(out: List[VMCommand]) -> bool:
+    """Folds the constant operation at the end of out, if there is one"""
+    last = out[-1]
+
+    if last.kind == CommandType.C_ARITHMETIC and last.arg1 in BINARY_OPS:
+        y = constant_at(out, len(out) - 1)
+        if y is None:
+            return False
+        x = constant_at(out, len(out) - 1 - y[1])
+        if x is None:
+            return False
+
+        replaced = 1 + x[1] + y[1]
+        folded = constant_commands(BINARY_OPS[last.arg1](x[0], y[0]))
+
+    elif last.kind == CommandType.C_ARITHMETIC and last.arg1 in UNARY_OPS:
+        x = constant_at(out, len(out) - 1)
+        if x is None:
+            return False
+
+        replaced = 1 + x[1]
+        folded = constant_commands(UNARY_OPS[last.arg1](x[0]))
+
+    elif last.kind == CommandType.C_IF:
+        x = constant_at(out, len(out) - 1)
+        if x is None:
+            return False
+
+        # the branch is always or never taken
+        replaced = 1 + x[1]
+        folded = [VMCommand(CommandType.C_GOTO, last.arg1)] if x[0] else []
+
+    else:
+        return False
+
+    if len(folded) >= replaced:
+        return False
+
+    out[-replaced:] = folded
+    return True
+
+
+def constant_folding(function: Function) -> int:
+    """Evaluates arithmetic and branches on constants"""
+    changes = 0
+
+    for block in function.blocks:
+        out = []
+        for command in block.commands:
+            out.append(command)
+            while out and fold_tail(out):
+                changes += 1
+        block.commands = out
+
+    return changes
+
+
+def reads_temp(command: VMCommand, ind: int) -> bool:
+    return command.kind == CommandType.C_PUSH and \
+        command.arg1 == "temp" and command.arg2 == ind
+
+
+def dead_push_pop(function: Function) -> int:
+    """
+    Removes pops straight back to the location just pushed, and push/pop
+    temp pairs whose value is overwritten later in the block before being
+    read
+    """
+    changes = 0
+
+    for block in function.blocks:
+        out = []
+        for command in block.commands:
+            if command.kind == CommandType.C_POP and out and \
+               out[-1].kind == CommandType.C_PUSH and \
+               out[-1].arg1 != "constant" and \
+               (out[-1].arg1, out[-1].arg2) == (command.arg1, command.arg2):
+                out.pop()
+                changes += 1
+                continue
+            out.append(command)
+
+        ind = 1
+        while ind < len(out):
+            command = out[ind]
+            if command.kind == CommandType.C_POP and \
+               command.arg1 == "temp" and \
+               out[ind - 1].kind == CommandType.C_PUSH and \
+               temp_overwritten(out, ind + 1, command.arg2):
+                del out[ind - 1:ind + 1]
+                changes += 1
+                continue
+            ind += 1
+
+        block.commands = out
+
+    return changes
+
+
+def temp_overwritten(commands: List[VMCommand], start: int, ind: int) -> bool:
+    """True if temp ind is popped to from start on before any read of it"""
+    for command in commands[start:]:
+        if reads_temp(command, ind) or \
+           command.kind in (CommandType.C_CALL, CommandType.C_RETURN):
+            return False
+        if command.kind == CommandType.C_POP and command.arg1 == "temp" and \
+           command.arg2 == ind:
+            return True
+    return False
+
+
+def block_index(function: Function) -> Optional[Dict[str, int]]:
+    """
+    Returns {label: block index}, or None if the function jumps to a label
+    it doesn't define
+    """
+    labels = {block.label: ind for ind, block in enumerate(function.blocks)
+              if block.label is not None}
+
+    for block in function.blocks:
+        terminator = block.terminator
+        if terminator is not None and terminator.arg1 is not None and \
+           terminator.arg1 not in labels:
+            return None
+
+    return labels
+
+
+def jump_threading(function: Function) -> int:
+    """
+    Retargets jumps to blocks that only jump on, and drops gotos to the
+    block that follows anyway
+    """
+    labels = block_index(function)
+    if labels is None:
+        return 0
+
+    forward = {}
+    for block in function.blocks:
+        if block.label is not None and len(block.commands) == 1 and \
+           block.commands[0].kind == CommandType.C_GOTO:
+            forward[block.label] = block.commands[0].arg1
+
+    def final_target(label: str) -> str:
+        seen = {label}
+        while label in forward and forward[label] not in seen:
+            label = forward[label]
+            seen.add(label)
+        return label
+
+    changes = 0
+
+    for ind, block in enumerate(function.blocks):
+        terminator = block.terminator
+        if terminator is None or terminator.kind == CommandType.C_RETURN:
+            continue
+
+        target = final_target(terminator.arg1)
+        if target != terminator.arg1:
+            block.commands[-1] = VMCommand(terminator.kind, target)
+            changes += 1
+
+        following = function.blocks[ind + 1] \
+            if ind + 1 < len(function.blocks) else None
+        if terminator.kind == CommandType.C_GOTO and following is not None \
+           and following.label == target:
+            block.commands.pop()
+            changes += 1
+
+    return changes
+
+
+def unreachable_blocks(function: Function) -> int:
+    """Removes blocks no path from the function's entry reaches"""
+    labels = block_index(function)
+    if labels is None:
+        return 0
+
+    reachable = set()
+    pending = [0]
+
+    while pending:
+        ind = pending.pop()
+        if ind in reachable or ind >= len(function.blocks):
+            continue
+        reachable.add(ind)
+
+        block = function.blocks[ind]
+        terminator = block.terminator
+        if terminator is not None and \
+           terminator.kind != CommandType.C_RETURN:
+            pending.append(labels[terminator.arg1])
+        if block.falls_through:
+            pending.append(ind + 1)
+
+    removed = len(function.blocks) - len(reachable)
+    function.blocks = [block for ind, block in enumerate(function.blocks)
+                       if ind in reachable]
+
+    return removed
+
+
+def call_graph(program: Program) -> Dict[Optional[str], Set[str]]:
+    """
+    Returns {function: functions it calls}. Code outside any function is
+    under None.
+    """
+    graph = {}
+    for function in program.functions:
+        calls = graph.setdefault(function.name, set())
+        for block in function.blocks:
+            calls.update(command.arg1 for command in block.commands
+                         if command.kind == CommandType.C_CALL)
+    return graph
+
+
+def remove_dead_functions(program: Program,
+                          entry: str = "Sys.init") -> List[Function]:
+    """
+    Removes the functions no chain of calls from entry (or from code outside
+    any function) reaches, and returns them. Nothing is removed if the
+    program doesn't define entry.
+    """
+    graph = call_graph(program)
+    if entry not in graph:
+        return []
+
+    reachable = set()
+    pending = [None, entry]
+    while pending:
+        name = pending.pop()
+        if name in reachable:
+            continue
+        reachable.add(name)
+        pending.extend(graph.get(name, ()))
+
+    dead = [function for function in program.functions
+            if function.name not in reachable]
+    program.functions = [function for function in program.functions
+                         if function.name in reachable]
+    return dead
+
+
+def stack_effect(command: VMCommand) -> int:
+    if command.kind == CommandType.C_PUSH:
+        return 1
+    if command.kind in (CommandType.C_POP, CommandType.C_IF):
+        return -1
+    if command.kind == CommandType.C_ARITHMETIC and \
+       command.arg1 in BINARY_OPS:
+        return -1
+    return 0
+
+
+def returns_one_value(function: Function) -> bool:
+    """
+    True if the function's code never pops below its own frame and leaves
+    exactly its return value on the stack at every return, so returning can
+    be replaced by jumping past its code
+    """
+    depths = {}
+    depth = 0
+
+    for command in list(function.commands())[1:]:
+        if command.kind == CommandType.C_LABEL:
+            known = depths.setdefault(command.arg1, depth)
+            if depth is None:
+                depth = known
+            if depth is None or known != depth:
+                return False
+            continue
+
+        if depth is None:
+            # code no jump reaches
+            continue
+
+        depth += stack_effect(command)
+        if depth < 0:
+            return False
+
+        if command.kind in (CommandType.C_GOTO, CommandType.C_IF):
+            if depths.setdefault(command.arg1, depth) != depth:
+                return False
+        if command.kind == CommandType.C_RETURN and depth != 1:
+            return False
+        if command.kind in (CommandType.C_GOTO, CommandType.C_RETURN):
+            depth = None
+
+    return depth is None
+
+
+def inlinable(callee: Function, max_size: int) -> bool:
+    """True for functions small enough to inline that call nothing"""
+    if callee.header is None or len(callee) > max_size:
+        return False
+
+    if any(command.kind == CommandType.C_CALL
+           for command in callee.commands()):
+        return False
+
+    return returns_one_value(callee)
+
+
+POINTER_SEGMENTS = ("this", "that")
+
+
+def pointers_set(function: Function) -> Set[int]:
+    return {command.arg2 for command in function.commands()
+            if command.kind == CommandType.C_POP and
+            command.arg1 == "pointer"}
+
+
+def pointers_kept(function: Function) -> Set[int]:
+    """
+    Returns the pointers (0 for THIS, 1 for THAT) the function may use
+    after a call with the value they had before it. The others are always
+    set in the same block before being used, like Jack code does with THAT.
+    """
+    kept = set()
+    for block in function.blocks:
+        fresh = set()
+        for command in block.commands:
+            if command.kind == CommandType.C_CALL:
+                fresh = set()
+            elif command.kind == CommandType.C_POP and \
+                    command.arg1 == "pointer":
+                fresh.add(command.arg2)
+            elif command.kind in (CommandType.C_PUSH, CommandType.C_POP):
+                if command.arg1 == "pointer":
+                    pointer = command.arg2
+                elif command.arg1 in POINTER_SEGMENTS:
+                    pointer = POINTER_SEGMENTS.index(command.arg1)
+                else:
+                    continue
+                if pointer not in fresh:
+                    kept.add(pointer)
+    return kept
+
+
+def inline_body(callee: Function, n_args: int, base: int, prefix: str,
+                pointers: List[int]) -> Optional[Tuple[List[VMCommand],
+                                                       int]]:
+    """
+    Returns the commands replacing 'call callee n_args' and the number of
+    the caller's locals they use from base on. Those hold the arguments,
+    popped off the stack, then the callee's zeroed locals, then the
+    caller's pointers that need saving, restored after the body. Each
+    return jumps past the body. None if the callee reads arguments the call
+    doesn't pass.
+    """
+    n_locals = callee.header.arg2
+    body = list(callee.commands())[1:]
+
+    def local(ind: int) -> int:
+        return base + ind
+
+    out = [VMCommand(CommandType.C_POP, "local", local(ind))
+           for ind in reversed(range(n_args))]
+    for ind in range(n_locals):
+        out.append(VMCommand(CommandType.C_PUSH, "constant", 0))
+        out.append(VMCommand(CommandType.C_POP, "local",
+                             local(n_args + ind)))
+    saved = {pointer: local(n_args + n_locals + ind)
+             for ind, pointer in enumerate(pointers)}
+    for pointer, slot in saved.items():
+        out.append(VMCommand(CommandType.C_PUSH, "pointer", pointer))
+        out.append(VMCommand(CommandType.C_POP, "local", slot))
+
+    end = f"{prefix}.end"
+    for ind, command in enumerate(body):
+        if command.kind in (CommandType.C_PUSH, CommandType.C_POP) and \
+           command.arg1 == "argument":
+            if command.arg2 >= n_args:
+                return None
+            command = VMCommand(command.kind, "local", local(command.arg2))
+        elif command.kind in (CommandType.C_PUSH, CommandType.C_POP) and \
+                command.arg1 == "local":
+            command = VMCommand(command.kind, "local",
+                                local(n_args + command.arg2))
+        elif command.kind in (CommandType.C_LABEL, CommandType.C_GOTO,
+                              CommandType.C_IF):
+            command = VMCommand(command.kind, f"{prefix}.{command.arg1}")
+        elif command.kind == CommandType.C_RETURN:
+            if ind == len(body) - 1:
+                continue
+            command = VMCommand(CommandType.C_GOTO, end)
+        out.append(command)
+
+    out.append(VMCommand(CommandType.C_LABEL, end))
+    for pointer, slot in saved.items():
+        out.append(VMCommand(CommandType.C_PUSH, "local", slot))
+        out.append(VMCommand(CommandType.C_POP, "pointer", pointer))
+    return out, n_args + n_locals + len(saved)
+
+
+def inline_functions(program: Program, max_size: int = INLINE_SIZE,
+                     max_growth: int = INLINE_GROWTH) -> Tuple[Dict[str, int],
+                                                               int]:
+    """
+    Replaces calls to small leaf functions (see inlinable) by their code,
+    smallest functions first, for as long as the program grows by at most
+    max_growth VM commands. Calls from code outside any function and
+    functions using their file's statics from another file are left alone.
+    Returns ({function: call sites inlined}, VM commands added).
+    """
+    functions = [function for function in program.functions
+                 if function.header is not None]
+    callees = sorted((function for function in functions
+                      if inlinable(function, max_size)), key=len)
+    callees = OrderedDict((function.name, function) for function in callees)
+
+    # the callee's arguments and locals go in the caller's locals past its
+    # own, shared by all the call sites inlined into it
+    own_locals = {function.name: function.header.arg2
+                  for function in functions}
+
+    sites = OrderedDict((name, 0) for name in callees)
+    growth = 0
+    for name, callee in callees.items():
+        uses_static = any(command.arg1 == "static"
+                          for command in callee.commands()
+                          if command.kind in (CommandType.C_PUSH,
+                                              CommandType.C_POP))
+
+        for ind, caller in enumerate(program.functions):
+            if caller.header is None or caller.name == name or \
+               (uses_static and caller.file_name != callee.file_name):
+                continue
+
+            # the pointers the caller expects the call to leave alone
+            pointers = sorted(pointers_set(callee) & pointers_kept(caller))
+
+            base = own_locals[caller.name]
+            n_locals = caller.header.arg2
+            inlined = False
+            commands = []
+            for command in list(caller.commands())[1:]:
+                if command.kind != CommandType.C_CALL or \
+                   command.arg1 != name:
+                    commands.append(command)
+                    continue
+
+                inlined_code = inline_body(callee, command.arg2, base,
+                                           f"{name}$inline.{sites[name]}",
+                                           pointers)
+                if inlined_code is None:
+                    commands.append(command)
+                    continue
+
+                body, slots = inlined_code
+                needed = base + slots
+                # each extra local is zeroed on every call of the caller
+                cost = len(body) - 1 + max(0, needed - n_locals)
+                if growth + cost > max_growth:
+                    commands.append(command)
+                    continue
+
+                commands.extend(body)
+                growth += cost
+                sites[name] += 1
+                n_locals = max(n_locals, needed)
+                inlined = True
+
+            if not inlined:
+                continue
+
+            function = Function(caller.file_name,
+                                VMCommand(CommandType.C_FUNCTION,
+                                          caller.name, n_locals))
+            for command in commands:
+                function.append(command)
+            program.functions[ind] = function
+
+    return OrderedDict((name, count) for name, count in sites.items()
+                       if count), growth
+
+
+PASSES = OrderedDict([("constant-folding", constant_folding),
+                      ("dead-push-pop", dead_push_pop),
+                      ("jump-threading", jump_threading),
+                      ("unreachable-blocks", unreachable_blocks)])
+
+
+class PassManager(object):
+    """Runs the enabled passes over a Program until none changes anything"""
+
+    def __init__(self, enabled: Optional[List[str]] = None):
+        if enabled is None:
+            enabled = list(PASSES)
+
+        for name in enabled:
+            if name not in PASSES:
+                raise Exception(f"Error: no pass named '{name}'.")
+
+        # run in pipeline order whatever order they were given in
+        self.enabled = [name for name in PASSES if name in enabled]
+        self.changes = OrderedDict((name, 0) for name in self.enabled)
+        self.seconds = OrderedDict((name, 0.0) for name in self.enabled)
+        self.commands_before = 0
+        self.commands_after = 0
+        self.rounds = 0
+
+    def run(self, program: Program):
+        self.commands_before = len(program)
+
+        for _ in range(MAX_ROUNDS):
+            self.rounds += 1
+            changed = 0
+
+            for name in self.enabled:
+                start = time.perf_counter()
+                changes = sum(PASSES[name](function)
+                              for function in program.functions)
+                self.seconds[name] += time.perf_counter() - start
+                self.changes[name] += changes
+                changed += changes
+
+            if not changed:
+                break
+
+        self.commands_after = len(program)
+        return
+
+    def report(self) -> str:
+        """Returns one line per pass with its changes and time taken"""
+        lines = [f"{name:<20}{self.changes[name]:>8} changes "
+                 f"{self.seconds[name] * 1000:>8.2f} ms"
+                 for name in self.enabled]
+        lines.append(f"{'VM commands':<20}{self.commands_before:>8} -> "
+                     f"{self.commands_after} in {self.rounds} rounds")
+        return "\n".join(lines)
@@ -0,0 +1,418 @@
+import unittest
+
+from command_types import CommandType
+from vm_ir import KEYWORDS, Function, Program, VMCommand
+from vm_passes import INLINE_SIZE, PassManager, constant_folding, \
+    dead_push_pop, inline_functions, jump_threading, unreachable_blocks
+
+KINDS = {keyword: kind for kind, keyword in KEYWORDS.items()}
+
+
+def vm_command(line):
+    """Returns the VMCommand of a line of VM code"""
+    words = line.split()
+    kind = KINDS.get(words[0], CommandType.C_ARITHMETIC)
+    if kind == CommandType.C_ARITHMETIC:
+        return VMCommand(kind, words[0])
+
+    arg1 = words[1] if len(words) > 1 else None
+    arg2 = int(words[2]) if len(words) > 2 else None
+    return VMCommand(kind, arg1, arg2)
+
+
+def function(lines):
+    """Returns a Function of the VM lines, the first being its header"""
+    commands = [vm_command(line) for line in lines]
+    result = Function("Test.vm", commands[0])
+    for command in commands[1:]:
+        result.append(command)
+    return result
+
+
+def program(lines):
+    """Returns a Program of the VM lines, a function at each header"""
+    result = Program()
+    for command in map(vm_command, lines):
+        if command.kind == CommandType.C_FUNCTION:
+            result.functions.append(Function("Test.vm", command))
+        else:
+            result.functions[-1].append(command)
+    return result
+
+
+def texts(result):
+    return [command.text for command in result.commands()]
+
+
+class TestConstantFolding(unittest.TestCase):
+
+    def fold(self, lines):
+        result = function(["function Test.f 1"] + lines)
+        changes = constant_folding(result)
+        return texts(result)[1:], changes
+
+    def test_binary(self):
+        self.assertEqual(self.fold(["push constant 2",
+                                    "push constant 3",
+                                    "add",
+                                    "push constant 4",
+                                    "and"]),
+                         (["push constant 4"], 2))
+
+    def test_wraps_to_16_bits(self):
+        # 2 - 3 is -1, which can only be pushed as 'push constant 0, not'
+        self.assertEqual(self.fold(["push constant 2",
+                                    "push constant 3",
+                                    "sub"]),
+                         (["push constant 0", "not"], 1))
+        self.assertEqual(self.fold(["push constant 32767",
+                                    "push constant 1",
+                                    "add",
+                                    "neg"]),
+                         (["push constant 32767", "not"], 2))
+
+    def test_comparisons(self):
+        self.assertEqual(self.fold(["push constant 1",
+                                    "push constant 2",
+                                    "gt"]),
+                         (["push constant 0"], 1))
+        self.assertEqual(self.fold(["push constant 1",
+                                    "push constant 2",
+                                    "lt"]),
+                         (["push constant 0", "not"], 1))
+        self.assertEqual(self.fold(["push constant 7",
+                                    "push constant 7",
+                                    "eq",
+                                    "not"]),
+                         (["push constant 0"], 2))
+
+    def test_branches(self):
+        self.assertEqual(self.fold(["push constant 1",
+                                    "if-goto A",
+                                    "push constant 0",
+                                    "if-goto B",
+                                    "label A",
+                                    "label B"]),
+                         (["goto A", "label A", "label B"], 2))
+
+    def test_not_constant(self):
+        lines = ["push local 0",
+                 "push constant 1",
+                 "add",
+                 "push constant 1",
+                 "neg",
+                 "pop local 0"]
+        self.assertEqual(self.fold(lines), (lines, 0))
+
+    def test_not_across_labels(self):
+        # the constant isn't on the stack when jumping to LOOP
+        lines = ["push constant 1",
+                 "label LOOP",
+                 "push constant 2",
+                 "add",
+                 "goto LOOP"]
+        self.assertEqual(self.fold(lines), (lines, 0))
+
+    def test_not_across_jumps(self):
+        lines = ["push constant 1",
+                 "push local 0",
+                 "if-goto END",
+                 "push constant 2",
+                 "add",
+                 "label END",
+                 "return"]
+        self.assertEqual(self.fold(lines), (lines, 0))
+
+    def test_not_longer(self):
+        # folding to 'push constant 0, not' would save nothing
+        lines = ["push constant 0",
+                 "not"]
+        self.assertEqual(self.fold(lines), (lines, 0))
+
+
+class TestDeadPushPop(unittest.TestCase):
+
+    def remove(self, lines):
+        result = function(["function Test.f 3"] + lines)
+        changes = dead_push_pop(result)
+        return texts(result)[1:], changes
+
+    def test_pop_to_same_location(self):
+        self.assertEqual(self.remove(["push local 0",
+                                      "pop local 0",
+                                      "push static 1",
+                                      "pop static 1"]),
+                         ([], 2))
+
+    def test_pop_to_other_location(self):
+        lines = ["push local 0",
+                 "pop local 1",
+                 "push constant 0",
+                 "pop local 0"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+    def test_overwritten_temp(self):
+        self.assertEqual(self.remove(["push local 1",
+                                      "pop temp 0",
+                                      "push local 2",
+                                      "pop temp 0"]),
+                         (["push local 2", "pop temp 0"], 1))
+
+    def test_temp_read(self):
+        lines = ["push local 1",
+                 "pop temp 0",
+                 "push temp 0",
+                 "pop local 2",
+                 "push constant 3",
+                 "pop temp 0"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+    def test_temp_across_call(self):
+        # the callee may read the temp segment
+        lines = ["push local 1",
+                 "pop temp 0",
+                 "call Test.g 0",
+                 "pop temp 0"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+    def test_temp_across_labels(self):
+        lines = ["push local 1",
+                 "pop temp 0",
+                 "label L",
+                 "push local 2",
+                 "pop temp 0"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+
+class TestJumpThreading(unittest.TestCase):
+
+    def thread(self, lines):
+        result = function(["function Test.f 0"] + lines)
+        changes = jump_threading(result)
+        return texts(result)[1:], changes
+
+    def test_forwarding_block(self):
+        self.assertEqual(self.thread(["push local 0",
+                                      "if-goto A",
+                                      "goto C",
+                                      "label A",
+                                      "goto B",
+                                      "label B",
+                                      "goto C",
+                                      "label C",
+                                      "return"]),
+                         (["push local 0",
+                           "if-goto C",
+                           "goto C",
+                           "label A",
+                           "goto C",
+                           "label B",
+                           "label C",
+                           "return"], 3))
+
+    def test_goto_next_block(self):
+        self.assertEqual(self.thread(["goto A",
+                                      "label A",
+                                      "return"]),
+                         (["label A", "return"], 1))
+
+    def test_cycle(self):
+        # following the gotos stops at the first label seen again
+        self.assertEqual(self.thread(["label A",
+                                      "goto B",
+                                      "label B",
+                                      "goto A"])[0],
+                         ["label A", "goto A", "label B", "goto B"])
+
+    def test_undefined_label(self):
+        lines = ["goto A",
+                 "label A",
+                 "goto ELSEWHERE"]
+        self.assertEqual(self.thread(lines), (lines, 0))
+
+
+class TestUnreachableBlocks(unittest.TestCase):
+
+    def remove(self, lines):
+        result = function(["function Test.f 1"] + lines)
+        changes = unreachable_blocks(result)
+        return texts(result)[1:], changes
+
+    def test_after_goto(self):
+        self.assertEqual(self.remove(["goto END",
+                                      "push constant 1",
+                                      "pop local 0",
+                                      "label DEAD",
+                                      "push constant 2",
+                                      "pop local 0",
+                                      "label END",
+                                      "push local 0",
+                                      "return"]),
+                         (["goto END",
+                           "label END",
+                           "push local 0",
+                           "return"], 2))
+
+    def test_jump_targets(self):
+        lines = ["push local 0",
+                 "if-goto ELSE",
+                 "push constant 1",
+                 "return",
+                 "label ELSE",
+                 "goto LOOP",
+                 "label LOOP",
+                 "goto LOOP"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+    def test_undefined_label(self):
+        lines = ["goto ELSEWHERE",
+                 "label DEAD",
+                 "return"]
+        self.assertEqual(self.remove(lines), (lines, 0))
+
+
+class TestPassManager(unittest.TestCase):
+
+    def test_fixpoint(self):
+        # folding the branch makes DEAD unreachable, which leaves the goto
+        # jumping to the next block
+        program = Program()
+        program.functions.append(function(["function Test.f 0",
+                                           "push constant 1",
+                                           "push constant 1",
+                                           "eq",
+                                           "if-goto END",
+                                           "label DEAD",
+                                           "push constant 1",
+                                           "return",
+                                           "label END",
+                                           "push constant 0",
+                                           "return"]))
+        manager = PassManager()
+        manager.run(program)
+
+        self.assertEqual(texts(program.functions[0]),
+                         ["function Test.f 0",
+                          "label END",
+                          "push constant 0",
+                          "return"])
+        self.assertEqual(manager.commands_before, 11)
+        self.assertEqual(manager.commands_after, 4)
+        self.assertEqual(manager.changes["unreachable-blocks"], 1)
+
+    def test_enabled(self):
+        manager = PassManager(["unreachable-blocks", "constant-folding"])
+        self.assertEqual(manager.enabled,
+                         ["constant-folding", "unreachable-blocks"])
+
+        with self.assertRaises(Exception):
+            PassManager(["no-such-pass"])
+
+
+ABS = ["function Test.abs 0",
+       "push argument 0",
+       "push constant 0",
+       "lt",
+       "if-goto NEG",
+       "push argument 0",
+       "return",
+       "label NEG",
+       "push argument 0",
+       "neg",
+       "return"]
+
+
+class TestInlineFunctions(unittest.TestCase):
+
+    def test_labels_per_call_site(self):
+        inlined = program(ABS + ["function Test.main 0",
+                                 "push constant 3",
+                                 "call Test.abs 1",
+                                 "push constant 5",
+                                 "neg",
+                                 "call Test.abs 1",
+                                 "add",
+                                 "return"])
+        sites, _ = inline_functions(inlined)
+
+        self.assertEqual(dict(sites), {"Test.abs": 2})
+        self.assertEqual(texts(inlined.functions[1]),
+                         ["function Test.main 1",
+                          "push constant 3",
+                          "pop local 0",
+                          "push local 0",
+                          "push constant 0",
+                          "lt",
+                          "if-goto Test.abs$inline.0.NEG",
+                          "push local 0",
+                          "goto Test.abs$inline.0.end",
+                          "label Test.abs$inline.0.NEG",
+                          "push local 0",
+                          "neg",
+                          "label Test.abs$inline.0.end",
+                          "push constant 5",
+                          "neg",
+                          "pop local 0",
+                          "push local 0",
+                          "push constant 0",
+                          "lt",
+                          "if-goto Test.abs$inline.1.NEG",
+                          "push local 0",
+                          "goto Test.abs$inline.1.end",
+                          "label Test.abs$inline.1.NEG",
+                          "push local 0",
+                          "neg",
+                          "label Test.abs$inline.1.end",
+                          "add",
+                          "return"])
+
+        labels = [command.arg1
+                  for command in inlined.functions[1].commands()
+                  if command.kind == CommandType.C_LABEL]
+        self.assertEqual(len(set(labels)), len(labels))
+
+    def test_recursive(self):
+        lines = ["function Test.fact 0",
+                 "push argument 0",
+                 "if-goto REC",
+                 "push constant 1",
+                 "return",
+                 "label REC",
+                 "push argument 0",
+                 "push argument 0",
+                 "push constant 1",
+                 "sub",
+                 "call Test.fact 1",
+                 "call Math.multiply 2",
+                 "return",
+                 "function Test.main 0",
+                 "push constant 5",
+                 "call Test.fact 1",
+                 "return"]
+        inlined = program(lines)
+
+        self.assertEqual(inline_functions(inlined), ({}, 0))
+        self.assertEqual(texts(inlined.functions[0]) +
+                         texts(inlined.functions[1]), lines)
+
+    def test_size_threshold(self):
+        callee = ["function Test.sum 0"] + \
+            ["push argument 0"] * INLINE_SIZE + \
+            ["add"] * (INLINE_SIZE - 1) + \
+            ["return"]
+        lines = callee + ["function Test.main 0",
+                          "push constant 1",
+                          "call Test.sum 1",
+                          "return"]
+        inlined = program(lines)
+
+        self.assertEqual(inline_functions(inlined), ({}, 0))
+        self.assertEqual(texts(inlined.functions[1]), lines[len(callee):])
+
+        inlined = program(lines)
+        sites, _ = inline_functions(inlined, max_size=len(callee))
+        self.assertEqual(dict(sites), {"Test.sum": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
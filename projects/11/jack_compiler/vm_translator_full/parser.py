@@ -1,5 +1,53 @@
 from command_types import CommandType
 
+COMMAND_TYPES = {"push": CommandType.C_PUSH,
+                 "pop": CommandType.C_POP,
+                 "add": CommandType.C_ARITHMETIC,
+                 "sub": CommandType.C_ARITHMETIC,
+                 "neg": CommandType.C_ARITHMETIC,
+                 "eq": CommandType.C_ARITHMETIC,
+                 "gt": CommandType.C_ARITHMETIC,
+                 "lt": CommandType.C_ARITHMETIC,
+                 "and": CommandType.C_ARITHMETIC,
+                 "or": CommandType.C_ARITHMETIC,
+                 "not": CommandType.C_ARITHMETIC,
+                 "label": CommandType.C_LABEL,
+                 "goto": CommandType.C_GOTO,
+                 "if-goto": CommandType.C_IF,
+                 "function": CommandType.C_FUNCTION,
+                 "call": CommandType.C_CALL,
+                 "return": CommandType.C_RETURN}
+
+# Commands with an int second argument
+DOUBLE_ARG = (CommandType.C_PUSH,
+              CommandType.C_POP,
+              CommandType.C_FUNCTION,
+              CommandType.C_CALL)
+
+
+class Command(object):
+    """
+    A parsed VM command. arg1 is the command itself for C_ARITHMETIC and
+    None for C_RETURN, arg2 is None unless the command is in DOUBLE_ARG.
+    line_number is the 1-based line of the command in the source file.
+    """
+    __slots__ = ("command_type", "arg1", "arg2", "line_number", "text")
+
+    def __init__(self, command_type: CommandType, arg1: str, arg2: int,
+                 line_number: int, text: str):
+        set_slot = super().__setattr__
+        set_slot("command_type", command_type)
+        set_slot("arg1", arg1)
+        set_slot("arg2", arg2)
+        set_slot("line_number", line_number)
+        set_slot("text", text)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Command is immutable")
+
+    def __repr__(self):
+        return f"Command({self.command_type}, {self.arg1!r}, {self.arg2!r})"
+
 
 class Parser(object):
     """
@@ -9,77 +57,80 @@ class Parser(object):
     """
 
     def __init__(self, infile):
-        self.__command_stream = open(infile, "r")
-        self.__current_command: CommandType = None
+        """
+        infile is the path of a .vm file, or any iterable of source lines
+        """
+        self.__owns_stream = isinstance(infile, str)
+        self.__command_stream = open(infile, "r") if self.__owns_stream \
+            else infile
+        self.__current_record: Command = None
+        self.__records = self.commands()
+        self.__lookahead: Command = None
 
         return
 
     def __del__(self):
-        self.__command_stream.close()
+        if self.__owns_stream and hasattr(self, "_Parser__command_stream"):
+            self.__command_stream.close()
 
-    @property
-    def has_more_commands(self) -> bool:
-        file_curr_line = self.__command_stream.tell()
+    def commands(self):
+        """
+        Generator yielding a Command for every command left in the file. The
+        file is read once and each line is split and classified as it is
+        read.
+        """
+        for line_number, line in enumerate(self.__command_stream, 1):
+            comment_ind = line.find("//")
+            if comment_ind >= 0:
+                line = line[:comment_ind]
 
-        while True:
+            args = line.split()
+            if not args:
+                continue
 
-            peek_next = self.__command_stream.readline()
+            cmd_type = COMMAND_TYPES.get(args[0])
+            if cmd_type is None:
+                raise Exception(f"Line {line_number}: Error: No command type "
+                                f"for '{args[0]}'")
+
+            if cmd_type == CommandType.C_RETURN:
+                arg1 = None
+            elif cmd_type == CommandType.C_ARITHMETIC:
+                arg1 = args[0]
+            elif len(args) < 2:
+                raise Exception(f"Line {line_number}: Error: no argument "
+                                f"found for {args}")
+            else:
+                arg1 = args[1]
 
-            if peek_next == "":
-                self.__command_stream.seek(file_curr_line)
-                return False
+            arg2 = None
+            if cmd_type in DOUBLE_ARG:
+                if len(args) < 3:
+                    raise Exception(f"Line {line_number}: Error: no argument "
+                                    f"found for {args}")
+                arg2 = int(args[2])
 
-            peek_next = self.__remove_comments(peek_next)
+            yield Command(cmd_type, arg1, arg2, line_number, " ".join(args))
 
-            if peek_next.isspace() or peek_next == "":
-                continue
-            else:
-                self.__command_stream.seek(file_curr_line)
-                return True
+    # The properties and methods below keep the original advance() /
+    # has_more_commands interface working on top of commands().
+
+    @property
+    def has_more_commands(self) -> bool:
+        if self.__lookahead is None:
+            self.__lookahead = next(self.__records, None)
+
+        return self.__lookahead is not None
 
     @property
     def curr_command(self):
-        return self.__current_command
+        if self.__current_record is None:
+            return None
+        return self.__current_record.text
 
     @property
     def command_type(self) -> CommandType:
-        mapping = {"push": CommandType.C_PUSH,
-                   "pop": CommandType.C_POP,
-                   "add": CommandType.C_ARITHMETIC,
-                   "sub": CommandType.C_ARITHMETIC,
-                   "neg": CommandType.C_ARITHMETIC,
-                   "eq": CommandType.C_ARITHMETIC,
-                   "gt": CommandType.C_ARITHMETIC,
-                   "lt": CommandType.C_ARITHMETIC,
-                   "and": CommandType.C_ARITHMETIC,
-                   "or": CommandType.C_ARITHMETIC,
-                   "not": CommandType.C_ARITHMETIC,
-                   "label": CommandType.C_LABEL,
-                   "goto": CommandType.C_GOTO,
-                   "if-goto": CommandType.C_IF,
-                   "function": CommandType.C_FUNCTION,
-                   "call": CommandType.C_CALL,
-                   "return": CommandType.C_RETURN}
-
-        cmd = self.__current_command.split()[0]
-        cmd_type = mapping.get(cmd)
-
-        if cmd_type is None:
-            raise Exception(f"Error: No command type for '{cmd}'")
-
-        return cmd_type
-
-    def __remove_comments(self, cmd):
-        """
-        Takes an input string and returns the same string but without the
-        comments (substring starting with '//')
-        """
-        temp_cmd = cmd
-        for i in range(len(cmd) - 1):
-            if temp_cmd[i] == "/" and temp_cmd[i + 1] == "/":
-                temp_cmd = temp_cmd[:i]
-                break
-        return temp_cmd
+        return self.__current_record.command_type
 
     def advance(self) -> bool:
         """
@@ -89,14 +140,8 @@ class Parser(object):
         if not self.has_more_commands:
             return False
 
-        while True:
-            curr_line = self.__command_stream.readline()
-            curr_line = self.__remove_comments(curr_line)
-
-            if not curr_line.isspace() and len(curr_line) > 0:
-                break
-
-        self.__current_command = curr_line.strip("\t\n ")
+        self.__current_record = self.__lookahead
+        self.__lookahead = None
         return True
 
     def arg1(self) -> str:
@@ -105,41 +150,22 @@ class Parser(object):
         should just return the command itself. Should not be called for
         C_RETURN.
         """
-
-        args = self.__current_command.split()
-
         if self.command_type == CommandType.C_RETURN:
             raise Exception("Error: arg1 should not be called for cmd type "
                             f"{self.command_type}")
-        elif self.command_type == CommandType.C_ARITHMETIC:
-            return args[0]
-        else:
-            if len(args) < 2:
-                raise Exception("Error: no argument found for "
-                                f"{self.__current_command.split()}")
-            return args[1]
+
+        return self.__current_record.arg1
 
     def arg2(self) -> int:
         """
         Returns second argument of current command. Should only be called if
-        Current command is one of the tips in valid_cmds
+        Current command is one of the types in DOUBLE_ARG
         """
-
-        valid_cmds = [CommandType.C_PUSH,
-                      CommandType.C_POP,
-                      CommandType.C_FUNCTION,
-                      CommandType.C_CALL]
-
-        args = self.__current_command.split()
-
-        if self.command_type not in valid_cmds:
+        if self.command_type not in DOUBLE_ARG:
             raise Exception("Error: arg2 should not be called for cmd type "
                             f"{self.command_type}")
-        else:
-            if len(args) < 3:
-                raise Exception("Error: no argument found for "
-                                f"{self.__current_command.split()}")
-            return int(args[2])
+
+        return self.__current_record.arg2
 
 
 if __name__ == "__main__":
@@ -30,6 +30,27 @@ segment_map = {"argument": MemorySegType.M_ARGUMENT,
                "temp": MemorySegType.M_TEMP}
 
 
+def write_function(cw: CodeWriter, command):
+    cw.curr_fn = command.arg1
+    cw.write_function(command.arg1, command.arg2)
+    return
+
+
+# CodeWriter call for each command type
+COMMAND_WRITERS = {
+    CommandType.C_ARITHMETIC: lambda cw, c: cw.write_arithmetic(c.arg1),
+    CommandType.C_PUSH: lambda cw, c: cw.write_push_pop(
+        CommandType.C_PUSH, segment_map[c.arg1], c.arg2),
+    CommandType.C_POP: lambda cw, c: cw.write_push_pop(
+        CommandType.C_POP, segment_map[c.arg1], c.arg2),
+    CommandType.C_LABEL: lambda cw, c: cw.write_label(c.arg1),
+    CommandType.C_GOTO: lambda cw, c: cw.write_goto(c.arg1),
+    CommandType.C_IF: lambda cw, c: cw.write_if(c.arg1),
+    CommandType.C_CALL: lambda cw, c: cw.write_call(c.arg1, c.arg2),
+    CommandType.C_FUNCTION: write_function,
+    CommandType.C_RETURN: lambda cw, c: cw.write_return()}
+
+
 if __name__ == "__main__":
 
     if len(sys.argv) != 2:
@@ -52,27 +73,7 @@ if __name__ == "__main__":
     for f in files:
         p = Parser(f)
         cw.file_name = f.split("/")[-1]
-        while p.advance():
-            if p.command_type == CommandType.C_ARITHMETIC:
-                cw.write_arithmetic(p.arg1())
-            elif p.command_type == CommandType.C_PUSH:
-                cw.write_push_pop(CommandType.C_PUSH,
-                                  segment_map[p.arg1()], p.arg2())
-            elif p.command_type == CommandType.C_POP:
-                cw.write_push_pop(CommandType.C_POP,
-                                  segment_map[p.arg1()], p.arg2())
-            elif p.command_type == CommandType.C_LABEL:
-                cw.write_label(p.arg1())
-            elif p.command_type == CommandType.C_GOTO:
-                cw.write_goto(p.arg1())
-            elif p.command_type == CommandType.C_IF:
-                cw.write_if(p.arg1())
-            elif p.command_type == CommandType.C_CALL:
-                cw.write_call(p.arg1(), p.arg2())
-            elif p.command_type == CommandType.C_FUNCTION:
-                cw.curr_fn = p.arg1()
-                cw.write_function(p.arg1(), p.arg2())
-            elif p.command_type == CommandType.C_RETURN:
-                cw.write_return()
+        for command in p.commands():
+            COMMAND_WRITERS[command.command_type](cw, command)
 
     print("Success.")